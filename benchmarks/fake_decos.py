@@ -0,0 +1,302 @@
+"""
+A local stand-in for the Decos Join items api, to benchmark this service without
+the real Decos. It serves the queries made by the taxi and zwaarverkeer clients
+from seeded data, with configurable latency and error rates.
+
+    python benchmarks/fake_decos.py --port 8001 --latency-ms 80 --error-rate 0.01
+
+Point the service to it with DECOS_BASE_URL=http://localhost:8001/decosweb/aspx/api/v1/items/
+"""
+
+import argparse
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Same defaults as in main/settings.py
+ZWAAR_VERKEER_ZAAKNUMMER = "8A02814D73B3421B9C65262A45A43BD8"
+TAXI_BSN_ZAAKNUMMER = "1829F53FD9754B91ADC0B7D16E1519AD"
+TAXI_ZONE_ONTHEFFING_ZAAKNUMMER = "D379EC92DE114A8E92A22FD0E7EFB4E6"
+TAXI_HANDHAVINGSZAKEN_ZAAKNUMMER = "496E3E505C4045BAB5286B56CF2FC89E"
+
+ITEMS_PATH = "/decosweb/aspx/api/v1/items/"
+PERMIT_TYPES = [
+    "Dagontheffing",
+    "Jaarontheffing gewicht en ondeelbaar",
+    "Routeontheffing gewicht en ondeelbaar",
+]
+
+
+def driver_bsn(index: int) -> str:
+    return str(100000000 + index)
+
+
+def ontheffingsnummer(index: int) -> str:
+    return str(1000000 + index)
+
+
+def number_plate(index: int) -> str:
+    return f"BM{index:04d}"
+
+
+def decos_key(prefix: str, index: int) -> str:
+    return f"{prefix}{index:0{32 - len(prefix)}d}"
+
+
+class SeedData:
+    """
+    Deterministic Decos data: taxi drivers with zone permits and enforcement
+    cases, and number plates with zwaarverkeer permits around today.
+    """
+
+    def __init__(
+        self,
+        *,
+        drivers=1000,
+        permits_per_driver=2,
+        handhavingen_per_permit=1,
+        plates=5000,
+        permits_per_plate=3,
+        plates_without_permit=0.5,
+        seed=42,
+    ):
+        rnd = random.Random(seed)
+        today = date.today()
+        self.drivers = {}  # bsn -> driver item
+        self.driver_permits = {}  # driver key -> permit items
+        self.permits = {}  # ontheffingsnummer -> permit items
+        self.handhavingen = {}  # permit key -> handhaving items
+        self.plate_permits = {}  # number plate -> zwaarverkeer permit items
+
+        for i in range(drivers):
+            driver_key = decos_key("D", i)
+            self.drivers[driver_bsn(i)] = {
+                "key": driver_key,
+                "fields": {"num1": float(driver_bsn(i))},
+            }
+            permits = []
+            for j in range(permits_per_driver):
+                permit_key = decos_key(f"P{j}", i)
+                valid_from = today - timedelta(days=rnd.randint(0, 700))
+                permit = {
+                    "key": permit_key,
+                    "fields": {
+                        "sequence": float(ontheffingsnummer(i)),
+                        "date6": f"{valid_from.isoformat()}T00:00:00",
+                        "date7": f"{(valid_from + timedelta(days=1095)).isoformat()}T00:00:00",
+                        "dfunction": "Verleend",
+                        "processed": True,
+                        "text45": "TAXXXI Zone-ontheffing",
+                    },
+                }
+                permits.append(permit)
+                self.handhavingen[permit_key] = [
+                    {
+                        "key": decos_key(f"H{j}{k}", i),
+                        "fields": {
+                            "date6": f"{(today - timedelta(days=30 * k)).isoformat()}T00:00:00",
+                            "date7": f"{(today - timedelta(days=30 * k - 14)).isoformat()}T00:00:00",
+                            "dfunction": "Schorsen",
+                            "parentKey": TAXI_HANDHAVINGSZAKEN_ZAAKNUMMER,
+                            "processed": True,
+                        },
+                    }
+                    for k in range(handhavingen_per_permit)
+                ]
+            self.driver_permits[driver_key] = permits
+            self.permits[ontheffingsnummer(i)] = permits
+
+        for i in range(plates):
+            if rnd.random() < plates_without_permit:
+                continue
+            permits = []
+            for _ in range(permits_per_plate):
+                permit_type = rnd.choice(PERMIT_TYPES)
+                valid_from = today - timedelta(days=rnd.randint(0, 2))
+                duration = 0 if permit_type == "Dagontheffing" else 365
+                permits.append(
+                    {
+                        "fields": {
+                            "text49": number_plate(i),
+                            "text17": permit_type,
+                            "subject1": f"Ontheffing 7,5 ton Binnenstad {number_plate(i)}",
+                            "date6": f"{valid_from.isoformat()}T00:00:00.000",
+                            "date7": f"{(valid_from + timedelta(days=duration)).isoformat()}T00:00:00.000",
+                            "processed": "J",
+                            "dfunction": "Verleend",
+                        }
+                    }
+                )
+            self.plate_permits[number_plate(i)] = permits
+
+
+class Behaviour:
+    """
+    The latency and failures of the fake Decos. Latencies are drawn from a
+    lognormal distribution around the median.
+    """
+
+    def __init__(
+        self, *, latency_ms=50.0, latency_sigma=0.5, error_rate=0.0, slow_rate=0.0
+    ):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self._random = random.Random()
+        self._lock = threading.Lock()
+
+    def next(self):
+        """
+        Returns the latency (in seconds) and status code of the next response
+        """
+        with self._lock:
+            latency = self._random.lognormvariate(0, self.latency_sigma)
+            roll = self._random.random()
+        latency *= self.latency_ms / 1000
+        if roll < self.error_rate:
+            return latency, 503
+        if roll < self.error_rate + self.slow_rate:
+            # Slower than the timeout of the Decos clients
+            return 6.0, 200
+        return latency, 200
+
+
+class DecosHandler(BaseHTTPRequestHandler):
+    data: SeedData
+    behaviour: Behaviour
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        latency, status = self.behaviour.next()
+        time.sleep(latency)
+        if status != 200:
+            return self._respond(status, {"error": "Service unavailable"})
+
+        request = urlparse(self.path)
+        if not request.path.startswith(ITEMS_PATH):
+            return self._respond(404, {"error": "Not found"})
+        try:
+            zaaknummer, folder = request.path[len(ITEMS_PATH) :].strip("/").split("/")
+        except ValueError:
+            return self._respond(404, {"error": "Not found"})
+
+        query = {key: values[0] for key, values in parse_qs(request.query).items()}
+        odata_filter = query.get("oDataQuery.filter") or query.get("filter") or ""
+        items = self._find_items(zaaknummer, folder.upper(), query, odata_filter)
+        self._respond(200, self._page(items, query))
+
+    def _find_items(self, zaaknummer, folder, query, odata_filter):
+        if zaaknummer == TAXI_BSN_ZAAKNUMMER and folder == "TAXXXI":
+            bsn = _filter_value("num1", "eq", odata_filter)
+            driver = self.data.drivers.get(bsn)
+            return [driver] if driver else []
+        if zaaknummer == ZWAAR_VERKEER_ZAAKNUMMER and folder == "FOLDERS":
+            plate = _filter_value("text49", "has", odata_filter)
+            valid_from = _filter_value("date6", "le", odata_filter)
+            valid_until = _filter_value("date7", "ge", odata_filter)
+            if plate is None:
+                # The snapshot query asks for the permits of all plates at once
+                permits = itertools.chain.from_iterable(
+                    self.data.plate_permits.values()
+                )
+            else:
+                permits = self.data.plate_permits.get(plate, [])
+            return [
+                permit
+                for permit in permits
+                if (valid_from is None or permit["fields"]["date6"][:10] <= valid_from)
+                and (
+                    valid_until is None
+                    or permit["fields"]["date7"][:10] >= valid_until[:10]
+                )
+            ]
+        if folder != "FOLDERS":
+            return []
+        if query.get("relTypeKey") == "FOLDERFOLDEREQU":
+            return self.data.handhavingen.get(zaaknummer, [])
+
+        sequence = _filter_value("it_sequence", "eq", odata_filter)
+        if zaaknummer == TAXI_ZONE_ONTHEFFING_ZAAKNUMMER:
+            return self.data.permits.get(sequence, [])[:1]
+        return [
+            permit
+            for permit in self.data.driver_permits.get(zaaknummer, [])
+            if str(int(permit["fields"]["sequence"])) == sequence
+        ]
+
+    def _page(self, items, query):
+        skip = int(query.get("skip", 0))
+        top = int(query.get("top", 100))
+        return {"count": len(items), "content": items[skip : skip + top]}
+
+    def _respond(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _filter_value(field, operator, odata_filter):
+    match = re.search(rf"{field} {operator} '([^']*)'", odata_filter)
+    return match.group(1) if match else None
+
+
+def serve(*, host, port, data, behaviour):
+    handler = type("Handler", (DecosHandler,), {"data": data, "behaviour": behaviour})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--drivers", type=int, default=1000)
+    parser.add_argument("--permits-per-driver", type=int, default=2)
+    parser.add_argument("--handhavingen-per-permit", type=int, default=1)
+    parser.add_argument("--plates", type=int, default=5000)
+    parser.add_argument("--permits-per-plate", type=int, default=3)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--slow-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    data = SeedData(
+        drivers=args.drivers,
+        permits_per_driver=args.permits_per_driver,
+        handhavingen_per_permit=args.handhavingen_per_permit,
+        plates=args.plates,
+        permits_per_plate=args.permits_per_plate,
+        seed=args.seed,
+    )
+    behaviour = Behaviour(
+        latency_ms=args.latency_ms,
+        latency_sigma=args.latency_sigma,
+        error_rate=args.error_rate,
+        slow_rate=args.slow_rate,
+    )
+    server = serve(host=args.host, port=args.port, data=data, behaviour=behaviour)
+    print(f"Fake Decos listening on http://{args.host}:{args.port}{ITEMS_PATH}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+A load test for the Decos backed endpoints. It sends requests for the seeded
+data of the fake Decos (see fake_decos.py) at a fixed concurrency and reports the
+latency percentiles and throughput per endpoint.
+
+    python benchmarks/loadtest.py --base-url http://localhost:8000 --concurrency 1,8,32
+"""
+
+import argparse
+import json
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+from fake_decos import driver_bsn, number_plate, ontheffingsnummer
+
+ENDPOINTS = ["zwaarverkeer", "taxi_ontheffingen", "taxi_ontheffing_details"]
+
+
+class Scenario:
+    """
+    Builds the requests for an endpoint, for random items of the seeded data
+    """
+
+    def __init__(self, *, base_url, auth, drivers, plates):
+        self.base_url = base_url.rstrip("/")
+        self.auth = auth
+        self.drivers = drivers
+        self.plates = plates
+
+    def request(self, session, endpoint, rnd):
+        if endpoint == "zwaarverkeer":
+            return session.post(
+                f"{self.base_url}/zwaarverkeer/get_permits/",
+                json={
+                    "number_plate": number_plate(rnd.randrange(self.plates)),
+                    "passage_at": datetime.now().astimezone().isoformat(),
+                },
+                auth=self.auth,
+            )
+        index = rnd.randrange(self.drivers)
+        if endpoint == "taxi_ontheffingen":
+            return session.post(
+                f"{self.base_url}/taxi/ontheffingen/",
+                json={
+                    "bsn": driver_bsn(index),
+                    "ontheffingsnummer": ontheffingsnummer(index),
+                },
+                auth=self.auth,
+            )
+        return session.get(
+            f"{self.base_url}/taxi/ontheffingen/{ontheffingsnummer(index)}/",
+            auth=self.auth,
+        )
+
+
+def run(scenario, endpoint, *, concurrency, duration, warmup, seed):
+    """
+    Sends requests from `concurrency` threads for `duration` seconds, after
+    `warmup` seconds of which the results are discarded.
+    """
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    started_at = time.perf_counter()
+    measure_from = started_at + warmup
+    stop_at = measure_from + duration
+
+    def worker(worker_id):
+        rnd = random.Random(seed + worker_id)
+        session = requests.Session()
+        while (now := time.perf_counter()) < stop_at:
+            try:
+                status = scenario.request(session, endpoint, rnd).status_code
+            except requests.RequestException:
+                status = "error"
+            latency = time.perf_counter() - now
+            if now >= measure_from:
+                with lock:
+                    latencies.append(latency)
+                    statuses[status] = statuses.get(status, 0) + 1
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, range(concurrency)))
+
+    return summarize(endpoint, concurrency, duration, latencies, statuses)
+
+
+def summarize(endpoint, concurrency, duration, latencies, statuses):
+    result = {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "rps": round(len(latencies) / duration, 1),
+        "statuses": {str(status): count for status, count in statuses.items()},
+    }
+    if len(latencies) > 1:
+        percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+        for name, index in [("p50", 49), ("p95", 94), ("p99", 98)]:
+            result[f"{name}_ms"] = round(percentiles[index] * 1000, 1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--user", default="insecure")
+    parser.add_argument("--password", default="insecure")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS))
+    parser.add_argument("--concurrency", default="1,8,32")
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--warmup", type=float, default=2)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--drivers", type=int, default=1000)
+    parser.add_argument("--plates", type=int, default=5000)
+    parser.add_argument("--output", help="Write the results as json to this file")
+    args = parser.parse_args()
+
+    scenario = Scenario(
+        base_url=args.base_url,
+        auth=(args.user, args.password),
+        drivers=args.drivers,
+        plates=args.plates,
+    )
+    results = []
+    print(
+        f"{'endpoint':<25} {'conc':>5} {'reqs':>7} {'rps':>8} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  statuses"
+    )
+    for endpoint in args.endpoints.split(","):
+        for concurrency in map(int, args.concurrency.split(",")):
+            result = run(
+                scenario,
+                endpoint,
+                concurrency=concurrency,
+                duration=args.duration,
+                warmup=args.warmup,
+                seed=args.seed,
+            )
+            results.append(result)
+            print(
+                f"{endpoint:<25} {concurrency:>5} {result['requests']:>7} "
+                f"{result['rps']:>8} {result.get('p50_ms', '-'):>8} "
+                f"{result.get('p95_ms', '-'):>8} {result.get('p99_ms', '-'):>8}  "
+                f"{result['statuses']}"
+            )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+Micro benchmarks of the permit parsing and interpretation that runs on every
+request, for synthetic Decos payloads of 1 up to 10.000 items.
+
+    python benchmarks/microbench.py --output before.json
+    python benchmarks/microbench.py --compare before.json
+
+The results are written as json, so runs can be compared between commits.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import timeit
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "main.settings")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("CLEOPATRA_BASIC_AUTH_USER", "benchmark")
+os.environ.setdefault("CLEOPATRA_BASIC_AUTH_PASS", "benchmark")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.utils import timezone  # noqa: E402
+
+from main.json_codec import OrjsonCodec, StdlibCodec  # noqa: E402
+from taxi.decos import DecosTaxi  # noqa: E402
+from taxi.responses import OntheffingenResponse  # noqa: E402
+from taxi.serializers import OntheffingenResponseSerializer  # noqa: E402
+from zwaarverkeer.decos import DecosZwaarverkeer  # noqa: E402
+from zwaarverkeer.responses import PermitsResponse  # noqa: E402
+from zwaarverkeer.serializers import PermitsResponseSerializer  # noqa: E402
+
+SIZES = [1, 10, 100, 1000, 10000]
+PERMIT_TYPES = [
+    "Dagontheffing",
+    "Jaarontheffing gewicht en ondeelbaar",
+    "Routeontheffing gewicht en ondeelbaar",
+]
+
+
+def zwaarverkeer_content(size):
+    today = date.today()
+    return [
+        {
+            "fields": {
+                "text49": "AB12CD",
+                "text17": PERMIT_TYPES[i % len(PERMIT_TYPES)],
+                "subject1": f"Ontheffing 7,5 ton Binnenstad {i}",
+                "date6": f"{(today - timedelta(days=i % 3)).isoformat()}T00:00:00.000",
+                "date7": f"{(today + timedelta(days=i % 365)).isoformat()}T00:00:00.000",
+                "processed": "J",
+                "dfunction": "Verleend",
+            }
+        }
+        for i in range(size)
+    ]
+
+
+def taxi_permits(size):
+    today = date.today()
+    return [
+        {
+            "key": f"{i:032d}",
+            "fields": {
+                "sequence": float(1000000 + i),
+                "date6": f"{(today - timedelta(days=i % 700)).isoformat()}T00:00:00",
+                "date7": f"{(today + timedelta(days=i % 365)).isoformat()}T00:00:00",
+            },
+        }
+        for i in range(size)
+    ]
+
+
+def benchmarks():
+    """
+    Yields the name, size and function of each benchmark
+    """
+    zwaarverkeer = DecosZwaarverkeer()
+    taxi = DecosTaxi()
+    passage_at = timezone.make_aware(datetime.now())
+
+    yield "zwaarverkeer._get_date_strings", 1, lambda: zwaarverkeer._get_date_strings(
+        passage_at
+    )
+    yield "zwaarverkeer._get_valid_until", 1, lambda: zwaarverkeer._get_valid_until(
+        permit_type="Dagontheffing", valid_until=passage_at
+    )
+    yield "taxi._parse_datum_vanaf", 1, lambda: taxi._parse_datum_vanaf(
+        "2024-02-01T00:00:00"
+    )
+    yield "taxi._parse_datum_tot", 1, lambda: taxi._parse_datum_tot(
+        "2024-02-01T00:00:00"
+    )
+
+    for size in SIZES:
+        content = zwaarverkeer_content(size)
+        permits = zwaarverkeer._interpret_permits(content, passage_at)
+        response = {
+            "number_plate": "AB12CD",
+            "passage_at": passage_at.isoformat(),
+            "has_permit": len(permits) > 0,
+            "permits": permits,
+        }
+        yield "zwaarverkeer._interpret_permits", size, lambda: (
+            zwaarverkeer._interpret_permits(content, passage_at)
+        )
+        yield "zwaarverkeer.PermitsResponseSerializer", size, lambda: (
+            serialize(PermitsResponseSerializer, response)
+        )
+        yield "zwaarverkeer.PermitsResponse.encode", size, lambda: (
+            PermitsResponse.from_dict(response).encode()
+        )
+
+        decos_json = json.dumps({"count": size, "content": content}).encode()
+        response_data = PermitsResponse.from_dict(response).encode()
+        for codec in (StdlibCodec(), OrjsonCodec()):
+            yield f"json_codec.{codec.name}.loads(decos)", size, lambda: (
+                codec.loads(decos_json)
+            )
+            yield f"json_codec.{codec.name}.dumps(response)", size, lambda: (
+                codec.dumps(response_data)
+            )
+
+        decos_permits = taxi_permits(size)
+        parsed_permits = [
+            {**taxi._parse_permit(permit), "schorsingen": []}
+            for permit in decos_permits
+        ]
+        yield "taxi._parse_permit", size, lambda: [
+            taxi._parse_permit(permit) for permit in decos_permits
+        ]
+        yield "taxi.OntheffingenResponseSerializer", size, lambda: (
+            serialize(OntheffingenResponseSerializer, {"ontheffing": parsed_permits})
+        )
+        yield "taxi.OntheffingenResponse.encode", size, lambda: (
+            OntheffingenResponse.from_dict({"ontheffing": parsed_permits}).encode()
+        )
+
+
+def serialize(serializer_class, data):
+    """
+    The round trip through the response serializers the views used to make
+    """
+    serializer = serializer_class(data=data)
+    serializer.is_valid(raise_exception=True)
+    return serializer.data
+
+
+def measure(func, *, repeat, min_time):
+    """
+    Returns the timings in seconds per call of `repeat` runs, each of at least
+    `min_time` seconds
+    """
+    timer = timeit.Timer(func)
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 2
+    return [t / number for t in timer.repeat(repeat=repeat, number=number)]
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.05)
+    parser.add_argument("--filter", help="Only run benchmarks containing this text")
+    parser.add_argument("--output", help="Write the results as json to this file")
+    parser.add_argument("--compare", help="Compare with the results in this file")
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = {
+                (result["name"], result["size"]): result
+                for result in json.load(f)["results"]
+            }
+
+    results = []
+    print(f"{'benchmark':<42} {'size':>6} {'median':>12} {'per item':>12}  change")
+    for name, size, func in benchmarks():
+        if args.filter and args.filter not in name:
+            continue
+        timings = measure(func, repeat=args.repeat, min_time=args.min_time)
+        result = {
+            "name": name,
+            "size": size,
+            "median_us": statistics.median(timings) * 1e6,
+            "min_us": min(timings) * 1e6,
+            "per_item_us": statistics.median(timings) * 1e6 / size,
+        }
+        results.append(result)
+
+        change = ""
+        if (name, size) in baseline:
+            ratio = result["median_us"] / baseline[(name, size)]["median_us"]
+            change = f"{ratio:.2f}x"
+        print(
+            f"{name:<42} {size:>6} {result['median_us']:>10.1f}us "
+            f"{result['per_item_us']:>10.2f}us  {change}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "revision": git_revision(),
+                    "python": platform.python_version(),
+                    "created_at": datetime.now().isoformat(),
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
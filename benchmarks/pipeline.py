@@ -0,0 +1,181 @@
+"""
+Benchmark of the request pipeline: the time Django, its middleware and DRF spend
+on a request to each endpoint with main.settings and with main.settings_api.
+Decos is stubbed out, so only the overhead of the pipeline is measured. The
+fastest of the runs is reported, as the overhead is small and easily disturbed.
+
+    python benchmarks/pipeline.py
+    python benchmarks/pipeline.py --profiles main.settings,main.settings_api
+
+Every settings profile is measured in its own process, as Django can only be set
+up once per process.
+"""
+
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import timeit
+from base64 import b64encode
+from datetime import date, timedelta
+from unittest import mock
+
+SRC_DIR = os.path.join(os.path.dirname(__file__), "..", "src")
+PROFILES = ["main.settings", "main.settings_api"]
+USER, PASSWORD = "benchmark", "benchmark"
+
+
+def zwaarverkeer_permits():
+    return [
+        {
+            "permit_type": "Jaarontheffing gewicht en ondeelbaar",
+            "permit_description": "Ontheffing 7,5 ton Binnenstad",
+            "valid_from": "2024-01-01T00:00:00+01:00",
+            "valid_until": "2025-01-01T00:00:00+01:00",
+        }
+    ]
+
+
+def taxi_permit():
+    today = date.today()
+    return {
+        "ontheffingsnummer": "1000001",
+        "geldigVanaf": today - timedelta(days=100),
+        "geldigTot": today + timedelta(days=100),
+        "schorsingen": [],
+    }
+
+
+def requests():
+    """
+    Yields the name and the wsgi environ of every benchmarked request
+    """
+    from django.test import RequestFactory
+
+    factory = RequestFactory()
+    credentials = b64encode(f"{USER}:{PASSWORD}".encode()).decode()
+    auth = {"HTTP_AUTHORIZATION": f"Basic {credentials}"}
+
+    yield "status/health", factory.get("/status/health").environ
+    yield "zwaarverkeer/get_permits", factory.post(
+        "/zwaarverkeer/get_permits/",
+        json.dumps({"number_plate": "AB12CD", "passage_at": "2022-10-10T06:30:00"}),
+        content_type="application/json",
+        **auth,
+    ).environ
+    yield "taxi/ontheffingen", factory.post(
+        "/taxi/ontheffingen/",
+        json.dumps({"bsn": "100000001", "ontheffingsnummer": "1000001"}),
+        content_type="application/json",
+        **auth,
+    ).environ
+    yield "taxi/ontheffingen/<nr>", factory.get(
+        "/taxi/ontheffingen/1000001/", **auth
+    ).environ
+
+
+def measure_profile(args):
+    """
+    Time the requests with the settings in DJANGO_SETTINGS_MODULE, and print
+    the timings as json
+    """
+    sys.path.insert(0, SRC_DIR)
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ["CLEOPATRA_BASIC_AUTH_USER"] = USER
+    os.environ["CLEOPATRA_BASIC_AUTH_PASS"] = PASSWORD
+    os.environ["DJANGO_LOG_LEVEL"] = "ERROR"
+
+    import django
+    from django.core.handlers.wsgi import WSGIHandler
+
+    django.setup()
+
+    from taxi.decos import DecosTaxiDetail, DecosTaxiDriver
+    from zwaarverkeer.decos import DecosZwaarverkeer
+
+    mock.patch.object(
+        DecosZwaarverkeer, "get_permits", return_value=zwaarverkeer_permits()
+    ).start()
+    mock.patch.object(
+        DecosTaxiDriver, "get_ontheffingen", return_value=[taxi_permit()]
+    ).start()
+    mock.patch.object(
+        DecosTaxiDetail, "get_ontheffingen", return_value=taxi_permit()
+    ).start()
+
+    handler = WSGIHandler()
+    statuses = []
+
+    def start_response(status, headers):
+        statuses.append(status)
+
+    results = {}
+    for name, environ in requests():
+        body = environ["wsgi.input"].read()
+
+        def request():
+            response = handler(
+                {**environ, "wsgi.input": io.BytesIO(body)}, start_response
+            )
+            response.close()
+
+        request()
+        if not statuses[-1].startswith("200"):
+            raise RuntimeError(f"{name}: {statuses[-1]}")
+        timer = timeit.Timer(request)
+        number = 1
+        while timer.timeit(number) < args.min_time:
+            number *= 2
+        timings = timer.repeat(repeat=args.repeat, number=number)
+        results[name] = min(timings) / number * 1e6
+    json.dump(results, sys.stdout)
+
+
+def run_profile(settings_module, args):
+    output = subprocess.check_output(
+        [
+            sys.executable,
+            __file__,
+            "--measure",
+            f"--repeat={args.repeat}",
+            f"--min-time={args.min_time}",
+        ],
+        env={**os.environ, "DJANGO_SETTINGS_MODULE": settings_module},
+        text=True,
+    )
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--profiles", default=",".join(PROFILES))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2)
+    parser.add_argument("--measure", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure_profile(args)
+        return
+
+    profiles = args.profiles.split(",")
+    results = {profile: run_profile(profile, args) for profile in profiles}
+    baseline = results[profiles[0]]
+    header = "".join(f"{profile:>20}" for profile in profiles)
+    print(f"{'request':<26}{header}  saved per request")
+    for name, duration in baseline.items():
+        durations = "".join(
+            f"{results[profile][name]:>18.1f}us" for profile in profiles
+        )
+        saved = "  ".join(
+            f"{duration - results[profile][name]:.1f}us "
+            f"({1 - results[profile][name] / duration:.0%})"
+            for profile in profiles[1:]
+        )
+        print(f"{name:<26}{durations}  {saved}")
+
+
+if __name__ == "__main__":
+    main()
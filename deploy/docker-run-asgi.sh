@@ -0,0 +1,14 @@
+#!/usr/bin/env bash
+
+set -u   # crash on missing env variables
+set -e   # stop on any error
+set -x   # print all commands to the terminal
+
+# collect the prometheus metrics of all uvicorn workers, see main/metrics.py
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus}
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
+# run uvicorn with the async views
+export ASYNC_VIEWS=true
+exec uvicorn main.asgi:application --host 0.0.0.0 --port 8000 --workers 4
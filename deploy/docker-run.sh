@@ -4,5 +4,10 @@ set -u   # crash on missing env variables
 set -e   # stop on any error
 set -x   # print all commands to the terminal
 
+# collect the prometheus metrics of all uwsgi workers, see main/metrics.py
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus}
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
 # run uwsgi
 exec uwsgi --ini main/uwsgi.ini
@@ -4,4 +4,5 @@ from . import views
 
 urlpatterns = [
     path("health", views.health),
+    path("metrics", views.MetricsView.as_view()),
 ]
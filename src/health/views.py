@@ -2,6 +2,10 @@ import logging
 
 from django.conf import settings
 from django.http import HttpResponse
+from rest_framework.views import APIView
+
+from main.authentication import BasicAuthWithKeys
+from main.metrics import render_metrics
 
 log = logging.getLogger(__name__)
 
@@ -17,3 +21,17 @@ def health(request):
         )
 
     return HttpResponse("Connectivity OK", content_type="text/plain", status=200)
+
+
+class MetricsView(APIView):
+    """
+    The Prometheus metrics, for the same callers as the API
+    """
+
+    http_method_names = ["get"]
+    authentication_classes = [BasicAuthWithKeys]
+    swagger_schema = None
+
+    def get(self, request):
+        content, content_type = render_metrics()
+        return HttpResponse(content, content_type=content_type, status=200)
@@ -4,10 +4,13 @@ import logging
 from django.conf import settings
 from rest_framework import authentication, exceptions
 
+from main import server_timing
+
 log = logging.getLogger(__name__)
 
 
 class BasicAuthWithKeys(authentication.BaseAuthentication):
+    @server_timing.timed("auth")
     def authenticate(self, request):
         basic_credentials = request.META.get("HTTP_AUTHORIZATION")
         if not basic_credentials:
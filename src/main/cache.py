@@ -0,0 +1,115 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+
+# All in-process caches, so they can be cleared together
+_local_caches = []
+
+
+class LocalCache:
+    """
+    A small thread-safe in-process LRU cache with an expiry time per entry
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        _local_caches.append(self)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout: float):
+        if self.maxsize <= 0 or timeout <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class TwoTierCache:
+    """
+    An in-process LRU cache (L1) in front of a shared Django cache (L2).
+    Values found in L2 are copied to L1 for the rest of their lifetime.
+    """
+
+    def __init__(
+        self, *, timeout: int, maxsize: int, alias: str = "default", prefix: str = ""
+    ):
+        self.timeout = timeout
+        self.local = LocalCache(maxsize)
+        self.alias = alias
+        # Prefix of the keys in the shared cache, to keep caches with the same
+        # keys apart
+        self.prefix = prefix
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is not None:
+            return value
+
+        entry = self.shared.get(self.prefix + key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        self.local.set(key, value, expires_at - time.time())
+        return value
+
+    def set(self, key, value):
+        self.local.set(key, value, self.timeout)
+        self.shared.set(
+            self.prefix + key, (time.time() + self.timeout, value), self.timeout
+        )
+
+    def delete(self, key):
+        self.local.delete(key)
+        self.shared.delete(self.prefix + key)
+
+    async def aget(self, key):
+        value = self.local.get(key)
+        if value is not None:
+            return value
+
+        entry = await self.shared.aget(self.prefix + key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        self.local.set(key, value, expires_at - time.time())
+        return value
+
+    async def aset(self, key, value):
+        self.local.set(key, value, self.timeout)
+        await self.shared.aset(
+            self.prefix + key, (time.time() + self.timeout, value), self.timeout
+        )
+
+
+def clear_local_caches():
+    for local_cache in _local_caches:
+        local_cache.clear()
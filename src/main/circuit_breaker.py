@@ -0,0 +1,162 @@
+import hashlib
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django_http_exceptions import HTTPExceptions
+
+log = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """
+    Stops calling an upstream service that keeps failing or responding slowly.
+
+    The circuit opens when FAILURE_THRESHOLD calls fail, or SLOW_CALL_THRESHOLD
+    calls take longer than SLOW_CALL_DURATION seconds, within WINDOW seconds.
+    While open, calls are rejected immediately. After RESET_TIMEOUT seconds the
+    circuit is half-open: HALF_OPEN_PROBES calls are let through, and the first
+    of them to finish closes the circuit again, or reopens it when it fails.
+
+    The failures and slow calls are counted in the memory of the worker. The
+    open state is kept in the Django cache, so with a shared cache backend a
+    circuit opened by one worker is open for all of them. Only the transitions
+    are written to the cache, and while the circuit is closed it is read at
+    most every `sync_interval` seconds, so most calls don't touch the cache.
+    """
+
+    sync_interval = 1
+
+    def __init__(self, name: str, alias: str = "default"):
+        self.name = name
+        self.alias = alias
+        self.key = f"circuit:{hashlib.sha256(name.encode()).hexdigest()}"
+        self.failure_threshold = settings.DECOS_CIRCUIT_FAILURE_THRESHOLD
+        self.slow_call_threshold = settings.DECOS_CIRCUIT_SLOW_CALL_THRESHOLD
+        self.slow_call_duration = settings.DECOS_CIRCUIT_SLOW_CALL_DURATION
+        self.window = settings.DECOS_CIRCUIT_WINDOW
+        self.reset_timeout = settings.DECOS_CIRCUIT_RESET_TIMEOUT
+        self.half_open_probes = settings.DECOS_CIRCUIT_HALF_OPEN_PROBES
+        self._lock = threading.Lock()
+        # The open state as last read from the cache, and when it was read
+        self._opened_at = None
+        self._synced_at = None
+        # The calls counted per counter, as (window start, count)
+        self._counts = {}
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @property
+    def enabled(self) -> bool:
+        return self.failure_threshold > 0 or self.slow_call_threshold > 0
+
+    def before_call(self) -> bool:
+        """
+        Check whether a call may be made. Raises SERVICE_UNAVAILABLE when the
+        circuit is open. Returns whether the call is a half-open probe, which
+        should be passed on to record_success or record_failure.
+        """
+        if not self.enabled:
+            return False
+        opened_at = self._get_opened_at()
+        if opened_at is None:
+            return False
+
+        if time.time() - opened_at >= self.reset_timeout:
+            probes_key = f"{self.key}:probes:{opened_at}"
+            if self._incr(probes_key, self.reset_timeout) <= self.half_open_probes:
+                log.info(f"Circuit {self.name} is half-open, probing")
+                return True
+
+        raise HTTPExceptions.SERVICE_UNAVAILABLE.with_content(
+            "Decos is unavailable, try again later"
+        )
+
+    def record_success(self, duration: float, probe: bool = False):
+        if not self.enabled:
+            return
+        if probe:
+            log.info(f"Circuit {self.name} is closed again")
+            self.cache.delete(f"{self.key}:opened_at")
+            self._set_opened_at(None)
+        elif self.slow_call_threshold > 0 and duration > self.slow_call_duration:
+            self._count("slow_calls", self.slow_call_threshold)
+
+    def record_failure(self, probe: bool = False):
+        if not self.enabled:
+            return
+        if probe:
+            self._open()
+        elif self.failure_threshold > 0:
+            self._count("failures", self.failure_threshold)
+
+    def release_probe(self, probe: bool):
+        """
+        Give back a half-open probe that did not get to test Decos, such as a
+        call that was cut off by the deadline of its request
+        """
+        if not probe:
+            return
+        with self._lock:
+            opened_at = self._opened_at
+        if opened_at is None:
+            return
+        try:
+            self.cache.decr(f"{self.key}:probes:{opened_at}")
+        except ValueError:
+            # The probes of this opening expired in the meantime
+            pass
+
+    def _get_opened_at(self) -> float | None:
+        """
+        When the circuit was opened, or None when it is closed. The cache is
+        read while the circuit is open, to see a probe close it in another
+        worker, and every `sync_interval` seconds while it is closed.
+        """
+        with self._lock:
+            if (
+                self._opened_at is None
+                and self._synced_at is not None
+                and time.monotonic() - self._synced_at < self.sync_interval
+            ):
+                return None
+        opened_at = self.cache.get(f"{self.key}:opened_at")
+        self._set_opened_at(opened_at)
+        return opened_at
+
+    def _set_opened_at(self, opened_at: float | None):
+        with self._lock:
+            self._opened_at = opened_at
+            self._synced_at = time.monotonic()
+
+    def _count(self, counter: str, threshold: int):
+        window_start = int(time.time() // self.window)
+        with self._lock:
+            counted_window, count = self._counts.get(counter, (window_start, 0))
+            if counted_window != window_start:
+                count = 0
+            count += 1
+            if count < threshold:
+                self._counts[counter] = (window_start, count)
+                return
+            del self._counts[counter]
+        self._open()
+
+    def _open(self):
+        log.warning(f"Circuit {self.name} is open")
+        opened_at = time.time()
+        self.cache.set(f"{self.key}:opened_at", opened_at, None)
+        self._set_opened_at(opened_at)
+
+    def _incr(self, key: str, timeout: float) -> int:
+        self.cache.add(key, 0, timeout)
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            # The key expired in between
+            self.cache.set(key, 1, timeout)
+            return 1
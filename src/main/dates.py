@@ -0,0 +1,40 @@
+from datetime import date, datetime, tzinfo
+from functools import lru_cache
+
+from dateutil import parser
+from django.utils import timezone
+
+
+@lru_cache(maxsize=4096)
+def parse_decos_datetime(value: str) -> datetime:
+    """
+    Parse a date field of Decos, such as "2024-02-01T00:00:00.000". Decos
+    always uses this ISO layout, so dateutil is only used for anything else.
+    The permits of a plate or driver share only a few dates, so the results
+    are cached per string.
+    """
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return parser.parse(value)
+
+
+def parse_decos_date(value: str) -> date:
+    return parse_decos_datetime(value).date()
+
+
+@lru_cache(maxsize=4096)
+def _localize(value: str, tz: tzinfo) -> datetime:
+    dt = parse_decos_datetime(value)
+    if timezone.is_naive(dt):
+        # This is what timezone.make_aware does for zoneinfo timezones
+        return dt.replace(tzinfo=tz)
+    return dt.astimezone(tz)
+
+
+def parse_local_datetime(value: str, tz: tzinfo = None) -> datetime:
+    """
+    Parse a date field of Decos as a datetime in the local timezone. Pass the
+    timezone when parsing many fields, to look up the current timezone once.
+    """
+    return _localize(value, tz or timezone.get_current_timezone())
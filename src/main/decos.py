@@ -1,64 +1,567 @@
+import contextvars
+import copy
+import functools
 import logging
-import urllib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import requests
 from django.conf import settings
+from django.utils.crypto import salted_hmac
 from django_http_exceptions import HTTPExceptions
-from requests import JSONDecodeError
+from requests.adapters import HTTPAdapter
+
+from main import json_codec, metrics, retries, server_timing
+from main.cache import TwoTierCache
+from main.circuit_breaker import CircuitBreaker
+from main.queries import Query, encode_parameters, query_name
+from main.single_flight import SharedSingleFlight, SingleFlight
 
 log = logging.getLogger(__name__)
 
+# One long-lived session per (base url, credential set), shared by all threads in
+# the worker so connections to Decos are reused instead of re-handshaked per call
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+# Executor shared by all requests in the worker for concurrent Decos calls
+_executor = None
+_executor_lock = threading.Lock()
+EXECUTOR_THREAD_NAME_PREFIX = "decos"
+# Executor for the (hedged) requests to Decos, see DECOS_HEDGE_REQUESTS
+_hedge_executor = None
+
+# One circuit breaker per (base url, credential set). Its state is in the cache
+_circuit_breakers = {}
+_circuit_breakers_lock = threading.Lock()
+
+# Identical Decos calls in flight at the same time in the worker are made once
+_single_flight = SingleFlight()
+
+# One response cache and one cache for empty responses per Decos client class,
+# see DecosBase.cache_timeout and DecosBase.negative_cache_timeout
+_response_caches = {}
+_negative_caches = {}
+_response_caches_lock = threading.Lock()
+
+# Keys of the stale responses being refreshed in the background
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+# Response header set when (some of) the Decos data of the response was stale
+STALE_HEADER = "X-Decos-Stale"
+
+DEADLINE_EXCEEDED = "No time left to fetch data from Decos"
+
 
 class DecosBase:
     base_url = settings.DECOS_BASE_URL
+    # Responses are cached for cache_timeout seconds when it is set. The last
+    # cache_maxsize responses are also kept in memory of the worker itself
+    cache_timeout = 0
+    cache_maxsize = 0
+    # After cache_timeout, cached responses are still served for stale_timeout
+    # seconds while they are refreshed in the background
+    stale_timeout = 0
+    # Set when a response of this client was served stale
+    served_stale = False
+    # Responses without content are cached separately, also when cache_timeout
+    # is not set, as most lookups legitimately find nothing
+    negative_cache_timeout = settings.DECOS_NEGATIVE_CACHE_TIMEOUT
+    negative_cache_maxsize = settings.DECOS_NEGATIVE_CACHE_MAXSIZE
+    # Number of items requested per page when iterating over a Decos query.
+    # When not set Decos decides the size of the pages
+    page_size = None
+    # Connect and read timeout of a Decos call, in seconds
+    timeout = 5
 
-    def _get(self, url, parameters=None):
+    def __init__(self, deadline: float = None):
         """
-        Generate a get requests for the given Url and parameters
+        deadline is the time.monotonic() by which all Decos calls of the client
+        must be done, see get_deadline. Every call then gets at most the time
+        that is left, and fails with GATEWAY_TIMEOUT when no time is left.
         """
-        log.info(f"Fetching data from Decos: {url}")
-        try:
-            parsed_params = urllib.parse.urlencode(
-                parameters, quote_via=urllib.parse.quote
-            )
-            response = self._get_response(params=parsed_params, url=url)
-            # TODO: account for pagination in the decos join api
-            response.raise_for_status()
-        except requests.exceptions.ConnectionError:
-            raise HTTPExceptions.SERVICE_UNAVAILABLE.with_content(
-                "Unable to reach Decos server"
-            )
-        except requests.exceptions.ReadTimeout:
-            raise HTTPExceptions.GATEWAY_TIMEOUT.with_content(
-                "Timeout trying to fetch data from Decos"
+        self.deadline = deadline
+
+    def _get(self, url, parameters=None, use_cache=True):
+        """
+        Generate a get requests for the given Url and parameters.
+        use_cache=False bypasses the response cache, not the negative cache
+        """
+        parsed_params = encode_parameters(parameters)
+        use_cache = use_cache and self.cache_timeout > 0
+        if not use_cache and not self.negative_cache_timeout:
+            return self._fetch_coalesced(url, parsed_params)
+
+        cache_key = self._get_cache_key(url, parsed_params)
+        if self.negative_cache_timeout:
+            data = self._get_negative_cache().get(cache_key)
+            metrics.count_cache_lookup("negative", "miss" if data is None else "hit")
+            if data is not None:
+                return data
+
+        if use_cache:
+            entry = self._get_response_cache().get(cache_key)
+            if entry is None:
+                metrics.count_cache_lookup("response", "miss")
+            else:
+                fresh_until, data = entry
+                if time.time() < fresh_until:
+                    metrics.count_cache_lookup("response", "hit")
+                else:
+                    metrics.count_cache_lookup("response", "stale")
+                    self.served_stale = True
+                    self._refresh_in_background(url, parsed_params, cache_key)
+                return data
+
+        data = self._fetch_coalesced(url, parsed_params)
+        if use_cache:
+            self._get_response_cache().set(
+                cache_key, (time.time() + self.cache_timeout, data)
             )
-        except requests.exceptions.RequestException as e:
-            if e.response:
-                log.error(
-                    f"We got an {e.response.status_code} "
-                    f"error from Decos Join saying: {e.response.content}"
+        if self.negative_cache_timeout and is_empty_response(data):
+            self._get_negative_cache().set(cache_key, data)
+        return data
+
+    def _refresh_in_background(self, url, parsed_params, cache_key):
+        """
+        Refresh a stale cached response on the executor. When Decos fails, the
+        stale response is served until it expires after stale_timeout
+        """
+        with _refreshing_lock:
+            if cache_key in _refreshing:
+                return
+            _refreshing.add(cache_key)
+
+        # The refresh is not bound to the deadline of the request that triggered it
+        client = copy.copy(self)
+        client.deadline = None
+
+        def refresh():
+            try:
+                data = client._fetch_coalesced(url, parsed_params)
+                self._get_response_cache().set(
+                    cache_key, (time.time() + self.cache_timeout, data)
                 )
-            else:
-                log.error("No response received from Decos")
-            log.error(e)
-            raise HTTPExceptions.BAD_GATEWAY.with_content(
-                "We got an error response from Decos"
+            except Exception as e:
+                log.warning(f"Could not refresh stale Decos data: {e}")
+            finally:
+                with _refreshing_lock:
+                    _refreshing.discard(cache_key)
+
+        _get_executor().submit(refresh)
+
+    def _fetch_coalesced(self, url, parsed_params):
+        """
+        Fetch the data, sharing the call with identical requests that are in
+        flight at the same time (see DECOS_COALESCE_REQUESTS)
+        """
+        if not settings.DECOS_COALESCE_REQUESTS:
+            return self._fetch(url, parsed_params)
+
+        def fetch():
+            return self._fetch(url, parsed_params)
+
+        if settings.DECOS_COALESCE_ACROSS_WORKERS:
+            flight_key = salted_hmac(
+                "decos.flight_key",
+                f"{self.auth_user} {url}?{parsed_params}",
+                algorithm="sha256",
+            ).hexdigest()
+            shared_single_flight = SharedSingleFlight(
+                timeout=settings.DECOS_COALESCE_TIMEOUT
+            )
+            coalesced_fetch = functools.partial(
+                shared_single_flight.do, flight_key, fetch
             )
+        else:
+            coalesced_fetch = fetch
 
+        # Don't wait for an identical call longer than the deadline of this one
+        timeout = None if self.deadline is None else self.deadline - time.monotonic()
         try:
-            data = response.json()
-        except JSONDecodeError:
-            raise HTTPExceptions.NOT_FOUND.with_content(
-                f"Decos responded with error: {response.content}"
+            return _single_flight.do(
+                (self.auth_user, url, parsed_params), coalesced_fetch, timeout
             )
-        return data
+        except TimeoutError:
+            raise HTTPExceptions.GATEWAY_TIMEOUT.with_content(DEADLINE_EXCEEDED)
+
+    def _get_paginated(self, url, parameters=None):
+        """
+        Same as _get, but with the items of all pages of the result as content
+        """
+        content = list(self._iter_items(url, parameters))
+        return {"count": len(content), "content": content}
+
+    def _iter_items(self, url, parameters=None, use_cache=True):
+        """
+        Lazily iterate over the items of all pages of a Decos query.
+        The next page is only requested when the items of the previous page
+        have been consumed, so stop iterating to stop fetching pages.
+        """
+        skip = 0
+        while True:
+            data = self._get(
+                url, self._page_parameters(parameters, skip), use_cache=use_cache
+            )
+            content = data.get("content")
+            if not content or not isinstance(content, list):
+                return
+            yield from content
+
+            skip += len(content)
+            if skip >= data.get("count", 0):
+                return
+
+    def _page_parameters(self, parameters, skip: int) -> Query:
+        paging = {}
+        if self.page_size:
+            paging["top"] = self.page_size
+        if skip:
+            paging["skip"] = skip
+        query_string = "&".join(
+            query_string
+            for query_string in [
+                encode_parameters(parameters),
+                encode_parameters(paging),
+            ]
+            if query_string
+        )
+        return Query(query_string, getattr(parameters, "name", None))
+
+    def _map_concurrently(self, func, items) -> list:
+        """
+        Call func for every item concurrently on the shared Decos executor.
+        The results are returned in the order of the items. Exceptions are
+        raised as if the calls were made one after the other.
+        """
+        items = list(items)
+        on_executor = threading.current_thread().name.startswith(
+            EXECUTOR_THREAD_NAME_PREFIX
+        )
+        if len(items) <= 1 or on_executor:
+            # Waiting for the executor from one of its own threads may deadlock
+            return [func(item) for item in items]
+
+        executor = _get_executor()
+        # Run every call in a copy of the context of the request, e.g. to time it
+        futures = [
+            executor.submit(contextvars.copy_context().run, func, item)
+            for item in items
+        ]
+        return [future.result() for future in futures]
+
+    def _get_cache_key(self, url, parsed_params) -> str:
+        """
+        The url and query parameters may contain personal data such as a bsn,
+        so only a keyed hash of them is used as cache key, for both the
+        responses and the negative cache
+        """
+        request_url = requests.Request("GET", url, params=parsed_params).prepare().url
+        url_hash = salted_hmac("decos.cache_key", request_url, algorithm="sha256")
+        return f"decos:{url_hash.hexdigest()}"
+
+    def _get_response_cache(self) -> TwoTierCache:
+        return self._get_class_cache(
+            _response_caches,
+            timeout=self.cache_timeout + self.stale_timeout,
+            maxsize=self.cache_maxsize,
+        )
+
+    def _get_negative_cache(self) -> TwoTierCache:
+        return self._get_class_cache(
+            _negative_caches,
+            timeout=self.negative_cache_timeout,
+            maxsize=self.negative_cache_maxsize,
+            prefix="empty:",
+        )
+
+    def _get_class_cache(self, caches, *, timeout, maxsize, prefix=""):
+        cache_class = type(self)
+        class_cache = caches.get(cache_class)
+        if class_cache is None:
+            with _response_caches_lock:
+                class_cache = caches.get(cache_class)
+                if class_cache is None:
+                    class_cache = TwoTierCache(
+                        timeout=timeout, maxsize=maxsize, prefix=prefix
+                    )
+                    caches[cache_class] = class_cache
+        return class_cache
+
+    def _fetch(self, url, parsed_params):
+        call = query_name(parsed_params)
+        with metrics.observe_decos_call(call), server_timing.timed("decos", call):
+            # Fail fast, without calling Decos, when the deadline has passed
+            self._get_timeout()
+            circuit_breaker = self._get_circuit_breaker()
+            probe = circuit_breaker.before_call()
+            log.info(f"Fetching data from Decos: {url}")
+            started_at = time.monotonic()
+            try:
+                response = self._get_response_with_retries(
+                    params=parsed_params, url=url
+                )
+                response.raise_for_status()
+            except requests.exceptions.ConnectionError as e:
+                if isinstance(e, requests.exceptions.Timeout):
+                    self._record_timeout(circuit_breaker, probe)
+                else:
+                    circuit_breaker.record_failure(probe)
+                raise HTTPExceptions.SERVICE_UNAVAILABLE.with_content(
+                    "Unable to reach Decos server"
+                )
+            except requests.exceptions.ReadTimeout:
+                self._record_timeout(circuit_breaker, probe)
+                raise HTTPExceptions.GATEWAY_TIMEOUT.with_content(
+                    "Timeout trying to fetch data from Decos"
+                )
+            except requests.exceptions.RequestException as e:
+                if e.response is None or e.response.status_code >= 500:
+                    circuit_breaker.record_failure(probe)
+                else:
+                    circuit_breaker.record_success(time.monotonic() - started_at, probe)
+                if e.response:
+                    log.error(
+                        f"We got an {e.response.status_code} "
+                        f"error from Decos Join saying: {e.response.content}"
+                    )
+                else:
+                    log.error("No response received from Decos")
+                log.error(e)
+                raise HTTPExceptions.BAD_GATEWAY.with_content(
+                    "We got an error response from Decos"
+                )
+            except BaseException:
+                # Such as the deadline passing before Decos was called
+                circuit_breaker.release_probe(probe)
+                raise
+            circuit_breaker.record_success(time.monotonic() - started_at, probe)
+
+            try:
+                data = json_codec.loads(response.content)
+            except ValueError:
+                raise HTTPExceptions.NOT_FOUND.with_content(
+                    f"Decos responded with error: {response.content}"
+                )
+            return data
+
+    def _record_timeout(self, circuit_breaker: CircuitBreaker, probe: bool):
+        """
+        Count a timed out call as failure, unless its timeout was shortened to
+        the deadline of the request: Decos did not get its full timeout then
+        """
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            circuit_breaker.release_probe(probe)
+        else:
+            circuit_breaker.record_failure(probe)
+
+    def _get_timeout(self) -> float:
+        """
+        The timeout of the next Decos call, shortened to the time that is left
+        until the deadline
+        """
+        if self.deadline is None:
+            return self.timeout
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            raise HTTPExceptions.GATEWAY_TIMEOUT.with_content(DEADLINE_EXCEEDED)
+        return min(self.timeout, remaining)
+
+    def _get_response_with_retries(self, params, url):
+        """
+        Get the response, retrying connection errors and 5xx responses with
+        backoff as long as the retry budget and the deadline allow it (see
+        DECOS_MAX_RETRIES). Timeouts are not retried: a slow Decos would only
+        get slower from more requests.
+        """
+        retries.retry_budget.deposit()
+        attempt = 0
+        while True:
+            error = None
+            try:
+                response = self._get_hedged_response(params, url)
+                if response.status_code < 500:
+                    return response
+            except requests.exceptions.ConnectionError as e:
+                if isinstance(e, requests.exceptions.Timeout):
+                    raise
+                error = e
+
+            delay = self._get_retry_delay(attempt)
+            if delay is None:
+                if error is not None:
+                    raise error
+                return response
+            log.warning(f"Decos call failed, retrying in {delay:.2f}s")
+            metrics.DECOS_EXTRA_REQUESTS.labels(reason="retry").inc()
+            time.sleep(delay)
+            attempt += 1
+
+    def _get_retry_delay(self, attempt: int) -> float | None:
+        """
+        The delay before the next attempt, or None when it may not be retried
+        """
+        if attempt >= settings.DECOS_MAX_RETRIES:
+            return None
+        delay = retries.backoff_delay(attempt)
+        if self.deadline is not None and time.monotonic() + delay >= self.deadline:
+            return None
+        if not retries.retry_budget.withdraw():
+            log.warning("Decos retry budget is exhausted")
+            return None
+        return delay
+
+    def _get_hedged_response(self, params, url):
+        """
+        Get the response. With DECOS_HEDGE_REQUESTS a second, identical request
+        is sent when the first one takes longer than most recent calls, and the
+        first good response of the two is used.
+        """
+        if not settings.DECOS_HEDGE_REQUESTS:
+            return self._get_response(params=params, url=url)
+
+        hedge_after = retries.latencies.percentile(settings.DECOS_HEDGE_PERCENTILE)
+        if hedge_after is None:
+            return self._get_tracked_response(params, url)
+        executor = _get_hedge_executor()
+        first = executor.submit(self._get_tracked_response, params, url)
+        try:
+            return first.result(timeout=hedge_after)
+        except TimeoutError:
+            pass
+        if not retries.retry_budget.withdraw():
+            return first.result()
+
+        log.info(f"Decos call takes longer than {hedge_after:.2f}s, hedging it")
+        metrics.DECOS_EXTRA_REQUESTS.labels(reason="hedge").inc()
+        second = executor.submit(self._get_tracked_response, params, url)
+        response = error = None
+        for future in as_completed([first, second]):
+            try:
+                response = future.result()
+            except requests.exceptions.RequestException as e:
+                error = e
+                continue
+            if response.status_code < 500:
+                return response
+        if response is None:
+            raise error
+        return response
+
+    def _get_tracked_response(self, params, url):
+        started_at = time.monotonic()
+        response = self._get_response(params=params, url=url)
+        retries.latencies.add(time.monotonic() - started_at)
+        return response
 
     def _get_response(self, params, url):
-        response = requests.get(
+        response = self._get_session().get(
             url,
             params=params,
-            auth=(self.auth_user, self.auth_pass),
-            headers={"accept": "application/itemdata"},
-            timeout=5,
+            timeout=self._get_timeout(),
         )
         return response
+
+    def _get_circuit_breaker(self) -> CircuitBreaker:
+        """
+        Return the circuit breaker for the credentials of this Decos client
+        """
+        breaker_key = (self.base_url, self.auth_user)
+        circuit_breaker = _circuit_breakers.get(breaker_key)
+        if circuit_breaker is None:
+            with _circuit_breakers_lock:
+                circuit_breaker = _circuit_breakers.get(breaker_key)
+                if circuit_breaker is None:
+                    circuit_breaker = CircuitBreaker(
+                        f"{self.base_url} ({self.auth_user})"
+                    )
+                    _circuit_breakers[breaker_key] = circuit_breaker
+        return circuit_breaker
+
+    def _get_session(self) -> requests.Session:
+        """
+        Return the pooled session for the credentials of this Decos client.
+        The session is created once per worker and reused by every thread
+        """
+        session_key = (self.base_url, self.auth_user)
+        session = _sessions.get(session_key)
+        if session is None:
+            with _sessions_lock:
+                session = _sessions.get(session_key)
+                if session is None:
+                    session = self._create_session()
+                    _sessions[session_key] = session
+                    metrics.DECOS_CONNECTION_POOL_SIZE.set(
+                        len(_sessions) * settings.DECOS_HTTP_POOL_MAXSIZE
+                    )
+        return session
+
+    def _create_session(self) -> requests.Session:
+        session = requests.Session()
+        session.auth = (self.auth_user, self.auth_pass)
+        session.headers.update({"accept": "application/itemdata"})
+        if settings.DECOS_HTTP_ACCEPT_GZIP:
+            session.headers["Accept-Encoding"] = "gzip, deflate"
+        else:
+            session.headers["Accept-Encoding"] = "identity"
+        if not settings.DECOS_HTTP_KEEP_ALIVE:
+            session.headers["Connection"] = "close"
+
+        adapter = HTTPAdapter(
+            pool_connections=settings.DECOS_HTTP_POOL_CONNECTIONS,
+            pool_maxsize=settings.DECOS_HTTP_POOL_MAXSIZE,
+            pool_block=settings.DECOS_HTTP_POOL_BLOCK,
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+
+def _get_hedge_executor() -> ThreadPoolExecutor:
+    """
+    The executor of the (hedged) requests of DecosBase._get_hedged_response.
+    It is not the shared executor, as the calls on that one are hedged too
+    """
+    global _hedge_executor
+    if _hedge_executor is None:
+        with _executor_lock:
+            if _hedge_executor is None:
+                _hedge_executor = ThreadPoolExecutor(
+                    max_workers=2 * settings.DECOS_MAX_CONCURRENT_REQUESTS,
+                    thread_name_prefix="hedged-decos-call",
+                )
+    return _hedge_executor
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.DECOS_MAX_CONCURRENT_REQUESTS,
+                    thread_name_prefix=EXECUTOR_THREAD_NAME_PREFIX,
+                )
+    return _executor
+
+
+def get_deadline() -> float | None:
+    """
+    The deadline for the Decos calls of a request that starts now, see
+    DECOS_REQUEST_TIMEOUT
+    """
+    if not settings.DECOS_REQUEST_TIMEOUT:
+        return None
+    return time.monotonic() + settings.DECOS_REQUEST_TIMEOUT
+
+
+def is_empty_response(data) -> bool:
+    return isinstance(data, dict) and not data.get("content")
+
+
+def set_stale_header(response, decos: DecosBase):
+    if decos.served_stale:
+        response[STALE_HEADER] = "true"
+    return response
@@ -0,0 +1,327 @@
+import asyncio
+import copy
+import logging
+import time
+import weakref
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django_http_exceptions import HTTPExceptions
+
+from main import json_codec, metrics, retries, server_timing
+from main.decos import is_empty_response
+from main.queries import encode_parameters, query_name
+
+log = logging.getLogger(__name__)
+
+# httpx clients are bound to the event loop they are used in, so the pooled
+# clients are kept per event loop and per (base url, credential set)
+_clients = weakref.WeakKeyDictionary()
+
+# Like the executor of the sync clients, the concurrent calls of all requests
+# on an event loop share one limit, so semaphores are kept per event loop too
+_semaphores = weakref.WeakKeyDictionary()
+
+# Keys of the stale responses being refreshed, and the tasks refreshing them
+_refreshing = set()
+_refresh_tasks = set()
+
+
+class AsyncDecosMixin:
+    """
+    Asyncio counterpart of the requests in DecosBase. Mix it in before a
+    DecosBase subclass to get awaitable versions of its Decos calls, so one
+    worker can wait for many Decos responses at the same time.
+    """
+
+    async def _aget(self, url, parameters=None, use_cache=True):
+        """
+        Generate an async get request for the given Url and parameters
+        """
+        parsed_params = encode_parameters(parameters)
+        use_cache = use_cache and self.cache_timeout > 0
+        if not use_cache and not self.negative_cache_timeout:
+            return await self._afetch(url, parsed_params)
+
+        cache_key = self._get_cache_key(url, parsed_params)
+        if self.negative_cache_timeout:
+            data = await self._get_negative_cache().aget(cache_key)
+            metrics.count_cache_lookup("negative", "miss" if data is None else "hit")
+            if data is not None:
+                return data
+
+        if use_cache:
+            entry = await self._get_response_cache().aget(cache_key)
+            if entry is None:
+                metrics.count_cache_lookup("response", "miss")
+            else:
+                fresh_until, data = entry
+                if time.time() < fresh_until:
+                    metrics.count_cache_lookup("response", "hit")
+                else:
+                    metrics.count_cache_lookup("response", "stale")
+                    self.served_stale = True
+                    self._arefresh_in_background(url, parsed_params, cache_key)
+                return data
+
+        data = await self._afetch(url, parsed_params)
+        if use_cache:
+            await self._get_response_cache().aset(
+                cache_key, (time.time() + self.cache_timeout, data)
+            )
+        if self.negative_cache_timeout and is_empty_response(data):
+            await self._get_negative_cache().aset(cache_key, data)
+        return data
+
+    def _arefresh_in_background(self, url, parsed_params, cache_key):
+        if cache_key in _refreshing:
+            return
+        _refreshing.add(cache_key)
+        # The refresh is not bound to the deadline of the request that triggered it
+        client = copy.copy(self)
+        client.deadline = None
+
+        async def refresh():
+            try:
+                data = await client._afetch(url, parsed_params)
+                await self._get_response_cache().aset(
+                    cache_key, (time.time() + self.cache_timeout, data)
+                )
+            except Exception as e:
+                log.warning(f"Could not refresh stale Decos data: {e}")
+            finally:
+                _refreshing.discard(cache_key)
+                _refresh_tasks.discard(task)
+
+        # Keep a reference, the event loop only keeps weak references to tasks
+        task = asyncio.create_task(refresh())
+        _refresh_tasks.add(task)
+
+    async def _aget_paginated(self, url, parameters=None):
+        content = [item async for item in self._aiter_items(url, parameters)]
+        return {"count": len(content), "content": content}
+
+    async def _aiter_items(self, url, parameters=None):
+        skip = 0
+        while True:
+            data = await self._aget(url, self._page_parameters(parameters, skip))
+            content = data.get("content")
+            if not content or not isinstance(content, list):
+                return
+            for item in content:
+                yield item
+
+            skip += len(content)
+            if skip >= data.get("count", 0):
+                return
+
+    async def _afetch(self, url, parsed_params):
+        call = query_name(parsed_params)
+        with metrics.observe_decos_call(call), server_timing.timed("decos", call):
+            # Fail fast, without calling Decos, when the deadline has passed
+            self._get_timeout()
+            # The circuit breaker keeps its state in the (sync) Django cache
+            circuit_breaker = self._get_circuit_breaker()
+            record_success = sync_to_async(circuit_breaker.record_success)
+            record_failure = sync_to_async(circuit_breaker.record_failure)
+            record_timeout = sync_to_async(self._record_timeout)
+            release_probe = sync_to_async(circuit_breaker.release_probe)
+            probe = await sync_to_async(circuit_breaker.before_call)()
+            log.info(f"Fetching data from Decos: {url}")
+            started_at = time.monotonic()
+            try:
+                response = await self._aget_response_with_retries(
+                    params=parsed_params, url=url
+                )
+                response.raise_for_status()
+            except httpx.ConnectError:
+                await record_failure(probe)
+                raise HTTPExceptions.SERVICE_UNAVAILABLE.with_content(
+                    "Unable to reach Decos server"
+                )
+            except httpx.ConnectTimeout:
+                await record_timeout(circuit_breaker, probe)
+                raise HTTPExceptions.SERVICE_UNAVAILABLE.with_content(
+                    "Unable to reach Decos server"
+                )
+            except httpx.TimeoutException:
+                await record_timeout(circuit_breaker, probe)
+                raise HTTPExceptions.GATEWAY_TIMEOUT.with_content(
+                    "Timeout trying to fetch data from Decos"
+                )
+            except httpx.HTTPError as e:
+                if (
+                    isinstance(e, httpx.HTTPStatusError)
+                    and e.response.status_code < 500
+                ):
+                    await record_success(time.monotonic() - started_at, probe)
+                else:
+                    await record_failure(probe)
+                if isinstance(e, httpx.HTTPStatusError):
+                    log.error(
+                        f"We got an {e.response.status_code} "
+                        f"error from Decos Join saying: {e.response.content}"
+                    )
+                else:
+                    log.error("No response received from Decos")
+                log.error(e)
+                raise HTTPExceptions.BAD_GATEWAY.with_content(
+                    "We got an error response from Decos"
+                )
+            except BaseException:
+                # Such as the deadline passing before Decos was called, or the
+                # call being cancelled
+                await release_probe(probe)
+                raise
+            await record_success(time.monotonic() - started_at, probe)
+
+            try:
+                data = json_codec.loads(response.content)
+            except ValueError:
+                raise HTTPExceptions.NOT_FOUND.with_content(
+                    f"Decos responded with error: {response.content}"
+                )
+            return data
+
+    async def _aget_response_with_retries(self, params, url):
+        """
+        Async version of DecosBase._get_response_with_retries
+        """
+        retries.retry_budget.deposit()
+        attempt = 0
+        while True:
+            error = None
+            try:
+                response = await self._aget_hedged_response(params, url)
+                if response.status_code < 500:
+                    return response
+            except httpx.TransportError as e:
+                if isinstance(e, httpx.TimeoutException):
+                    raise
+                error = e
+
+            delay = self._get_retry_delay(attempt)
+            if delay is None:
+                if error is not None:
+                    raise error
+                return response
+            log.warning(f"Decos call failed, retrying in {delay:.2f}s")
+            metrics.DECOS_EXTRA_REQUESTS.labels(reason="retry").inc()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _aget_hedged_response(self, params, url):
+        """
+        Async version of DecosBase._get_hedged_response. The slower of the two
+        requests is cancelled
+        """
+        if not settings.DECOS_HEDGE_REQUESTS:
+            return await self._aget_response(params=params, url=url)
+
+        hedge_after = retries.latencies.percentile(settings.DECOS_HEDGE_PERCENTILE)
+        if hedge_after is None:
+            return await self._aget_tracked_response(params, url)
+        first = asyncio.ensure_future(self._aget_tracked_response(params, url))
+        done, _ = await asyncio.wait({first}, timeout=hedge_after)
+        if done or not retries.retry_budget.withdraw():
+            return await first
+
+        log.info(f"Decos call takes longer than {hedge_after:.2f}s, hedging it")
+        metrics.DECOS_EXTRA_REQUESTS.labels(reason="hedge").inc()
+        second = asyncio.ensure_future(self._aget_tracked_response(params, url))
+        response = error = None
+        try:
+            for next_response in asyncio.as_completed([first, second]):
+                try:
+                    response = await next_response
+                except httpx.HTTPError as e:
+                    error = e
+                    continue
+                if response.status_code < 500:
+                    return response
+        finally:
+            first.cancel()
+            second.cancel()
+        if response is None:
+            raise error
+        return response
+
+    async def _aget_tracked_response(self, params, url):
+        started_at = time.monotonic()
+        response = await self._aget_response(params=params, url=url)
+        retries.latencies.add(time.monotonic() - started_at)
+        return response
+
+    async def _aget_response(self, params, url):
+        response = await self._get_async_client().get(
+            url,
+            params=params,
+            timeout=self._get_timeout(),
+        )
+        return response
+
+    async def _amap_concurrently(self, func, items) -> list:
+        """
+        Await func for the items at the same time, at most
+        DECOS_MAX_CONCURRENT_REQUESTS at once for all requests on the event loop,
+        like the sync version. func must not map concurrently itself, as it
+        would wait for the limit it holds. The results are returned in the order
+        of the items. Exceptions are raised as if the calls were made one after
+        the other.
+        """
+        semaphore = self._get_semaphore()
+
+        async def bounded(item):
+            async with semaphore:
+                return await func(item)
+
+        results = await asyncio.gather(
+            *(bounded(item) for item in items), return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return results
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop_semaphores = _semaphores.setdefault(asyncio.get_running_loop(), {})
+        limit = settings.DECOS_MAX_CONCURRENT_REQUESTS
+        semaphore = loop_semaphores.get(limit)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(limit)
+            loop_semaphores[limit] = semaphore
+        return semaphore
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        loop_clients = _clients.setdefault(asyncio.get_running_loop(), {})
+        client_key = (self.base_url, self.auth_user)
+        client = loop_clients.get(client_key)
+        if client is None:
+            client = self._create_async_client()
+            loop_clients[client_key] = client
+        return client
+
+    def _create_async_client(self) -> httpx.AsyncClient:
+        headers = {"accept": "application/itemdata"}
+        if settings.DECOS_HTTP_ACCEPT_GZIP:
+            headers["Accept-Encoding"] = "gzip, deflate"
+        else:
+            headers["Accept-Encoding"] = "identity"
+        if not settings.DECOS_HTTP_KEEP_ALIVE:
+            headers["Connection"] = "close"
+
+        max_keepalive_connections = (
+            settings.DECOS_HTTP_POOL_MAXSIZE if settings.DECOS_HTTP_KEEP_ALIVE else 0
+        )
+        limits = httpx.Limits(
+            max_connections=settings.DECOS_ASYNC_MAX_CONNECTIONS,
+            max_keepalive_connections=max_keepalive_connections,
+        )
+        return httpx.AsyncClient(
+            auth=(self.auth_user or "", self.auth_pass or ""),
+            headers=headers,
+            limits=limits,
+            # Like the requests sessions of the sync clients
+            follow_redirects=True,
+        )
@@ -0,0 +1,123 @@
+"""
+The json codec of the API and of the Decos clients: the DRF renderer and parser
+of the views and the decoding of the Decos responses all use `get_codec()`.
+JSON_CODEC picks orjson (the default, the json module of the standard library
+when orjson is not installed) or "json". Both encode data the same as the
+JSONRenderer of DRF, such as datetimes with Z for UTC and Decimals as floats,
+except for NaN and infinite floats: DRF refuses to encode them, orjson encodes
+them as null. The responses of the API hold no floats, see main.responses.
+"""
+
+import json
+
+from django.conf import settings
+from rest_framework import parsers, renderers
+from rest_framework.exceptions import ParseError
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.json import strict_constant
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+class StdlibCodec:
+    """
+    The json module of the standard library, with the settings of DRF
+    """
+
+    name = "json"
+
+    def dumps(self, data) -> bytes:
+        return json.dumps(
+            data,
+            cls=JSONEncoder,
+            ensure_ascii=False,
+            allow_nan=False,
+            separators=(",", ":"),
+        ).encode()
+
+    def loads(self, content: bytes | str):
+        return json.loads(content, parse_constant=strict_constant)
+
+
+class OrjsonCodec:
+    """
+    orjson, with the types it does not encode the same as DRF (dates and times,
+    Decimals) passed to the JSONEncoder of DRF. NaN and infinite floats are
+    encoded as null, which json does not support, instead of raising a
+    ValueError like DRF. Checking every float would slow down all responses.
+    """
+
+    name = "orjson"
+    options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS if orjson else 0
+
+    def __init__(self):
+        self._default = JSONEncoder().default
+
+    def dumps(self, data) -> bytes:
+        return orjson.dumps(data, default=self._default, option=self.options)
+
+    def loads(self, content: bytes | str):
+        return orjson.loads(content)
+
+
+_codecs = {"json": StdlibCodec()}
+if orjson is not None:
+    _codecs["orjson"] = OrjsonCodec()
+
+
+def get_codec():
+    return _codecs.get(settings.JSON_CODEC, _codecs["json"])
+
+
+def dumps(data) -> bytes:
+    return get_codec().dumps(data)
+
+
+def loads(content: bytes | str):
+    """
+    Decode json, raises a ValueError when it is not valid json
+    """
+    return get_codec().loads(content)
+
+
+class JSONRenderer(renderers.JSONRenderer):
+    """
+    The JSONRenderer of DRF, encoding with the json codec. Pretty printing
+    (e.g. for the browsable api) is left to DRF.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Escape the line and paragraph separators like DRF does, to output
+        # json that is a strict javascript subset
+        return (
+            dumps(data)
+            .replace("\u2028".encode(), b"\\u2028")
+            .replace("\u2029".encode(), b"\\u2029")
+        )
+
+
+class JSONParser(parsers.JSONParser):
+    """
+    The JSONParser of DRF, decoding with the json codec
+    """
+
+    renderer_class = JSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+        try:
+            content = stream.read()
+            if encoding.lower().replace("-", "") != "utf8":
+                content = content.decode(encoding)
+            return loads(content)
+        except ValueError as exc:
+            raise ParseError(f"JSON parse error - {exc}")
@@ -0,0 +1,97 @@
+"""
+Prometheus metrics of the API views and of the Decos calls they make, served on
+/status/metrics. uWSGI runs several worker processes, so set
+PROMETHEUS_MULTIPROC_DIR to an empty directory shared by the workers to get the
+metrics of all of them (see deploy/docker-run.sh). Without it only the metrics
+of the worker that serves the scrape are returned. The endpoint requires the
+basic auth credentials of the API, like the other non-public endpoints.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+
+from django_http_exceptions.exceptions import HTTPException
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+REQUEST_DURATION = Histogram(
+    "verkeersvergunningen_request_duration_seconds",
+    "Duration of the requests to the API, by view and response status",
+    ["view", "method", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+DECOS_CALL_DURATION = Histogram(
+    "verkeersvergunningen_decos_call_duration_seconds",
+    "Duration of the calls to Decos, by the name of their query",
+    ["call"],
+    buckets=LATENCY_BUCKETS,
+)
+DECOS_CALL_ERRORS = Counter(
+    "verkeersvergunningen_decos_call_errors",
+    "Failed calls to Decos, by the HTTP status the failure was mapped to",
+    ["call", "status"],
+)
+DECOS_EXTRA_REQUESTS = Counter(
+    "verkeersvergunningen_decos_extra_requests",
+    "Requests to Decos on top of the first one of a call, by reason (retry, hedge)",
+    ["reason"],
+)
+DECOS_CACHE_LOOKUPS = Counter(
+    "verkeersvergunningen_decos_cache_lookups",
+    "Lookups in the caches of Decos data, by cache and result (hit, miss, stale)",
+    ["cache", "result"],
+)
+DECOS_CALLS_IN_FLIGHT = Gauge(
+    "verkeersvergunningen_decos_calls_in_flight",
+    "Calls to Decos waiting for a response, i.e. connections in use",
+    multiprocess_mode="livesum",
+)
+DECOS_CONNECTION_POOL_SIZE = Gauge(
+    "verkeersvergunningen_decos_connection_pool_size",
+    "Maximum number of pooled connections to Decos, per worker",
+    multiprocess_mode="liveall",
+)
+
+
+@contextmanager
+def observe_decos_call(call: str):
+    """
+    Time a call to Decos, and count it as error when it raises an HTTPException
+    """
+    started_at = time.monotonic()
+    DECOS_CALLS_IN_FLIGHT.inc()
+    try:
+        yield
+    except HTTPException as e:
+        DECOS_CALL_ERRORS.labels(call=call, status=e.status).inc()
+        raise
+    finally:
+        DECOS_CALLS_IN_FLIGHT.dec()
+        DECOS_CALL_DURATION.labels(call=call).observe(time.monotonic() - started_at)
+
+
+def count_cache_lookup(cache: str, result: str):
+    DECOS_CACHE_LOOKUPS.labels(cache=cache, result=result).inc()
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """
+    The metrics in the Prometheus text format, and their content type
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
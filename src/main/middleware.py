@@ -0,0 +1,111 @@
+import time
+from hmac import compare_digest
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from main import metrics, server_timing
+
+
+class AsyncCapableMiddleware:
+    """
+    Base for middleware that runs in the same mode as the rest of the chain,
+    like the MiddlewareMixin of Django: under ASGI `__call__` is a coroutine
+    function that calls `__acall__`, so async views are not moved to a thread
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.call(request)
+
+    def call(self, request):
+        raise NotImplementedError
+
+    async def __acall__(self, request):
+        raise NotImplementedError
+
+
+class MetricsMiddleware(AsyncCapableMiddleware):
+    """
+    Time every request, labelled with the name of the view that handled it
+    """
+
+    def call(self, request):
+        started_at = time.monotonic()
+        response = self.get_response(request)
+        self.observe(request, response, started_at)
+        return response
+
+    async def __acall__(self, request):
+        started_at = time.monotonic()
+        response = await self.get_response(request)
+        self.observe(request, response, started_at)
+        return response
+
+    def observe(self, request, response, started_at: float):
+        metrics.REQUEST_DURATION.labels(
+            view=getattr(request, "metrics_view_name", "unknown"),
+            method=request.method,
+            status=response.status_code,
+        ).observe(time.monotonic() - started_at)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, "view_class", None)
+        request.metrics_view_name = (view_class or view_func).__name__
+
+
+class ServerTimingMiddleware(AsyncCapableMiddleware):
+    """
+    Add a Server-Timing header with the duration of the phases of the request,
+    such as authentication, every Decos call and serializing the response.
+    Enabled for all requests with SERVER_TIMING_ENABLED, or for the requests
+    of callers that send the SERVER_TIMING_TOKEN in the X-Server-Timing header.
+    """
+
+    def call(self, request):
+        if not self.is_enabled(request):
+            return self.get_response(request)
+
+        started_at = time.perf_counter()
+        token = server_timing.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            timings = server_timing.stop(token)
+        return self.add_header(response, timings, started_at)
+
+    async def __acall__(self, request):
+        if not self.is_enabled(request):
+            return await self.get_response(request)
+
+        started_at = time.perf_counter()
+        token = server_timing.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            timings = server_timing.stop(token)
+        return self.add_header(response, timings, started_at)
+
+    def add_header(self, response, timings, started_at: float):
+        timings.add("total", time.perf_counter() - started_at)
+        response["Server-Timing"] = timings.header_value()
+        return response
+
+    def is_enabled(self, request) -> bool:
+        if settings.SERVER_TIMING_ENABLED:
+            return True
+        caller_token = request.headers.get("X-Server-Timing")
+        return bool(
+            settings.SERVER_TIMING_TOKEN
+            and caller_token
+            and compare_digest(caller_token, settings.SERVER_TIMING_TOKEN)
+        )
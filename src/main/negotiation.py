@@ -0,0 +1,18 @@
+from rest_framework.negotiation import BaseContentNegotiation
+
+
+class JSONContentNegotiation(BaseContentNegotiation):
+    """
+    Content negotiation for an API that only speaks json (see main.settings_api):
+    the first parser that handles the content type of the request, and always
+    the first renderer, whatever the Accept header asks for
+    """
+
+    def select_parser(self, request, parsers):
+        for parser in parsers:
+            if request.content_type.startswith(parser.media_type):
+                return parser
+        return None
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
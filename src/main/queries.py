@@ -0,0 +1,85 @@
+import urllib.parse
+from string import Formatter
+
+# All Decos queries by name, so they can be listed and audited in one place
+QUERIES = {}
+
+
+def encode(value) -> str:
+    """
+    Url encode a query parameter the way urlencode(..., quote_via=quote) does
+    """
+    return urllib.parse.quote(str(value), safe="")
+
+
+class Query(str):
+    """
+    An encoded query string which knows the name of the QueryTemplate it was
+    rendered from, e.g. to label the metrics of the Decos call
+    """
+
+    def __new__(cls, query_string: str, name: str = None):
+        query = super().__new__(cls, query_string)
+        query.name = name
+        return query
+
+
+def query_name(parameters) -> str:
+    return getattr(parameters, "name", None) or "other"
+
+
+def encode_parameters(parameters) -> str:
+    """
+    The query string of the parameters. Parameters rendered from a
+    QueryTemplate are already encoded and are returned as they are.
+    """
+    if isinstance(parameters, str):
+        return parameters
+    return urllib.parse.urlencode(parameters or {}, quote_via=urllib.parse.quote)
+
+
+class QueryTemplate:
+    """
+    The query parameters of a Decos query. The values may contain {placeholders},
+    such as the bsn or number plate, which are the only parts that are encoded
+    per request; the rest of the query string is encoded once, when the
+    template is created.
+    """
+
+    def __init__(self, name: str, parameters: dict):
+        if name in QUERIES:
+            raise ValueError(f"A Decos query named {name} already exists")
+        self.name = name
+        self.parameters = parameters
+        self._query_string = self._compile(parameters)
+        QUERIES[name] = self
+
+    def render(self, **values) -> Query:
+        """
+        The encoded query string, with the placeholders filled in
+        """
+        return Query(
+            self._query_string.format_map(
+                {key: encode(value) for key, value in values.items()}
+            ),
+            self.name,
+        )
+
+    def _compile(self, parameters: dict) -> str:
+        # The encoded literal text contains no braces, so the encoded string can be
+        # used as a format string with the placeholders left as they are
+        return "&".join(
+            f"{encode(key)}={self._compile_value(value)}"
+            for key, value in parameters.items()
+        )
+
+    def _compile_value(self, value) -> str:
+        compiled = []
+        for literal, field_name, _, _ in Formatter().parse(str(value)):
+            compiled.append(encode(literal))
+            if field_name is not None:
+                compiled.append(f"{{{field_name}}}")
+        return "".join(compiled)
+
+    def __repr__(self):
+        return f"<QueryTemplate {self.name}: {self._query_string}>"
@@ -0,0 +1,180 @@
+"""
+Typed response data of the views. The views build slotted dataclasses, declared
+with `response_type`, and encode them to the json the response serializers
+would render. The str fields are trimmed and checked with the settings of the
+CharFields of the serializer, like the serializers did, but the output is not
+parsed again. The serializers also document the responses in swagger; the
+fields of both are compared in tests/main/test_responses.py.
+"""
+
+import dataclasses
+import types
+from datetime import date, datetime, tzinfo
+from functools import lru_cache
+from typing import Union, get_args, get_origin, get_type_hints
+
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.exceptions import ErrorDetail, ValidationError
+
+
+def encode_datetime(value: datetime | str, tz: tzinfo = None) -> str:
+    """
+    Same as the DateTimeField of DRF: ISO 8601 in the current timezone, with Z
+    for UTC. Naive datetimes are taken to be in the current timezone. Pass the
+    timezone when encoding many values, to look up the current timezone once.
+    """
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return _encode_datetime(value, tz or timezone.get_current_timezone())
+
+
+@lru_cache(maxsize=4096)
+def _encode_datetime(value: datetime, tz: tzinfo) -> str:
+    # The permits in a response share only a few dates
+    if timezone.is_aware(value):
+        value = value.astimezone(tz)
+    else:
+        value = value.replace(tzinfo=tz)
+    value = value.isoformat()
+    if value.endswith("+00:00"):
+        return value[:-6] + "Z"
+    return value
+
+
+def encode_date(value: date | str, tz: tzinfo = None) -> str:
+    """
+    Same as the DateField of DRF: ISO 8601, also for dates that already are a string
+    """
+    if isinstance(value, str):
+        value = date.fromisoformat(value)
+    return value.isoformat()
+
+
+def response_type(serializer_class):
+    """
+    Class decorator that makes the class a slotted dataclass with:
+    - `encode(tz=None)`: the instance as a dict that can be rendered as json,
+      with the datetimes in `tz` (the current timezone by default). The str
+      fields are validated with their CharField in `serializer_class`, raising
+      the same ValidationError.
+    - `from_dict(data)`: an instance from a dict with (at least) its fields,
+      such as the dicts the Decos clients return
+    The converter of every field is looked up once from its type annotation.
+    """
+    serializer_fields = serializer_class().fields
+    return lambda cls: _response_type(cls, serializer_fields)
+
+
+def _response_type(cls, serializer_fields):
+    cls = dataclasses.dataclass(slots=True)(cls)
+    hints = get_type_hints(cls)
+    fields = dataclasses.fields(cls)
+    encoders = [
+        (field.name, _encoder(hints[field.name], serializer_fields[field.name]))
+        for field in fields
+    ]
+    decoders = [(field.name, _decoder(hints[field.name])) for field in fields]
+
+    def encode(self, tz=None):
+        tz = tz or timezone.get_current_timezone()
+        data = {}
+        for name, encode_value in encoders:
+            value = getattr(self, name)
+            data[name] = value if encode_value is None else encode_value(value, tz)
+        return data
+
+    def from_dict(cls, data):
+        return cls(
+            **{
+                name: data[name] if decode is None else decode(data[name])
+                for name, decode in decoders
+            }
+        )
+
+    encode.__qualname__ = f"{cls.__qualname__}.encode"
+    from_dict.__qualname__ = f"{cls.__qualname__}.from_dict"
+    cls.encode = encode
+    cls.from_dict = classmethod(from_dict)
+    return cls
+
+
+def _encoder(hint, serializer_field=None):
+    """
+    The function that encodes a value of type `hint` in a timezone, or None
+    when it can be rendered as it is
+    """
+    origin = get_origin(hint)
+    if origin in (Union, types.UnionType):
+        (hint,) = (arg for arg in get_args(hint) if arg is not types.NoneType)
+        encode = _encoder(hint, serializer_field)
+        if encode is None:
+            return None
+        return lambda value, tz: None if value is None else encode(value, tz)
+    if origin is list:
+        encode = _encoder(get_args(hint)[0])
+        if encode is None:
+            return lambda values, tz: list(values)
+        return lambda values, tz: [encode(value, tz) for value in values]
+    if hint is str and isinstance(serializer_field, serializers.CharField):
+        return _str_encoder(serializer_field)
+    if hint is datetime:
+        return encode_datetime
+    if hint is date:
+        return encode_date
+    if dataclasses.is_dataclass(hint):
+        return hint.encode
+    return None
+
+
+def _str_encoder(field: serializers.CharField):
+    """
+    Encode a str field like its CharField validates it: numbers are converted
+    to str, whitespace is trimmed, and other values, blank values and values of
+    the wrong length are invalid
+    """
+    name = field.field_name
+    trim, allow_blank = field.trim_whitespace, field.allow_blank
+    shortest = field.min_length or 0
+    longest = float("inf") if field.max_length is None else field.max_length
+
+    def fail(key, **kwargs):
+        message = field.error_messages[key].format(**kwargs)
+        raise ValidationError({name: [ErrorDetail(message, code=key)]})
+
+    def encode(value, tz):
+        if type(value) is str:
+            if trim:
+                value = value.strip()
+            if value and shortest <= len(value) <= longest:
+                return value
+        if value is None:
+            fail("null")
+        if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+            fail("invalid")
+        value = str(value)
+        if trim:
+            value = value.strip()
+        if not value:
+            if not allow_blank:
+                fail("blank")
+            return value
+        if len(value) > longest:
+            fail("max_length", max_length=longest)
+        if len(value) < shortest:
+            fail("min_length", min_length=shortest)
+        return value
+
+    return encode
+
+
+def _decoder(hint):
+    """
+    The function that converts a value from a dict to type `hint`, or None
+    when it can be used as it is. Only response types nested in lists are
+    converted, other values are checked when they are encoded.
+    """
+    if get_origin(hint) is list and dataclasses.is_dataclass(get_args(hint)[0]):
+        from_dict = get_args(hint)[0].from_dict
+        return lambda values: [from_dict(value) for value in values]
+    return None
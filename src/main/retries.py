@@ -0,0 +1,82 @@
+import random
+import threading
+from collections import deque
+
+from django.conf import settings
+
+
+class RetryBudget:
+    """
+    Token bucket that limits the retries and hedged requests to Decos to a
+    share of the calls, so they don't multiply the load while Decos is down.
+    Every call adds RATIO of a token, up to CAPACITY tokens, and every retry or
+    hedged request takes a whole token. The budget is shared by all threads of
+    the worker.
+    """
+
+    def __init__(self):
+        self._tokens = None
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(
+                self._get_tokens() + settings.DECOS_RETRY_BUDGET_RATIO,
+                settings.DECOS_RETRY_BUDGET_CAPACITY,
+            )
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            tokens = self._get_tokens()
+            if tokens < 1:
+                return False
+            self._tokens = tokens - 1
+            return True
+
+    def _get_tokens(self) -> float:
+        if self._tokens is None:
+            # The budget starts full
+            self._tokens = settings.DECOS_RETRY_BUDGET_CAPACITY
+        return self._tokens
+
+
+class LatencyTracker:
+    """
+    The durations of the last `size` Decos calls of the worker, to find out
+    when a call is slower than usual
+    """
+
+    min_samples = 20
+
+    def __init__(self, size: int = 1000):
+        self._durations = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, duration: float):
+        with self._lock:
+            self._durations.append(duration)
+
+    def percentile(self, percentile: float) -> float | None:
+        """
+        The duration within which `percentile`% of the calls were done, or None
+        when there are not enough calls yet to tell
+        """
+        with self._lock:
+            durations = sorted(self._durations)
+        if len(durations) < self.min_samples:
+            return None
+        index = min(int(len(durations) * percentile / 100), len(durations) - 1)
+        return durations[index]
+
+
+def backoff_delay(attempt: int) -> float:
+    """
+    Exponential backoff with full jitter: a random delay up to BACKOFF * 2 ** attempt,
+    at most BACKOFF_MAX seconds, so retrying clients don't retry in lockstep
+    """
+    ceiling = settings.DECOS_RETRY_BACKOFF * 2**attempt
+    return random.uniform(0, min(ceiling, settings.DECOS_RETRY_BACKOFF_MAX))
+
+
+retry_budget = RetryBudget()
+latencies = LatencyTracker()
@@ -0,0 +1,72 @@
+"""
+Collects how long the phases of a request take, for the Server-Timing response
+header (see ServerTimingMiddleware). The phases are timed with `timed`, which
+does nothing unless the middleware started collecting for the current request.
+"""
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+_timings = contextvars.ContextVar("server_timings", default=None)
+
+
+class ServerTimings:
+    """
+    The timed phases of one request. Phases without a description that are
+    timed more than once are summed, the others are listed one by one.
+    Phases may be timed from several threads at the same time.
+    """
+
+    def __init__(self):
+        self._phases = {}
+        self._calls = []
+        self._lock = threading.Lock()
+
+    def add(self, name: str, duration: float, description: str = None):
+        with self._lock:
+            if description is None:
+                self._phases[name] = self._phases.get(name, 0) + duration
+            else:
+                self._calls.append((name, description, duration))
+
+    def header_value(self) -> str:
+        with self._lock:
+            entries = [
+                f"{name};dur={duration * 1000:.1f}"
+                for name, duration in self._phases.items()
+            ] + [
+                f'{name};desc="{description}";dur={duration * 1000:.1f}'
+                for name, description, duration in self._calls
+            ]
+        return ", ".join(entries)
+
+
+def start() -> contextvars.Token:
+    """
+    Start collecting the timings of the current request
+    """
+    return _timings.set(ServerTimings())
+
+
+def stop(token: contextvars.Token) -> ServerTimings:
+    timings = _timings.get()
+    _timings.reset(token)
+    return timings
+
+
+@contextmanager
+def timed(name: str, description: str = None):
+    """
+    Time a phase of the current request. Can also be used as decorator
+    """
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - started_at, description)
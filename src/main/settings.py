@@ -43,11 +43,74 @@ DECOS_BASIC_AUTH_USER = os.getenv("DECOS_BASIC_AUTH_USER")
 DECOS_BASIC_AUTH_PASS = os.getenv("DECOS_BASIC_AUTH_PASS")
 DECOS_TAXI_AUTH_USER = os.getenv("DECOS_TAXI_AUTH_USER")
 DECOS_TAXI_AUTH_PASS = os.getenv("DECOS_TAXI_AUTH_PASS")
+
+# Connection pooling towards Decos. Every credential set gets its own session.
+# POOL_CONNECTIONS is the number of hosts kept in the pool, POOL_MAXSIZE the
+# number of connections kept open per host (should be >= the uwsgi threads)
+DECOS_HTTP_POOL_CONNECTIONS = int(os.getenv("DECOS_HTTP_POOL_CONNECTIONS", 2))
+DECOS_HTTP_POOL_MAXSIZE = int(os.getenv("DECOS_HTTP_POOL_MAXSIZE", 10))
+DECOS_HTTP_POOL_BLOCK = os.getenv("DECOS_HTTP_POOL_BLOCK", "false").lower() == "true"
+DECOS_HTTP_KEEP_ALIVE = os.getenv("DECOS_HTTP_KEEP_ALIVE", "true").lower() == "true"
+DECOS_HTTP_ACCEPT_GZIP = os.getenv("DECOS_HTTP_ACCEPT_GZIP", "true").lower() == "true"
+# Serve the async versions of the views. Only useful when running through ASGI
+# (deploy/docker-run-asgi.sh), where one worker can wait for many Decos calls
+ASYNC_VIEWS = os.getenv("ASYNC_VIEWS", "false").lower() == "true"
+DECOS_ASYNC_MAX_CONNECTIONS = int(os.getenv("DECOS_ASYNC_MAX_CONNECTIONS", 100))
+# Circuit breaker per Decos credential set: the circuit opens when FAILURE_THRESHOLD
+# calls fail, or SLOW_CALL_THRESHOLD calls take longer than SLOW_CALL_DURATION
+# seconds, within WINDOW seconds in a worker. Calls are then rejected immediately until
+# RESET_TIMEOUT seconds later HALF_OPEN_PROBES calls are let through to test Decos.
+# Setting both thresholds to 0 disables the circuit breaker
+DECOS_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("DECOS_CIRCUIT_FAILURE_THRESHOLD", 10))
+DECOS_CIRCUIT_SLOW_CALL_THRESHOLD = int(
+    os.getenv("DECOS_CIRCUIT_SLOW_CALL_THRESHOLD", 20)
+)
+DECOS_CIRCUIT_SLOW_CALL_DURATION = float(
+    os.getenv("DECOS_CIRCUIT_SLOW_CALL_DURATION", 3)
+)
+DECOS_CIRCUIT_WINDOW = int(os.getenv("DECOS_CIRCUIT_WINDOW", 30))
+DECOS_CIRCUIT_RESET_TIMEOUT = int(os.getenv("DECOS_CIRCUIT_RESET_TIMEOUT", 30))
+DECOS_CIRCUIT_HALF_OPEN_PROBES = int(os.getenv("DECOS_CIRCUIT_HALF_OPEN_PROBES", 1))
+# Identical Decos calls that are in flight at the same time are made only once by
+# a worker. With COALESCE_ACROSS_WORKERS also once by all workers sharing the cache,
+# where the other workers wait at most COALESCE_TIMEOUT seconds for the result
+DECOS_COALESCE_REQUESTS = os.getenv("DECOS_COALESCE_REQUESTS", "true").lower() == "true"
+DECOS_COALESCE_ACROSS_WORKERS = (
+    os.getenv("DECOS_COALESCE_ACROSS_WORKERS", "false").lower() == "true"
+)
+DECOS_COALESCE_TIMEOUT = int(os.getenv("DECOS_COALESCE_TIMEOUT", 10))
+# Maximum number of Decos calls a worker makes concurrently on behalf of requests
+# that need several independent lookups
+DECOS_MAX_CONCURRENT_REQUESTS = int(os.getenv("DECOS_MAX_CONCURRENT_REQUESTS", 8))
+# Retry Decos calls that failed with a connection error or 5xx response (not the
+# ones that timed out) at most MAX_RETRIES times, after a random delay of up to
+# RETRY_BACKOFF * 2 ** attempt (at most RETRY_BACKOFF_MAX) seconds. With
+# HEDGE_REQUESTS a second request is sent when the first takes longer than
+# HEDGE_PERCENTILE % of the recent calls. Every call adds RETRY_BUDGET_RATIO of a
+# token to a bucket of at most RETRY_BUDGET_CAPACITY tokens, every retry or
+# hedged request takes one, so they can't multiply the load during an outage
+DECOS_MAX_RETRIES = int(os.getenv("DECOS_MAX_RETRIES", 0))
+DECOS_RETRY_BACKOFF = float(os.getenv("DECOS_RETRY_BACKOFF", 0.1))
+DECOS_RETRY_BACKOFF_MAX = float(os.getenv("DECOS_RETRY_BACKOFF_MAX", 2))
+DECOS_HEDGE_REQUESTS = os.getenv("DECOS_HEDGE_REQUESTS", "false").lower() == "true"
+DECOS_HEDGE_PERCENTILE = float(os.getenv("DECOS_HEDGE_PERCENTILE", 95))
+DECOS_RETRY_BUDGET_RATIO = float(os.getenv("DECOS_RETRY_BUDGET_RATIO", 0.1))
+DECOS_RETRY_BUDGET_CAPACITY = int(os.getenv("DECOS_RETRY_BUDGET_CAPACITY", 10))
+# Time budget in seconds for all Decos calls of one API request, which should stay
+# below the uwsgi harakiri (30s) and the timeout of Cleopatra. Every Decos call
+# gets at most the time that is left of it. 0 disables
+DECOS_REQUEST_TIMEOUT = int(os.getenv("DECOS_REQUEST_TIMEOUT", 25))
+
 CLEOPATRA_BASIC_AUTH_USER = os.environ["CLEOPATRA_BASIC_AUTH_USER"]
 CLEOPATRA_BASIC_AUTH_PASS = os.environ["CLEOPATRA_BASIC_AUTH_PASS"]
 
 BASICAUTH_USERS = {CLEOPATRA_BASIC_AUTH_USER: CLEOPATRA_BASIC_AUTH_PASS}
 
+# Add a Server-Timing header with the duration of the phases of every request,
+# or only of the requests with the SERVER_TIMING_TOKEN in the X-Server-Timing header
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "false").lower() == "true"
+SERVER_TIMING_TOKEN = os.getenv("SERVER_TIMING_TOKEN", "")
+
 ALLOWED_HOSTS = ["*"]
 INTERNAL_IPS = ("127.0.0.1", "0.0.0.0")
 
@@ -68,6 +131,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "main.middleware.MetricsMiddleware",
+    "main.middleware.ServerTimingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -102,6 +167,22 @@ FORCE_SCRIPT_NAME = BASE_URL
 
 WSGI_APPLICATION = "main.wsgi.application"
 
+# The json codec of the API and the Decos responses (see main/json_codec.py):
+# "orjson", or "json" of the standard library
+JSON_CODEC = os.getenv("JSON_CODEC", "orjson")
+
+REST_FRAMEWORK = {
+    "DEFAULT_RENDERER_CLASSES": [
+        "main.json_codec.JSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "main.json_codec.JSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
+}
+
 
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
@@ -109,6 +190,80 @@ WSGI_APPLICATION = "main.wsgi.application"
 DATABASES = {}
 
 
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# Local memory by default; point CACHE_BACKEND/CACHE_LOCATION to a shared cache
+# (e.g. redis or memcached) to share cached Decos data between the uwsgi workers
+
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
+    }
+}
+
+# Decos responses are cached per client in the worker (L1, at most MAXSIZE
+# responses) and in the cache above (L2) for TIMEOUT seconds. 0 disables
+DECOS_TAXI_DRIVER_CACHE_TIMEOUT = int(os.getenv("DECOS_TAXI_DRIVER_CACHE_TIMEOUT", 60))
+DECOS_TAXI_DRIVER_CACHE_MAXSIZE = int(
+    os.getenv("DECOS_TAXI_DRIVER_CACHE_MAXSIZE", 1000)
+)
+DECOS_TAXI_DETAIL_CACHE_TIMEOUT = int(os.getenv("DECOS_TAXI_DETAIL_CACHE_TIMEOUT", 60))
+DECOS_TAXI_DETAIL_CACHE_MAXSIZE = int(
+    os.getenv("DECOS_TAXI_DETAIL_CACHE_MAXSIZE", 1000)
+)
+# The decos key of a taxi driver hardly ever changes, so it is cached much longer
+# (by a keyed hash of the bsn). It is looked up again when nothing is found with it
+TAXI_DRIVER_KEY_CACHE_TIMEOUT = int(os.getenv("TAXI_DRIVER_KEY_CACHE_TIMEOUT", 86400))
+# Serve cached responses for STALE_TIMEOUT more seconds after they expired, while
+# they are refreshed in the background (stale-while-revalidate). 0 disables
+DECOS_TAXI_DRIVER_STALE_TIMEOUT = int(os.getenv("DECOS_TAXI_DRIVER_STALE_TIMEOUT", 0))
+DECOS_TAXI_DETAIL_STALE_TIMEOUT = int(os.getenv("DECOS_TAXI_DETAIL_STALE_TIMEOUT", 0))
+DECOS_ZWAARVERKEER_STALE_TIMEOUT = int(os.getenv("DECOS_ZWAARVERKEER_STALE_TIMEOUT", 0))
+# Decos responses without content (no driver, permit or enforcement case found)
+# are cached apart from the responses above, for all clients. 0 disables
+DECOS_NEGATIVE_CACHE_TIMEOUT = int(os.getenv("DECOS_NEGATIVE_CACHE_TIMEOUT", 30))
+DECOS_NEGATIVE_CACHE_MAXSIZE = int(os.getenv("DECOS_NEGATIVE_CACHE_MAXSIZE", 10000))
+# The zwaarverkeer permits already have a dedicated cache (see below)
+DECOS_ZWAARVERKEER_CACHE_TIMEOUT = int(os.getenv("DECOS_ZWAARVERKEER_CACHE_TIMEOUT", 0))
+DECOS_ZWAARVERKEER_CACHE_MAXSIZE = int(
+    os.getenv("DECOS_ZWAARVERKEER_CACHE_MAXSIZE", 1000)
+)
+
+# Maximum time (in seconds) the Decos permits of a number plate are cached for a
+# passage date. Entries expire earlier at the next validity boundary. 0 disables
+ZWAARVERKEER_PERMIT_CACHE_TIMEOUT = int(
+    os.getenv("ZWAARVERKEER_PERMIT_CACHE_TIMEOUT", 300)
+)
+
+
+# Answer passage checks from a local snapshot of all granted permits, synced
+# from Decos every INTERVAL seconds. Decos is asked itself while the snapshot is
+# not synced yet or older than MAX_AGE seconds
+ZWAARVERKEER_SNAPSHOT_ENABLED = (
+    os.getenv("ZWAARVERKEER_SNAPSHOT_ENABLED", "false").lower() == "true"
+)
+ZWAARVERKEER_SNAPSHOT_INTERVAL = int(os.getenv("ZWAARVERKEER_SNAPSHOT_INTERVAL", 300))
+ZWAARVERKEER_SNAPSHOT_MAX_AGE = int(os.getenv("ZWAARVERKEER_SNAPSHOT_MAX_AGE", 900))
+
+
+# Maximum number of passages that can be checked in a single batch request
+ZWAARVERKEER_BATCH_MAX_PASSAGES = int(
+    os.getenv("ZWAARVERKEER_BATCH_MAX_PASSAGES", 1000)
+)
+# Maximum number of different number plates in a batch request. The plates are
+# looked up in Decos concurrently, within the deadline of the request
+ZWAARVERKEER_BATCH_MAX_NUMBER_PLATES = int(
+    os.getenv("ZWAARVERKEER_BATCH_MAX_NUMBER_PLATES", 100)
+)
+# The passages of a number plate on at most this many days are looked up per day,
+# like single passages (and cached). Over more days Decos is queried once for the
+# whole period
+ZWAARVERKEER_BATCH_DAILY_LOOKUPS = int(os.getenv("ZWAARVERKEER_BATCH_DAILY_LOOKUPS", 3))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
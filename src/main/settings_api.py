@@ -0,0 +1,43 @@
+"""
+Settings for serving only the API: the zwaarverkeer and taxi endpoints and the
+status checks. Use it with DJANGO_SETTINGS_MODULE=main.settings_api.
+
+The endpoints are called by other systems with basic auth and only speak json,
+so the sessions, csrf, authentication, messages and clickjacking middleware of
+main.settings are left out, as are the swagger pages. Everything else comes
+from main.settings.
+"""
+
+from main.settings import *  # noqa: F401, F403
+from main.settings import INSTALLED_APPS, TEMPLATES
+
+INSTALLED_APPS = [
+    app
+    for app in INSTALLED_APPS
+    if app not in ("django.contrib.sessions", "django.contrib.messages")
+]
+
+MIDDLEWARE = [
+    "main.middleware.MetricsMiddleware",
+    "main.middleware.ServerTimingMiddleware",
+    "django.middleware.security.SecurityMiddleware",
+    "django.middleware.common.CommonMiddleware",
+    "django_http_exceptions.middleware.ExceptionHandlerMiddleware",
+    "django_http_exceptions.middleware.ThreadLocalRequestMiddleware",
+]
+
+# No html is rendered, apart from the error pages of Django
+TEMPLATES = [{**TEMPLATES[0], "OPTIONS": {"context_processors": []}}]
+
+ROOT_URLCONF = "main.urls_api"
+
+REST_FRAMEWORK = {
+    "DEFAULT_RENDERER_CLASSES": ["main.json_codec.JSONRenderer"],
+    "DEFAULT_PARSER_CLASSES": ["main.json_codec.JSONParser"],
+    "DEFAULT_CONTENT_NEGOTIATION_CLASS": "main.negotiation.JSONContentNegotiation",
+    # The views set their own authentication, and there are no django users
+    "DEFAULT_AUTHENTICATION_CLASSES": [],
+    "DEFAULT_PERMISSION_CLASSES": [],
+    "UNAUTHENTICATED_USER": None,
+    "UNAUTHENTICATED_TOKEN": None,
+}
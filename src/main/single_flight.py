@@ -0,0 +1,88 @@
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+
+from django.core.cache import caches
+
+
+class SingleFlight:
+    """
+    Coalesces identical calls that are in flight at the same time: the first
+    caller of a key runs the function, the other callers of that key wait for
+    it and get the same result or exception. Nothing is kept once the call
+    has finished, so results are never stale. Callers that pass a timeout
+    wait at most that many seconds for the call, then TimeoutError is raised.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, timeout: float = None):
+        with self._lock:
+            future = self._calls.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                self._calls[key] = future
+        if not is_leader:
+            return future.result(timeout)
+
+        try:
+            result = func()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+class SharedSingleFlight:
+    """
+    Coalesces identical calls across workers, through a lock in the (shared)
+    Django cache. The worker that gets the lock runs the function and shares
+    the result under the id of its flight. The others poll for that result
+    until the lock is released, and run the function themselves when the
+    leader failed or took longer than `timeout` seconds.
+    """
+
+    poll_interval = 0.05
+
+    def __init__(self, *, timeout: float, alias: str = "default"):
+        self.timeout = timeout
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def do(self, key, func):
+        lock_key = f"singleflight:{key}"
+        flight_id = uuid.uuid4().hex
+        if self.cache.add(lock_key, flight_id, self.timeout):
+            try:
+                result = func()
+                self.cache.set(f"{lock_key}:{flight_id}", result, self.timeout)
+                return result
+            finally:
+                self.cache.delete(lock_key)
+
+        leader_id = self.cache.get(lock_key)
+        deadline = time.monotonic() + self.timeout
+        while leader_id is not None and time.monotonic() < deadline:
+            result = self.cache.get(f"{lock_key}:{leader_id}")
+            if result is not None:
+                return result
+            if self.cache.get(lock_key) != leader_id:
+                # Released by the leader, check its result one last time
+                result = self.cache.get(f"{lock_key}:{leader_id}")
+                if result is not None:
+                    return result
+                break
+            time.sleep(self.poll_interval)
+        return func()
@@ -0,0 +1,11 @@
+"""
+The URL configuration of main.settings_api: main.urls without the swagger pages
+"""
+
+from django.urls import include, path
+
+urlpatterns = [
+    path("zwaarverkeer/", include("zwaarverkeer.urls")),
+    path("taxi/", include("taxi.urls")),
+    path("status/", include("health.urls")),
+]
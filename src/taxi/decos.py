@@ -1,55 +1,137 @@
 import os
-from datetime import datetime, timedelta
+from datetime import timedelta
 from enum import Enum
 
+from django.core.cache import cache
+from django.utils.crypto import salted_hmac
 from django_http_exceptions import HTTPExceptions
 from odata_request_parser.main import OdataFilterParser
 
-from main import settings
+from main import metrics, server_timing, settings
+from main.dates import parse_decos_date
 from main.decos import DecosBase
+from main.decos_async import AsyncDecosMixin
+from main.queries import QueryTemplate
 from taxi.enums import DecosFolders, DecosZaaknummers, PermitParams
 
 
+class DecosParams(Enum):
+    bsn = "num1"
+    parent_key = "parentkey"
+    afgehandeld = "processed"
+    zaaktype = "text45"
+    ontheffingsnummer = "it_sequence"
+
+
+_odata_filter = OdataFilterParser()
+
+DRIVER_KEY_QUERY = QueryTemplate(
+    "taxi.driver_key",
+    {
+        "properties": "false",
+        "fetchParents": "false",
+        "oDataQuery.select": DecosParams.bsn.value,
+        "oDataQuery.filter": _odata_filter.parse(
+            [{"_eq": {DecosParams.bsn.value: "{bsn}"}}]
+        ),
+    },
+)
+DRIVER_PERMIT_QUERY = QueryTemplate(
+    "taxi.driver_permit",
+    {
+        "properties": "false",
+        "fetchParents": "false",
+        "oDataQuery.filter": _odata_filter.parse(
+            [
+                {"_eq": {DecosParams.zaaktype.value: "TAXXXI Zone-ontheffing"}},
+                {"_eq": {DecosParams.afgehandeld.value: "true"}},
+                {"_eq": {DecosParams.ontheffingsnummer.value: "{ontheffingsnummer}"}},
+            ]
+        ),
+    },
+)
+PERMIT_DETAIL_QUERY = QueryTemplate(
+    "taxi.permit_detail",
+    {
+        "properties": "false",
+        "fetchParents": "false",
+        "oDataQuery.filter": _odata_filter.parse(
+            [
+                {"_eq": {DecosParams.afgehandeld.value: "true"}},
+                {"_eq": {DecosParams.ontheffingsnummer.value: "{ontheffingsnummer}"}},
+            ]
+        ),
+    },
+)
+HANDHAVINGZAKEN_QUERY = QueryTemplate(
+    "taxi.handhavingzaken",
+    {
+        "properties": "false",
+        "fetchParents": "false",
+        "relTypeKey": "FOLDERFOLDEREQU",
+        "oDataQuery.filter": _odata_filter.parse(
+            [
+                {
+                    "_eq": {
+                        DecosParams.parent_key.value: DecosZaaknummers.handhavingszaken.value
+                    }
+                }
+            ]
+        ),
+    },
+)
+
+
 class DecosTaxi(DecosBase):
     auth_user = settings.DECOS_TAXI_AUTH_USER
     auth_pass = settings.DECOS_TAXI_AUTH_PASS
 
-    def _add_enforcement_cases_to_permit_data(self, permit: dict):
-        zaaknummer = permit.pop(PermitParams.zaakidentificatie.name)
-        enforcement_cases_data = self._get_handhavingzaken(permit_decos_key=zaaknummer)
-        enforcement_cases = self._parse_decos_enforcement_cases(enforcement_cases_data)
-        permit["schorsingen"] = enforcement_cases
+    def _add_enforcement_cases_to_permits(self, permits: list[dict]):
+        zaaknummers = [
+            permit.pop(PermitParams.zaakidentificatie.name) for permit in permits
+        ]
+        enforcement_cases_data = self._get_handhavingzaken_per_permit(
+            permit_decos_keys=zaaknummers
+        )
+        for permit, zaaknummer in zip(permits, zaaknummers):
+            permit["schorsingen"] = self._parse_decos_enforcement_cases(
+                enforcement_cases_data[zaaknummer]
+            )
+
+    def _get_handhavingzaken_per_permit(self, permit_decos_keys: list[str]) -> dict:
+        """
+        Get the enforcement cases of several permits, by permit key.
+        Decos only exposes the related cases per permit (the permit key is part
+        of the url), so there is one request per distinct key. Duplicate keys
+        are requested once and the requests are made at the same time.
+        """
+        unique_keys = list(dict.fromkeys(permit_decos_keys))
+        enforcement_cases_data = self._map_concurrently(
+            lambda permit_decos_key: self._get_handhavingzaken(
+                permit_decos_key=permit_decos_key
+            ),
+            unique_keys,
+        )
+        return dict(zip(unique_keys, enforcement_cases_data))
 
     def _get_handhavingzaken(self, permit_decos_key: str) -> dict:
         """
         get the enforcement cases from the driver based on the drivers key
         "handhaving" is synonymous for "schorsing" in this code
         """
+        url, parameters = self._handhavingzaken_request(permit_decos_key)
+        data = self._get_paginated(url, parameters)
+        return data
 
-        class DecosParams(Enum):
-            parent_key = "parentkey"
-
-        odata_filter = OdataFilterParser()
-        filters = [
-            {
-                "_eq": {
-                    DecosParams.parent_key.value: DecosZaaknummers.handhavingszaken.value
-                }
-            }
-        ]
-        parameters = {
-            "properties": "false",
-            "fetchParents": "false",
-            "relTypeKey": "FOLDERFOLDEREQU",
-            "oDataQuery.filter": odata_filter.parse(filters),
-        }
+    def _handhavingzaken_request(self, permit_decos_key: str) -> tuple[str, str]:
+        parameters = HANDHAVINGZAKEN_QUERY.render()
         url = self._build_url(
             zaaknummer=permit_decos_key,
             folder=DecosFolders.folders.value,
         )
-        data = self._get(url, parameters)
-        return data
+        return url, parameters
 
+    @server_timing.timed("interpret")
     def _parse_decos_enforcement_cases(self, data: dict) -> list[dict]:
         try:
             parsed_permits = [
@@ -96,59 +178,97 @@ class DecosTaxi(DecosBase):
         return os.path.join(self.base_url, zaaknummer, folder)
 
     def _parse_datum_vanaf(self, date_string: str) -> str:
-        dt = datetime.fromisoformat(date_string)
-        return dt.strftime("%Y-%m-%d")
+        return parse_decos_date(date_string).isoformat()
 
     def _parse_datum_tot(self, date_string: str) -> str:
         """De datum velden van Decos zijn 'tot en met'. Cleopatra verwacht velden als 'tot'"""
-        dt = datetime.fromisoformat(date_string) + timedelta(days=1)
-        return dt.strftime("%Y-%m-%d")
+        return (parse_decos_date(date_string) + timedelta(days=1)).isoformat()
 
 
 class DecosTaxiDriver(DecosTaxi):
+    cache_timeout = settings.DECOS_TAXI_DRIVER_CACHE_TIMEOUT
+    cache_maxsize = settings.DECOS_TAXI_DRIVER_CACHE_MAXSIZE
+    stale_timeout = settings.DECOS_TAXI_DRIVER_STALE_TIMEOUT
+
     def get_ontheffingen(
         self, *, driver_bsn: str, ontheffingsnummer: str
     ) -> list[dict]:
         """
         request the permit from a driver based on their bsn nr
         """
-        driver_data = self._get_driver_decos_key(driver_bsn)
-        if not driver_data.get("content"):
-            return []
-        driver_key = self._parse_driver_key(driver_data)
-        permits_data = self._get_ontheffing(
-            driver_key=driver_key, ontheffingsnummer=ontheffingsnummer
+        permits_data = self._get_driver_permits(
+            driver_bsn=driver_bsn, ontheffingsnummer=ontheffingsnummer
         )
+        if permits_data is None:
+            return []
         driver_permits = self._parse_decos_permits(
             permits_data, ontheffingsnummer=ontheffingsnummer
         )
-        for permit in driver_permits:
-            self._add_enforcement_cases_to_permit_data(permit)
+        self._add_enforcement_cases_to_permits(driver_permits)
         return driver_permits
 
-    def _get_driver_decos_key(self, driver_bsn: str) -> dict:
+    def _get_driver_permits(self, *, driver_bsn: str, ontheffingsnummer: str):
         """
-        Request the decos key from decosdvl for a driver based on their bsn nr
+        Get the permits data of a driver, or None when Decos doesn't know the
+        driver. The decos key of the driver is taken from the driver key cache
+        when possible. When nothing is found with a cached key, the key may
+        have changed, so it is invalidated and looked up once more.
         """
+        permits_data = None
+        cache_key = self._get_driver_key_cache_key(driver_bsn)
+        cached_driver_key = cache.get(cache_key)
+        metrics.count_cache_lookup(
+            "taxi_driver_key", "miss" if cached_driver_key is None else "hit"
+        )
+        if cached_driver_key is not None:
+            try:
+                permits_data = self._get_ontheffing(
+                    driver_key=cached_driver_key, ontheffingsnummer=ontheffingsnummer
+                )
+            except HTTPExceptions.NOT_FOUND:
+                pass
+            if permits_data and permits_data.get("content"):
+                return permits_data
+            cache.delete(cache_key)
 
-        class DecosParams(Enum):
-            bsn = "num1"
+        driver_data = self._get_driver_decos_key(driver_bsn)
+        if not driver_data.get("content"):
+            return None
+        driver_key = self._parse_driver_key(driver_data)
+        if settings.TAXI_DRIVER_KEY_CACHE_TIMEOUT > 0:
+            cache.set(cache_key, driver_key, settings.TAXI_DRIVER_KEY_CACHE_TIMEOUT)
+        if driver_key == cached_driver_key and permits_data is not None:
+            # The key didn't change, so the (empty) result stands
+            return permits_data
+        return self._get_ontheffing(
+            driver_key=driver_key, ontheffingsnummer=ontheffingsnummer
+        )
 
-        odata_filter = OdataFilterParser()
-        filters = [{"_eq": {DecosParams.bsn.value: driver_bsn}}]
-        parameters = {
-            "properties": "false",
-            "fetchParents": "false",
-            "oDataQuery.select": DecosParams.bsn.value,
-            "oDataQuery.filter": odata_filter.parse(filters),
-        }
+    def _get_driver_decos_key(self, driver_bsn: str) -> dict:
+        """
+        Request the decos key from decosdvl for a driver based on their bsn nr.
+        The response cache is bypassed, the keys are in the driver key cache
+        """
+        url, parameters = self._driver_decos_key_request(driver_bsn)
+        data = self._get(url, parameters, use_cache=False)
+        return data
+
+    def _get_driver_key_cache_key(self, driver_bsn: str) -> str:
+        """
+        Only a keyed hash of the bsn is used, so no bsn ends up in the cache
+        """
+        bsn_hash = salted_hmac(
+            "taxi.driver_key", driver_bsn, algorithm="sha256"
+        ).hexdigest()
+        return f"taxi:driver_key:{bsn_hash}"
 
+    def _driver_decos_key_request(self, driver_bsn: str) -> tuple[str, str]:
+        parameters = DRIVER_KEY_QUERY.render(bsn=driver_bsn)
         url = self._build_url(
             zaaknummer=DecosZaaknummers.bsn.value,
             folder=DecosFolders.taxi.value,
         )
-        data = self._get(url, parameters)
-        return data
+        return url, parameters
 
     def _parse_driver_key(self, data: dict) -> str:
         try:
@@ -159,38 +279,31 @@ class DecosTaxiDriver(DecosTaxi):
             )
 
     def _get_ontheffing(self, *, driver_key: str, ontheffingsnummer: str):
-        class DecosParams(Enum):
-            geldigVanaf = "date6"
-            geldigTot = "date7"
-            afgehandeld = "processed"
-            resultaat = "dfunction"
-            zaaktype = "text45"
-            ontheffingsnummer = "it_sequence"
-
-        odata_filter = OdataFilterParser()
-        filters = [
-            {"_eq": {DecosParams.zaaktype.value: "TAXXXI Zone-ontheffing"}},
-            {"_eq": {DecosParams.afgehandeld.value: "true"}},
-            {"_eq": {DecosParams.ontheffingsnummer.value: ontheffingsnummer}},
-        ]
-        parameters = {
-            "properties": "false",
-            "fetchParents": "false",
-            "oDataQuery.filter": odata_filter.parse(filters),
-        }
+        url, parameters = self._ontheffing_request(
+            driver_key=driver_key, ontheffingsnummer=ontheffingsnummer
+        )
+        data = self._get_paginated(url, parameters)
+        return data
+
+    def _ontheffing_request(
+        self, *, driver_key: str, ontheffingsnummer: str
+    ) -> tuple[str, str]:
+        parameters = DRIVER_PERMIT_QUERY.render(ontheffingsnummer=ontheffingsnummer)
         # Het zaaknummer refereerd in deze URL naar de chauffeur!
         url = self._build_url(zaaknummer=driver_key, folder=DecosFolders.folders.value)
-        data = self._get(url, parameters)
-        return data
+        return url, parameters
 
+    @server_timing.timed("interpret")
     def _parse_decos_permits(self, data: dict, ontheffingsnummer: str) -> list[dict]:
         try:
             parsed_permits = []
             for permit in data["content"]:
-                permit["fields"].update(
-                    {PermitParams.ontheffingsnummer.value: ontheffingsnummer}
-                )
-                parsed_permits.append(self._parse_permit(permit))
+                # Copy the fields, the Decos data may be shared through the cache
+                fields = {
+                    **permit["fields"],
+                    PermitParams.ontheffingsnummer.value: ontheffingsnummer,
+                }
+                parsed_permits.append(self._parse_permit({**permit, "fields": fields}))
             return parsed_permits
         except KeyError as e:
             raise HTTPExceptions.NOT_IMPLEMENTED.with_content(
@@ -199,6 +312,10 @@ class DecosTaxiDriver(DecosTaxi):
 
 
 class DecosTaxiDetail(DecosTaxi):
+    cache_timeout = settings.DECOS_TAXI_DETAIL_CACHE_TIMEOUT
+    cache_maxsize = settings.DECOS_TAXI_DETAIL_CACHE_MAXSIZE
+    stale_timeout = settings.DECOS_TAXI_DETAIL_STALE_TIMEOUT
+
     def get_ontheffingen(self, ontheffingsnummer: str) -> dict:
         data = self._get_ontheffing(ontheffingsnummer)
         if not data.get("content"):
@@ -207,35 +324,23 @@ class DecosTaxiDetail(DecosTaxi):
             )
         detail_permits = self._parse_decos_permits(data)
         permit = detail_permits[0]
-        self._add_enforcement_cases_to_permit_data(permit)
+        self._add_enforcement_cases_to_permits([permit])
         return permit
 
     def _get_ontheffing(self, ontheffingsnummer: str):
-        class DecosParams(Enum):
-            geldigVanaf = "date6"
-            geldigTot = "date7"
-            afgehandeld = "processed"
-            resultaat = "dfunction"
-            zaaktype = "text45"
-            ontheffingsnummer = "it_sequence"
-
-        odata_filter = OdataFilterParser()
-        filters = [
-            {"_eq": {DecosParams.afgehandeld.value: "true"}},
-            {"_eq": {DecosParams.ontheffingsnummer.value: ontheffingsnummer}},
-        ]
-        parameters = {
-            "properties": "false",
-            "fetchParents": "false",
-            "oDataQuery.filter": odata_filter.parse(filters),
-        }
+        url, parameters = self._ontheffing_request(ontheffingsnummer)
+        data = self._get_paginated(url, parameters)
+        return data
+
+    def _ontheffing_request(self, ontheffingsnummer: str) -> tuple[str, str]:
+        parameters = PERMIT_DETAIL_QUERY.render(ontheffingsnummer=ontheffingsnummer)
         url = self._build_url(
             zaaknummer=DecosZaaknummers.zone_ontheffing.value,
             folder=DecosFolders.folders.value,
         )
-        data = self._get(url, parameters)
-        return data
+        return url, parameters
 
+    @server_timing.timed("interpret")
     def _parse_decos_permits(self, data: dict) -> list[dict]:
         try:
             parsed_permits = [self._parse_permit(permit) for permit in data["content"]]
@@ -244,3 +349,94 @@ class DecosTaxiDetail(DecosTaxi):
             raise HTTPExceptions.NOT_IMPLEMENTED.with_content(
                 "Could not parse the ontheffing from Decos"
             ) from e
+
+
+class AsyncDecosTaxi(AsyncDecosMixin, DecosTaxi):
+    async def _aadd_enforcement_cases_to_permits(self, permits: list[dict]):
+        zaaknummers = [
+            permit.pop(PermitParams.zaakidentificatie.name) for permit in permits
+        ]
+        unique_keys = list(dict.fromkeys(zaaknummers))
+        enforcement_cases_data = dict(
+            zip(
+                unique_keys,
+                await self._amap_concurrently(self._aget_handhavingzaken, unique_keys),
+            )
+        )
+        for permit, zaaknummer in zip(permits, zaaknummers):
+            permit["schorsingen"] = self._parse_decos_enforcement_cases(
+                enforcement_cases_data[zaaknummer]
+            )
+
+    async def _aget_handhavingzaken(self, permit_decos_key: str) -> dict:
+        url, parameters = self._handhavingzaken_request(permit_decos_key)
+        return await self._aget_paginated(url, parameters)
+
+
+class AsyncDecosTaxiDriver(AsyncDecosTaxi, DecosTaxiDriver):
+    async def aget_ontheffingen(
+        self, *, driver_bsn: str, ontheffingsnummer: str
+    ) -> list[dict]:
+        permits_data = await self._aget_driver_permits(
+            driver_bsn=driver_bsn, ontheffingsnummer=ontheffingsnummer
+        )
+        if permits_data is None:
+            return []
+        driver_permits = self._parse_decos_permits(
+            permits_data, ontheffingsnummer=ontheffingsnummer
+        )
+        await self._aadd_enforcement_cases_to_permits(driver_permits)
+        return driver_permits
+
+    async def _aget_driver_permits(self, *, driver_bsn: str, ontheffingsnummer: str):
+        permits_data = None
+        cache_key = self._get_driver_key_cache_key(driver_bsn)
+        cached_driver_key = await cache.aget(cache_key)
+        metrics.count_cache_lookup(
+            "taxi_driver_key", "miss" if cached_driver_key is None else "hit"
+        )
+        if cached_driver_key is not None:
+            try:
+                permits_data = await self._aget_ontheffing(
+                    driver_key=cached_driver_key, ontheffingsnummer=ontheffingsnummer
+                )
+            except HTTPExceptions.NOT_FOUND:
+                pass
+            if permits_data and permits_data.get("content"):
+                return permits_data
+            await cache.adelete(cache_key)
+
+        url, parameters = self._driver_decos_key_request(driver_bsn)
+        driver_data = await self._aget(url, parameters, use_cache=False)
+        if not driver_data.get("content"):
+            return None
+        driver_key = self._parse_driver_key(driver_data)
+        if settings.TAXI_DRIVER_KEY_CACHE_TIMEOUT > 0:
+            await cache.aset(
+                cache_key, driver_key, settings.TAXI_DRIVER_KEY_CACHE_TIMEOUT
+            )
+        if driver_key == cached_driver_key and permits_data is not None:
+            return permits_data
+        return await self._aget_ontheffing(
+            driver_key=driver_key, ontheffingsnummer=ontheffingsnummer
+        )
+
+    async def _aget_ontheffing(self, *, driver_key: str, ontheffingsnummer: str):
+        url, parameters = self._ontheffing_request(
+            driver_key=driver_key, ontheffingsnummer=ontheffingsnummer
+        )
+        return await self._aget_paginated(url, parameters)
+
+
+class AsyncDecosTaxiDetail(AsyncDecosTaxi, DecosTaxiDetail):
+    async def aget_ontheffingen(self, ontheffingsnummer: str) -> dict:
+        url, parameters = self._ontheffing_request(ontheffingsnummer)
+        data = await self._aget_paginated(url, parameters)
+        if not data.get("content"):
+            raise HTTPExceptions.NOT_FOUND.with_content(
+                "No data found in Decos for that query"
+            )
+        detail_permits = self._parse_decos_permits(data)
+        permit = detail_permits[0]
+        await self._aadd_enforcement_cases_to_permits([permit])
+        return permit
@@ -0,0 +1,33 @@
+"""
+The response data of the taxi views, see main.responses. The str fields are
+validated with the CharFields of the response serializers.
+"""
+
+from datetime import date
+
+from main.responses import response_type
+from taxi.serializers import (
+    HandhavingSerializer,
+    OntheffingenResponseSerializer,
+    OntheffingResponseSerializer,
+)
+
+
+@response_type(HandhavingSerializer)
+class Handhaving:
+    zaakidentificatie: str
+    geldigVanaf: date
+    geldigTot: date
+
+
+@response_type(OntheffingResponseSerializer)
+class Ontheffing:
+    ontheffingsnummer: str
+    geldigVanaf: date
+    geldigTot: date
+    schorsingen: list[Handhaving]
+
+
+@response_type(OntheffingenResponseSerializer)
+class OntheffingenResponse:
+    ontheffing: list[Ontheffing]
@@ -1,16 +1,24 @@
+from django.conf import settings
 from django.urls import path
 
 from . import views
 
+if settings.ASYNC_VIEWS:
+    OntheffingenBSNView = views.AsyncOntheffingenBSNView
+    OntheffingDetailView = views.AsyncOntheffingDetailView
+else:
+    OntheffingenBSNView = views.OntheffingenBSNView
+    OntheffingDetailView = views.OntheffingDetailView
+
 urlpatterns = [
     path(
         "ontheffingen/",
-        views.OntheffingenBSNView.as_view(),
+        OntheffingenBSNView.as_view(),
         name="taxi_ontheffingen_bsn",
     ),
     path(
         "ontheffingen/<str:ontheffingsnummer>/",
-        views.OntheffingDetailView.as_view(),
+        OntheffingDetailView.as_view(),
         name="taxi_ontheffing_details",
     ),
 ]
@@ -1,13 +1,22 @@
 import logging
 
+from adrf.views import APIView as AsyncAPIView
 from braces.views import CsrfExemptMixin
 from django.http import HttpRequest
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from main import server_timing
 from main.authentication import BasicAuthWithKeys
-from taxi.decos import DecosTaxiDetail, DecosTaxiDriver
+from main.decos import get_deadline, set_stale_header
+from taxi.decos import (
+    AsyncDecosTaxiDetail,
+    AsyncDecosTaxiDriver,
+    DecosTaxiDetail,
+    DecosTaxiDriver,
+)
+from taxi.responses import Ontheffing, OntheffingenResponse
 from taxi.serializers import (
     OntheffingenRequestSerializer,
     OntheffingenResponseSerializer,
@@ -33,17 +42,20 @@ class OntheffingenBSNView(CsrfExemptMixin, APIView):
         bsn nr
         """
         serializer = OntheffingenRequestSerializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
+        with server_timing.timed("validate"):
+            serializer.is_valid(raise_exception=True)
 
         bsn = serializer.validated_data["bsn"]
         ontheffingsnummer = serializer.validated_data["ontheffingsnummer"]
-        decos = DecosTaxiDriver()
+        decos = DecosTaxiDriver(deadline=get_deadline())
         data = decos.get_ontheffingen(
             driver_bsn=bsn, ontheffingsnummer=ontheffingsnummer
         )
-        response_serializer = OntheffingenResponseSerializer(data={"ontheffing": data})
-        response_serializer.is_valid(raise_exception=True)
-        return Response(response_serializer.data)
+        with server_timing.timed("serialize"):
+            response_data = OntheffingenResponse(
+                ontheffing=[Ontheffing.from_dict(permit) for permit in data]
+            ).encode()
+        return set_stale_header(Response(response_data), decos)
 
 
 class OntheffingDetailView(CsrfExemptMixin, APIView):
@@ -60,8 +72,57 @@ class OntheffingDetailView(CsrfExemptMixin, APIView):
         create a proxy request to decos to query the 'handhavingen' permits
         Based on the 'ontheffingsnummer' retrieve all the 'handhavingen'
         """
-        decos = DecosTaxiDetail()
+        decos = DecosTaxiDetail(deadline=get_deadline())
         data = decos.get_ontheffingen(ontheffingsnummer=ontheffingsnummer)
-        response_serializer = OntheffingResponseSerializer(data=data)
-        response_serializer.is_valid(raise_exception=True)
-        return Response(response_serializer.data)
+        with server_timing.timed("serialize"):
+            response_data = Ontheffing.from_dict(data).encode()
+        return set_stale_header(Response(response_data), decos)
+
+
+class AsyncOntheffingenBSNView(CsrfExemptMixin, AsyncAPIView):
+    """
+    Async version of the OntheffingenBSNView, used when served through ASGI
+    """
+
+    http_method_names = ["post"]
+    authentication_classes = [BasicAuthWithKeys]
+
+    @swagger_auto_schema(
+        request_body=OntheffingenRequestSerializer,
+        responses={200: OntheffingenResponseSerializer},
+    )
+    async def post(self, request: HttpRequest):
+        serializer = OntheffingenRequestSerializer(data=request.data)
+        with server_timing.timed("validate"):
+            serializer.is_valid(raise_exception=True)
+
+        bsn = serializer.validated_data["bsn"]
+        ontheffingsnummer = serializer.validated_data["ontheffingsnummer"]
+        decos = AsyncDecosTaxiDriver(deadline=get_deadline())
+        data = await decos.aget_ontheffingen(
+            driver_bsn=bsn, ontheffingsnummer=ontheffingsnummer
+        )
+        with server_timing.timed("serialize"):
+            response_data = OntheffingenResponse(
+                ontheffing=[Ontheffing.from_dict(permit) for permit in data]
+            ).encode()
+        return set_stale_header(Response(response_data), decos)
+
+
+class AsyncOntheffingDetailView(CsrfExemptMixin, AsyncAPIView):
+    """
+    Async version of the OntheffingDetailView, used when served through ASGI
+    """
+
+    http_method_names = ["get"]
+    authentication_classes = [BasicAuthWithKeys]
+
+    @swagger_auto_schema(
+        responses={200: OntheffingResponseSerializer},
+    )
+    async def get(self, request, ontheffingsnummer: str):
+        decos = AsyncDecosTaxiDetail(deadline=get_deadline())
+        data = await decos.aget_ontheffingen(ontheffingsnummer=ontheffingsnummer)
+        with server_timing.timed("serialize"):
+            response_data = Ontheffing.from_dict(data).encode()
+        return set_stale_header(Response(response_data), decos)
@@ -1,14 +1,19 @@
 import logging
 import os
-from datetime import timedelta
+from collections import defaultdict
+from datetime import datetime, time, timedelta
 from enum import Enum
 
-from dateutil import parser
 from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
 from odata_request_parser.main import OdataFilterParser, OdataSelectParser
 
+from main import metrics, server_timing
+from main.dates import parse_local_datetime
 from main.decos import DecosBase
+from main.decos_async import AsyncDecosMixin
+from main.queries import QueryTemplate
 
 log = logging.getLogger(__name__)
 
@@ -25,83 +30,228 @@ class DecosParams(Enum):
     PERMIT_RESULT = "dfunction"  # this is whether the permit was given or denied
 
 
+PERMITS_QUERY = QueryTemplate(
+    "zwaarverkeer.permits",
+    {
+        "select": OdataSelectParser()
+        .add_fields([str(p.value) for p in DecosParams])
+        .parse(),
+        "filter": OdataFilterParser().parse(
+            [
+                {"_has": {DecosParams.NUMBER_PLATE.value: "{number_plate}"}},
+                {"_eq": {DecosParams.PERMIT_PROCESSED.value: "J"}},
+                {"_eq": {DecosParams.PERMIT_RESULT.value: "Verleend"}},
+                {"_le": {DecosParams.PERMIT_VALID_FROM.value: "{valid_from}"}},
+                {"_ge": {DecosParams.PERMIT_VALID_UNTIL.value: "{valid_until}"}},
+            ]
+        ),
+    },
+)
+
+
 class DecosZwaarverkeer(DecosBase):
     auth_user = settings.DECOS_BASIC_AUTH_USER
     auth_pass = settings.DECOS_BASIC_AUTH_PASS
     zwaar_verkeer_zaaknr = settings.ZWAAR_VERKEER_ZAAKNUMMER
+    cache_timeout = settings.DECOS_ZWAARVERKEER_CACHE_TIMEOUT
+    cache_maxsize = settings.DECOS_ZWAARVERKEER_CACHE_MAXSIZE
+    stale_timeout = settings.DECOS_ZWAARVERKEER_STALE_TIMEOUT
 
     def get_permits(self, *, number_plate, passage_at):
         if timezone.is_naive(passage_at):
             passage_at = timezone.make_aware(passage_at)
 
+        content = self._get_permit_content(
+            number_plate=number_plate, passage_at=passage_at
+        )
+        if not content:
+            return []
+
+        permits = self._interpret_permits(content, passage_at)
+        return permits
+
+    def get_permits_batch(self, *, passages):
+        """
+        Get the valid permits for a list of passages, given as dicts with a
+        number_plate and passage_at. The number plates are looked up in Decos
+        concurrently, after which every passage is checked locally.
+        Returns the list of permits of every passage, in the same order.
+        """
+        passages_per_plate = defaultdict(list)
+        for index, passage in enumerate(passages):
+            passage_at = passage["passage_at"]
+            if timezone.is_naive(passage_at):
+                passage_at = timezone.make_aware(passage_at)
+            passages_per_plate[passage["number_plate"]].append((index, passage_at))
+
+        permits_per_passage = [None] * len(passages)
+        plate_permits = self._map_concurrently(
+            lambda item: self._get_plate_permits(*item), passages_per_plate.items()
+        )
+        for permits_per_index in plate_permits:
+            for index, permits in permits_per_index:
+                permits_per_passage[index] = permits
+        return permits_per_passage
+
+    def _get_plate_permits(self, number_plate, plate_passages):
+        """
+        The permits of the passages of one number plate, as (index, permits).
+        Passages on a few days are looked up per day, sharing the cache of the
+        single passage checks. Passages on more days than
+        ZWAARVERKEER_BATCH_DAILY_LOOKUPS are looked up with one query for the
+        whole period.
+        """
+        passage_days = {passage_at.date() for _, passage_at in plate_passages}
+        if len(passage_days) <= settings.ZWAARVERKEER_BATCH_DAILY_LOOKUPS:
+            content_per_day = {}
+            for _, passage_at in plate_passages:
+                if passage_at.date() not in content_per_day:
+                    content_per_day[passage_at.date()] = self._get_permit_content(
+                        number_plate=number_plate, passage_at=passage_at
+                    )
+        else:
+            passage_dates = [passage_at for _, passage_at in plate_passages]
+            content = self._get_permit_content_for_period(
+                number_plate=number_plate,
+                first_passage_at=min(passage_dates),
+                last_passage_at=max(passage_dates),
+            )
+            content_per_day = dict.fromkeys(passage_days, content)
+
+        permits_per_index = []
+        for index, passage_at in plate_passages:
+            content = content_per_day[passage_at.date()]
+            permits = self._interpret_permits(content, passage_at) if content else []
+            permits_per_index.append((index, permits))
+        return permits_per_index
+
+    def _get_permit_content_for_period(
+        self, *, number_plate, first_passage_at, last_passage_at
+    ):
+        _, valid_until = self._get_date_strings(first_passage_at)
+        valid_from, _ = self._get_date_strings(last_passage_at)
+        params = self._get_params(
+            number_plate=number_plate, valid_from=valid_from, valid_until=valid_until
+        )
+        return list(self._iter_items(url=self._build_url(), parameters=params))
+
+    def _get_permit_content(self, *, number_plate, passage_at):
+        """
+        Get the raw Decos permits for the number plate on the day of the passage.
+        The permits are cached per plate and day, so other passages of the same
+        vehicle on that day don't need another request to Decos
+        """
         valid_from, valid_until = self._get_date_strings(passage_at)
+        cache_key = self._get_permit_cache_key(number_plate, valid_from)
+        content = cache.get(cache_key)
+        metrics.count_cache_lookup(
+            "zwaarverkeer_permits", "miss" if content is None else "hit"
+        )
+        if content is not None:
+            return content
+
         url = self._build_url()
         params = self._get_params(
             number_plate=number_plate, valid_from=valid_from, valid_until=valid_until
         )
-        response = self._get(url=url, parameters=params)
-        content = response.get("content")
-        if not content or not isinstance(content, list):
-            return []
+        content = list(self._iter_items(url=url, parameters=params))
 
-        permits = self._interpret_permits(content, passage_at)
-        return permits
+        cache_timeout = self._get_cache_timeout(content)
+        # Stale data is refreshed in the background, so it is not cached again
+        if cache_timeout > 0 and not self.served_stale:
+            cache.set(cache_key, content, cache_timeout)
+        return content
+
+    def _get_permit_cache_key(self, number_plate, valid_from):
+        return f"zwaarverkeer:permits:{number_plate}:{valid_from}"
+
+    def _get_cache_timeout(self, content):
+        """
+        Cached permits expire at the next moment the validity of a permit can change:
+        midnight for year and route permits, 06:00 for day permits.
+        """
+        now = timezone.localtime()
+        boundary = timezone.make_aware(
+            datetime.combine(now.date() + timedelta(days=1), time())
+        )
+        has_day_permit = any(
+            "dagontheffing"
+            in (permit_info["fields"].get(DecosParams.PERMIT_TYPE.value) or "").lower()
+            for permit_info in content
+        )
+        if has_day_permit:
+            day_permit_cutoff = timezone.make_aware(
+                datetime.combine(now.date(), time(hour=6))
+            )
+            if day_permit_cutoff <= now:
+                day_permit_cutoff += timedelta(days=1)
+            boundary = min(boundary, day_permit_cutoff)
+
+        seconds_until_boundary = int((boundary - now).total_seconds())
+        return min(settings.ZWAARVERKEER_PERMIT_CACHE_TIMEOUT, seconds_until_boundary)
 
     def _get_params(self, number_plate, valid_from, valid_until):
-        select_parser = OdataSelectParser()
-        filter_parser = OdataFilterParser()
-        select_parser.add_fields([str(p.value) for p in DecosParams])
-        filters = [
-            {"_has": {DecosParams.NUMBER_PLATE.value: number_plate}},
-            {"_eq": {DecosParams.PERMIT_PROCESSED.value: "J"}},
-            {"_eq": {DecosParams.PERMIT_RESULT.value: "Verleend"}},
-            {"_le": {DecosParams.PERMIT_VALID_FROM.value: valid_from}},
-            {"_ge": {DecosParams.PERMIT_VALID_UNTIL.value: valid_until}},
-        ]
-        params = {
-            "select": select_parser.parse(),
-            "filter": filter_parser.parse(filters),
-        }
-        return params
+        return PERMITS_QUERY.render(
+            number_plate=number_plate, valid_from=valid_from, valid_until=valid_until
+        )
 
     def _build_url(self):
         return os.path.join(self.base_url, settings.ZWAAR_VERKEER_ZAAKNUMMER, "FOLDERS")
 
+    @server_timing.timed("interpret")
     def _interpret_permits(self, content, passage_at):
-        permits = []
-        for permit_info in content:
-            fields = permit_info["fields"]
-            permit_type = fields.get(DecosParams.PERMIT_TYPE.value)
-            permit_description = fields.get(DecosParams.PERMIT_DESCRIPTION.value)
-            valid_from = timezone.make_aware(
-                parser.parse(fields[DecosParams.PERMIT_VALID_FROM.value])
-            )
-            valid_until = timezone.make_aware(
-                parser.parse(fields[DecosParams.PERMIT_VALID_UNTIL.value])
-            )
+        return list(self._iter_valid_permits(content, passage_at))
 
-            if not permit_type:
-                # We have no permit type, so we cannot determine whether this permit is
-                # actually valid, AND we cannot determine the correct valid_until time.
-                # Therefor we disregard this permit by continuing to the next one.
+    def _iter_valid_permits(self, content, passage_at):
+        """
+        Lazily yield the permits in the content which are valid for the passage
+        """
+        tz = timezone.get_current_timezone()
+        for permit_info in content:
+            permit_dict = self._parse_permit(permit_info, tz)
+            if permit_dict is None:
                 continue
 
-            # Set correct validity of the permit: day permits are valid until 06:00 the day after, and year and
-            # route permits are valid until the end of the last day (so 00:00:00 the next day)
-            valid_until = self._get_valid_until(
-                permit_type=permit_type, valid_until=valid_until
-            )
-
             # Check whether this permit is valid for the passage
-            if passage_at >= valid_from and passage_at < valid_until:
-                permit_dict = {
-                    "permit_type": permit_type,
-                    "permit_description": permit_description,
-                    "valid_from": valid_from,
-                    "valid_until": valid_until,
-                }
-                permits.append(permit_dict)
-        return permits
+            if (
+                passage_at >= permit_dict["valid_from"]
+                and passage_at < permit_dict["valid_until"]
+            ):
+                yield permit_dict
+
+    def _parse_permit(self, permit_info, tz):
+        """
+        Parse a raw Decos permit into a permit dict with its actual validity,
+        or None when the validity of the permit cannot be determined
+        """
+        fields = permit_info["fields"]
+        permit_type = fields.get(DecosParams.PERMIT_TYPE.value)
+        permit_description = fields.get(DecosParams.PERMIT_DESCRIPTION.value)
+
+        if not permit_type:
+            # We have no permit type, so we cannot determine whether this permit is
+            # actually valid, AND we cannot determine the correct valid_until time.
+            # Therefor we disregard this permit.
+            return None
+
+        valid_from = parse_local_datetime(
+            fields[DecosParams.PERMIT_VALID_FROM.value], tz
+        )
+        valid_until = parse_local_datetime(
+            fields[DecosParams.PERMIT_VALID_UNTIL.value], tz
+        )
+
+        # Set correct validity of the permit: day permits are valid until 06:00 the day after, and year and
+        # route permits are valid until the end of the last day (so 00:00:00 the next day)
+        valid_until = self._get_valid_until(
+            permit_type=permit_type, valid_until=valid_until
+        )
+        return {
+            "permit_type": permit_type,
+            "permit_description": permit_description,
+            "valid_from": valid_from,
+            "valid_until": valid_until,
+        }
 
     def _get_valid_until(self, permit_type, valid_until):
         valid_until = valid_until + timedelta(days=1)
@@ -119,3 +269,39 @@ class DecosZwaarverkeer(DecosBase):
         # That way we can loop over them and check whether they are day permits and if so they are also valid
         valid_until = (passage_at.date() - timedelta(days=1)).isoformat()
         return valid_from, valid_until
+
+
+class AsyncDecosZwaarverkeer(AsyncDecosMixin, DecosZwaarverkeer):
+    async def aget_permits(self, *, number_plate, passage_at):
+        if timezone.is_naive(passage_at):
+            passage_at = timezone.make_aware(passage_at)
+
+        content = await self._aget_permit_content(
+            number_plate=number_plate, passage_at=passage_at
+        )
+        if not content:
+            return []
+
+        permits = self._interpret_permits(content, passage_at)
+        return permits
+
+    async def _aget_permit_content(self, *, number_plate, passage_at):
+        valid_from, valid_until = self._get_date_strings(passage_at)
+        cache_key = self._get_permit_cache_key(number_plate, valid_from)
+        content = await cache.aget(cache_key)
+        metrics.count_cache_lookup(
+            "zwaarverkeer_permits", "miss" if content is None else "hit"
+        )
+        if content is not None:
+            return content
+
+        url = self._build_url()
+        params = self._get_params(
+            number_plate=number_plate, valid_from=valid_from, valid_until=valid_until
+        )
+        content = [item async for item in self._aiter_items(url=url, parameters=params)]
+
+        cache_timeout = self._get_cache_timeout(content)
+        if cache_timeout > 0 and not self.served_stale:
+            await cache.aset(cache_key, content, cache_timeout)
+        return content
@@ -0,0 +1,34 @@
+"""
+The response data of the zwaarverkeer views, see main.responses. The str
+fields are validated with the CharFields of the response serializers.
+"""
+
+from datetime import datetime
+
+from main.responses import response_type
+from zwaarverkeer.serializers import (
+    PermitsBatchResponseSerializer,
+    PermitSerializer,
+    PermitsResponseSerializer,
+)
+
+
+@response_type(PermitSerializer)
+class Permit:
+    permit_type: str | None
+    permit_description: str | None
+    valid_from: datetime
+    valid_until: datetime
+
+
+@response_type(PermitsResponseSerializer)
+class PermitsResponse:
+    number_plate: str
+    passage_at: datetime
+    has_permit: bool
+    permits: list[Permit]
+
+
+@response_type(PermitsBatchResponseSerializer)
+class PermitsBatchResponse:
+    passages: list[PermitsResponse]
@@ -1,3 +1,4 @@
+from django.conf import settings
 from rest_framework import serializers
 
 
@@ -8,7 +9,7 @@ class PermitsRequestSerializer(serializers.Serializer):
 
 class PermitSerializer(serializers.Serializer):
     permit_type = serializers.CharField(required=False, allow_null=True)
-    permit_description = serializers.CharField(required=False)
+    permit_description = serializers.CharField(required=False, allow_null=True)
     valid_from = serializers.DateTimeField(required=True)
     valid_until = serializers.DateTimeField(required=True)
 
@@ -18,3 +19,25 @@ class PermitsResponseSerializer(serializers.Serializer):
     passage_at = serializers.DateTimeField()
     has_permit = serializers.BooleanField()
     permits = PermitSerializer(many=True)
+
+
+class PermitsBatchRequestSerializer(serializers.Serializer):
+    passages = PermitsRequestSerializer(
+        many=True,
+        allow_empty=False,
+        max_length=settings.ZWAARVERKEER_BATCH_MAX_PASSAGES,
+    )
+
+    def validate_passages(self, passages):
+        number_plates = {passage["number_plate"].upper() for passage in passages}
+        max_number_plates = settings.ZWAARVERKEER_BATCH_MAX_NUMBER_PLATES
+        if len(number_plates) > max_number_plates:
+            raise serializers.ValidationError(
+                f"Ensure this field has no more than {max_number_plates} "
+                "different number plates."
+            )
+        return passages
+
+
+class PermitsBatchResponseSerializer(serializers.Serializer):
+    passages = PermitsResponseSerializer(many=True)
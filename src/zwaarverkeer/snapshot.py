@@ -0,0 +1,195 @@
+import logging
+import os
+import re
+import threading
+import time
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from odata_request_parser.main import OdataFilterParser, OdataSelectParser
+
+from main import server_timing
+from main.queries import QueryTemplate
+from zwaarverkeer.decos import DecosParams, DecosZwaarverkeer
+
+log = logging.getLogger(__name__)
+
+# All granted permits which are still valid on or after {valid_until}
+SNAPSHOT_QUERY = QueryTemplate(
+    "zwaarverkeer.snapshot",
+    {
+        "select": OdataSelectParser()
+        .add_fields([str(p.value) for p in DecosParams])
+        .parse(),
+        "filter": OdataFilterParser().parse(
+            [
+                {"_eq": {DecosParams.PERMIT_PROCESSED.value: "J"}},
+                {"_eq": {DecosParams.PERMIT_RESULT.value: "Verleend"}},
+                {"_ge": {DecosParams.PERMIT_VALID_UNTIL.value: "{valid_until}"}},
+            ]
+        ),
+    },
+)
+
+NUMBER_PLATE_SEPARATORS = re.compile(r"[\s,;]+")
+
+
+def split_number_plates(value):
+    """
+    Get the number plates of a permit, which may have been given for several
+    vehicles at once
+    """
+    return [plate for plate in NUMBER_PLATE_SEPARATORS.split(value.upper()) if plate]
+
+
+class PermitIndex:
+    """
+    The valid permits per number plate, sorted by the start of their (already
+    adjusted) validity, so the permits that started before a passage are found
+    by bisection. The index only holds permits that were still valid on the day
+    before `covers_from`, so it can only answer passages from that day on.
+    Number plates without permits in the index may have been granted one since
+    the sync, so they are not answered either.
+    """
+
+    def __init__(self, permits_per_plate, covers_from):
+        self.covers_from = covers_from
+        self._permits = {}
+        self._starts = {}
+        for number_plate, permits in permits_per_plate.items():
+            permits = sorted(permits, key=lambda permit: permit["valid_from"])
+            self._permits[number_plate] = permits
+            self._starts[number_plate] = [permit["valid_from"] for permit in permits]
+
+    def __len__(self):
+        return len(self._permits)
+
+    def covers(self, passage_at) -> bool:
+        return timezone.localdate(passage_at) >= self.covers_from
+
+    @server_timing.timed("snapshot")
+    def get_permits(self, *, number_plate, passage_at):
+        starts = self._starts.get(number_plate)
+        if starts is None:
+            return None
+        started = bisect_right(starts, passage_at)
+        return [
+            permit
+            for permit in self._permits[number_plate][:started]
+            if passage_at < permit["valid_until"]
+        ]
+
+
+class SnapshotDecosZwaarverkeer(DecosZwaarverkeer):
+    page_size = 500
+
+
+class PermitSnapshot:
+    """
+    A local copy of all granted zwaarverkeer permits, so passages can be checked
+    without a request to Decos. The snapshot is synced every INTERVAL seconds by
+    a background thread, which is started in the worker that first uses it
+    (threads don't survive the fork of the uWSGI workers). Each sync replaces
+    the whole index at once, so readers never see a half synced index.
+
+    get_permits returns None when the snapshot cannot answer a passage: when it
+    is disabled, not synced yet, older than MAX_AGE seconds, the passage is
+    from before the synced period or the number plate had no permits when it
+    was synced. The caller should then ask Decos itself.
+    """
+
+    def __init__(self):
+        self.index = None
+        self.synced_at = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return settings.ZWAARVERKEER_SNAPSHOT_ENABLED
+
+    def get_permits(self, *, number_plate, passage_at):
+        if not self.enabled:
+            return None
+        self.start()
+
+        index = self.get_index()
+        if timezone.is_naive(passage_at):
+            passage_at = timezone.make_aware(passage_at)
+        if index is None or not index.covers(passage_at):
+            return None
+        return index.get_permits(number_plate=number_plate, passage_at=passage_at)
+
+    def get_index(self):
+        if self.synced_at is None:
+            return None
+        age = time.monotonic() - self.synced_at
+        if age > settings.ZWAARVERKEER_SNAPSHOT_MAX_AGE:
+            return None
+        return self.index
+
+    def sync(self):
+        """
+        Fetch all permits that are still valid since yesterday from Decos, and
+        replace the index with them
+        """
+        started_at = time.monotonic()
+        covers_from = timezone.localdate()
+        decos = SnapshotDecosZwaarverkeer()
+        params = SNAPSHOT_QUERY.render(
+            valid_until=(covers_from - timedelta(days=1)).isoformat()
+        )
+        content = decos._iter_items(
+            url=decos._build_url(), parameters=params, use_cache=False
+        )
+
+        tz = timezone.get_current_timezone()
+        permits_per_plate = defaultdict(list)
+        for permit_info in content:
+            permit_dict = decos._parse_permit(permit_info, tz)
+            number_plates = permit_info["fields"].get(DecosParams.NUMBER_PLATE.value)
+            for number_plate in split_number_plates(number_plates or ""):
+                # Plates of disregarded permits are known to have no permit
+                plate_permits = permits_per_plate[number_plate]
+                if permit_dict is not None:
+                    plate_permits.append(permit_dict)
+
+        self.index = PermitIndex(permits_per_plate, covers_from)
+        self.synced_at = time.monotonic()
+        log.info(
+            f"Synced the permits of {len(self.index)} number plates "
+            f"in {self.synced_at - started_at:.1f}s"
+        )
+
+    def start(self):
+        """
+        Start the sync thread in this process, unless it is already running
+        """
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Forget the index and thread of the process this one was forked from
+            self.index = None
+            self.synced_at = None
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name="zwaarverkeer-snapshot", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.sync()
+            except Exception:
+                log.exception("Unable to sync the zwaarverkeer permits")
+            time.sleep(settings.ZWAARVERKEER_SNAPSHOT_INTERVAL)
+
+
+permit_snapshot = PermitSnapshot()
@@ -1,7 +1,15 @@
+from django.conf import settings
 from django.urls import path
 
 from . import views
 
+PermitView = views.AsyncPermitView if settings.ASYNC_VIEWS else views.PermitView
+
 urlpatterns = [
-    path("get_permits/", views.PermitView.as_view(), name="zwaarverkeer_permit"),
+    path("get_permits/", PermitView.as_view(), name="zwaarverkeer_permit"),
+    path(
+        "get_permits/batch/",
+        views.PermitBatchView.as_view(),
+        name="zwaarverkeer_permit_batch",
+    ),
 ]
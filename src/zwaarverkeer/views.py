@@ -1,14 +1,24 @@
 import logging
 
+from adrf.views import APIView as AsyncAPIView
 from braces.views import CsrfExemptMixin
 from dateutil import parser
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from main import server_timing
 from main.authentication import BasicAuthWithKeys
-from zwaarverkeer.decos import DecosZwaarverkeer
-from zwaarverkeer.serializers import PermitsRequestSerializer, PermitsResponseSerializer
+from main.decos import get_deadline, set_stale_header
+from zwaarverkeer.decos import AsyncDecosZwaarverkeer, DecosZwaarverkeer
+from zwaarverkeer.responses import Permit, PermitsBatchResponse, PermitsResponse
+from zwaarverkeer.serializers import (
+    PermitsBatchRequestSerializer,
+    PermitsBatchResponseSerializer,
+    PermitsRequestSerializer,
+    PermitsResponseSerializer,
+)
+from zwaarverkeer.snapshot import permit_snapshot
 
 log = logging.getLogger(__name__)
 
@@ -23,19 +33,119 @@ class PermitView(CsrfExemptMixin, APIView):
     )
     def post(self, request):
         request_serializer = PermitsRequestSerializer(data=request.data)
-        request_serializer.is_valid(raise_exception=True)
+        with server_timing.timed("validate"):
+            request_serializer.is_valid(raise_exception=True)
 
-        number_plate = request.data["number_plate"].upper()
+        number_plate = request_serializer.validated_data["number_plate"].upper()
         passage_at = parser.parse(request.data["passage_at"])  # naive local datetime?
 
-        decos = DecosZwaarverkeer()
-        permits = decos.get_permits(number_plate=number_plate, passage_at=passage_at)
-        response = {
-            "number_plate": number_plate,
-            "passage_at": request.data["passage_at"],
-            "has_permit": len(permits) > 0,
-            "permits": permits,
-        }
-        response_serializer = PermitsResponseSerializer(data=response)
-        response_serializer.is_valid(raise_exception=True)
-        return Response(response_serializer.data)
+        decos = DecosZwaarverkeer(deadline=get_deadline())
+        permits = permit_snapshot.get_permits(
+            number_plate=number_plate, passage_at=passage_at
+        )
+        if permits is None:
+            permits = decos.get_permits(
+                number_plate=number_plate, passage_at=passage_at
+            )
+        with server_timing.timed("serialize"):
+            response_data = PermitsResponse(
+                number_plate=number_plate,
+                passage_at=request_serializer.validated_data["passage_at"],
+                has_permit=len(permits) > 0,
+                permits=[Permit.from_dict(permit) for permit in permits],
+            ).encode()
+        return set_stale_header(Response(response_data), decos)
+
+
+class AsyncPermitView(CsrfExemptMixin, AsyncAPIView):
+    """
+    Async version of the PermitView, used when served through ASGI
+    """
+
+    http_method_names = ["post"]
+    authentication_classes = [BasicAuthWithKeys]
+
+    @swagger_auto_schema(
+        request_body=PermitsRequestSerializer,
+        responses={200: PermitsResponseSerializer},
+    )
+    async def post(self, request):
+        request_serializer = PermitsRequestSerializer(data=request.data)
+        with server_timing.timed("validate"):
+            request_serializer.is_valid(raise_exception=True)
+
+        number_plate = request_serializer.validated_data["number_plate"].upper()
+        passage_at = parser.parse(request.data["passage_at"])
+
+        decos = AsyncDecosZwaarverkeer(deadline=get_deadline())
+        permits = permit_snapshot.get_permits(
+            number_plate=number_plate, passage_at=passage_at
+        )
+        if permits is None:
+            permits = await decos.aget_permits(
+                number_plate=number_plate, passage_at=passage_at
+            )
+        with server_timing.timed("serialize"):
+            response_data = PermitsResponse(
+                number_plate=number_plate,
+                passage_at=request_serializer.validated_data["passage_at"],
+                has_permit=len(permits) > 0,
+                permits=[Permit.from_dict(permit) for permit in permits],
+            ).encode()
+        return set_stale_header(Response(response_data), decos)
+
+
+class PermitBatchView(CsrfExemptMixin, APIView):
+    http_method_names = ["post"]
+    authentication_classes = [BasicAuthWithKeys]
+
+    @swagger_auto_schema(
+        request_body=PermitsBatchRequestSerializer,
+        responses={200: PermitsBatchResponseSerializer},
+    )
+    def post(self, request):
+        """
+        Check the permits for many passages at once. The number plates are looked
+        up in Decos concurrently, the response contains the passages in the
+        requested order
+        """
+        request_serializer = PermitsBatchRequestSerializer(data=request.data)
+        with server_timing.timed("validate"):
+            request_serializer.is_valid(raise_exception=True)
+
+        passages = [
+            {
+                "number_plate": passage["number_plate"].upper(),
+                "passage_at": passage["passage_at"],
+            }
+            for passage in request_serializer.validated_data["passages"]
+        ]
+
+        decos = DecosZwaarverkeer(deadline=get_deadline())
+        permits_per_passage = [
+            permit_snapshot.get_permits(**passage) for passage in passages
+        ]
+        # Ask Decos only for the passages the snapshot cannot answer
+        unanswered = [
+            index
+            for index, permits in enumerate(permits_per_passage)
+            if permits is None
+        ]
+        if unanswered:
+            decos_permits = decos.get_permits_batch(
+                passages=[passages[index] for index in unanswered]
+            )
+            for index, permits in zip(unanswered, decos_permits):
+                permits_per_passage[index] = permits
+        with server_timing.timed("serialize"):
+            response_data = PermitsBatchResponse(
+                passages=[
+                    PermitsResponse(
+                        **passage,
+                        has_permit=len(permits) > 0,
+                        permits=[Permit.from_dict(permit) for permit in permits],
+                    )
+                    for passage, permits in zip(passages, permits_per_passage)
+                ]
+            ).encode()
+        return set_stale_header(Response(response_data), decos)
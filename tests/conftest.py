@@ -0,0 +1,17 @@
+import pytest
+from django.core.cache import cache
+
+from main import decos
+from main.cache import clear_local_caches
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    clear_local_caches()
+    # The circuit breakers count the failures in memory
+    decos._circuit_breakers.clear()
+    yield
+    cache.clear()
+    clear_local_caches()
+    decos._circuit_breakers.clear()
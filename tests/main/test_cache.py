@@ -0,0 +1,69 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
+
+from main.cache import LocalCache, TwoTierCache
+
+
+class TestLocalCache:
+    def test_get_and_set(self):
+        local_cache = LocalCache(maxsize=2)
+        local_cache.set("a", 1, timeout=10)
+        assert local_cache.get("a") == 1
+        assert local_cache.get("b") is None
+
+    def test_least_recently_used_is_evicted(self):
+        local_cache = LocalCache(maxsize=2)
+        local_cache.set("a", 1, timeout=10)
+        local_cache.set("b", 2, timeout=10)
+        local_cache.get("a")
+        local_cache.set("c", 3, timeout=10)
+        assert local_cache.get("a") == 1
+        assert local_cache.get("b") is None
+        assert local_cache.get("c") == 3
+
+    def test_entries_expire(self):
+        local_cache = LocalCache(maxsize=2)
+        with patch("main.cache.time.monotonic", return_value=100):
+            local_cache.set("a", 1, timeout=10)
+        with patch("main.cache.time.monotonic", return_value=110):
+            assert local_cache.get("a") is None
+
+    def test_disabled(self):
+        local_cache = LocalCache(maxsize=0)
+        local_cache.set("a", 1, timeout=10)
+        assert local_cache.get("a") is None
+
+
+class TestTwoTierCache:
+    def test_set_fills_both_tiers(self):
+        two_tier_cache = TwoTierCache(timeout=10, maxsize=10)
+        two_tier_cache.set("key", {"content": []})
+        assert two_tier_cache.local.get("key") == {"content": []}
+        assert cache.get("key")[1] == {"content": []}
+
+    def test_shared_tier_fills_local_tier(self):
+        two_tier_cache = TwoTierCache(timeout=10, maxsize=10)
+        other_worker_cache = TwoTierCache(timeout=10, maxsize=10)
+        other_worker_cache.set("key", {"content": []})
+
+        assert two_tier_cache.local.get("key") is None
+        assert two_tier_cache.get("key") == {"content": []}
+        assert two_tier_cache.local.get("key") == {"content": []}
+
+    def test_delete(self):
+        two_tier_cache = TwoTierCache(timeout=10, maxsize=10)
+        two_tier_cache.set("key", {"content": []})
+        two_tier_cache.delete("key")
+        assert two_tier_cache.get("key") is None
+
+    def test_prefix_keeps_shared_entries_apart(self):
+        first = TwoTierCache(timeout=10, maxsize=10)
+        second = TwoTierCache(timeout=10, maxsize=10, prefix="second:")
+        first.set("key", 1)
+        second.set("key", 2)
+        assert cache.get("second:key")[1] == 2
+        first.local.clear()
+        second.local.clear()
+        assert first.get("key") == 1
+        assert second.get("key") == 2
@@ -0,0 +1,215 @@
+import time
+from unittest.mock import patch
+
+import pytest
+import requests
+from django.test import override_settings
+from django_http_exceptions import HTTPExceptions
+
+from main.circuit_breaker import CircuitBreaker
+from main.decos import DecosBase
+
+from ..utils import MockResponse
+
+CIRCUIT_SETTINGS = {
+    "DECOS_CIRCUIT_FAILURE_THRESHOLD": 2,
+    "DECOS_CIRCUIT_SLOW_CALL_THRESHOLD": 2,
+    "DECOS_CIRCUIT_SLOW_CALL_DURATION": 1,
+    "DECOS_CIRCUIT_WINDOW": 30,
+    "DECOS_CIRCUIT_RESET_TIMEOUT": 10,
+    "DECOS_CIRCUIT_HALF_OPEN_PROBES": 1,
+}
+
+
+@pytest.fixture
+def circuit_breaker():
+    with override_settings(**CIRCUIT_SETTINGS):
+        return CircuitBreaker("decos")
+
+
+def assert_open(circuit_breaker):
+    with pytest.raises(HTTPExceptions.SERVICE_UNAVAILABLE):
+        circuit_breaker.before_call()
+
+
+class TestCircuitBreaker:
+    def test_opens_after_failures(self, circuit_breaker):
+        circuit_breaker.record_failure()
+        assert circuit_breaker.before_call() is False
+        circuit_breaker.record_failure()
+        assert_open(circuit_breaker)
+
+    def test_opens_after_slow_calls(self, circuit_breaker):
+        circuit_breaker.record_success(0.5)
+        circuit_breaker.record_success(2)
+        assert circuit_breaker.before_call() is False
+        circuit_breaker.record_success(2)
+        assert_open(circuit_breaker)
+
+    def test_failures_are_counted_per_window(self, circuit_breaker):
+        with patch("main.circuit_breaker.time.time", return_value=1000):
+            circuit_breaker.record_failure()
+        with patch("main.circuit_breaker.time.time", return_value=1030):
+            circuit_breaker.record_failure()
+            assert circuit_breaker.before_call() is False
+
+    def test_circuit_is_shared_by_name(self, circuit_breaker):
+        circuit_breaker.record_failure()
+        circuit_breaker.record_failure()
+        with override_settings(**CIRCUIT_SETTINGS):
+            assert_open(CircuitBreaker("decos"))
+            assert CircuitBreaker("other").before_call() is False
+
+    def test_half_open_probe_closes_circuit(self, circuit_breaker):
+        with patch("main.circuit_breaker.time.time", return_value=1000):
+            circuit_breaker.record_failure()
+            circuit_breaker.record_failure()
+        with patch("main.circuit_breaker.time.time", return_value=1009):
+            assert_open(circuit_breaker)
+        with patch("main.circuit_breaker.time.time", return_value=1010):
+            assert circuit_breaker.before_call() is True
+            # Only one probe at a time
+            assert_open(circuit_breaker)
+            circuit_breaker.record_success(0.1, probe=True)
+            assert circuit_breaker.before_call() is False
+
+    def test_failed_probe_reopens_circuit(self, circuit_breaker):
+        with patch("main.circuit_breaker.time.time", return_value=1000):
+            circuit_breaker.record_failure()
+            circuit_breaker.record_failure()
+        with patch("main.circuit_breaker.time.time", return_value=1010):
+            assert circuit_breaker.before_call() is True
+            circuit_breaker.record_failure(probe=True)
+        with patch("main.circuit_breaker.time.time", return_value=1015):
+            assert_open(circuit_breaker)
+        with patch("main.circuit_breaker.time.time", return_value=1020):
+            assert circuit_breaker.before_call() is True
+
+    def test_released_probe_can_be_made_again(self, circuit_breaker):
+        with patch("main.circuit_breaker.time.time", return_value=1000):
+            circuit_breaker.record_failure()
+            circuit_breaker.record_failure()
+        with patch("main.circuit_breaker.time.time", return_value=1010):
+            assert circuit_breaker.before_call() is True
+            circuit_breaker.release_probe(True)
+            assert circuit_breaker.before_call() is True
+
+    def test_closed_circuit_is_checked_in_memory(self, circuit_breaker, mocker):
+        circuit_breaker.before_call()
+        cache_get = mocker.spy(circuit_breaker.cache, "get")
+        cache_set = mocker.spy(circuit_breaker.cache, "set")
+        for _ in range(10):
+            assert circuit_breaker.before_call() is False
+            circuit_breaker.record_success(0.1)
+        circuit_breaker.record_failure()
+        assert cache_get.call_count == 0
+        assert cache_set.call_count == 0
+
+    def test_sees_circuit_opened_by_other_worker(self, circuit_breaker):
+        with patch("main.circuit_breaker.time.monotonic", return_value=1000):
+            assert circuit_breaker.before_call() is False
+        with override_settings(**CIRCUIT_SETTINGS):
+            other_worker = CircuitBreaker("decos")
+        other_worker.record_failure()
+        other_worker.record_failure()
+        with patch("main.circuit_breaker.time.monotonic", return_value=1000.5):
+            assert circuit_breaker.before_call() is False
+        with patch("main.circuit_breaker.time.monotonic", return_value=1001):
+            assert_open(circuit_breaker)
+
+    @override_settings(
+        DECOS_CIRCUIT_FAILURE_THRESHOLD=0, DECOS_CIRCUIT_SLOW_CALL_THRESHOLD=0
+    )
+    def test_disabled(self):
+        circuit_breaker = CircuitBreaker("disabled")
+        for _ in range(100):
+            circuit_breaker.record_failure()
+        assert circuit_breaker.before_call() is False
+
+
+class DecosCircuit(DecosBase):
+    auth_user = "circuit_user"
+    auth_pass = "pass"
+
+
+class TestDecosCircuitBreaker:
+    URL = DecosBase.base_url + "KEY/FOLDERS"
+
+    @pytest.fixture(autouse=True)
+    def circuit_breaker(self, circuit_breaker, monkeypatch):
+        monkeypatch.setattr(
+            DecosCircuit, "_get_circuit_breaker", lambda self: circuit_breaker
+        )
+
+    def test_decos_is_not_called_when_open(self, mocker):
+        mocked_response = mocker.patch.object(
+            DecosCircuit,
+            "_get_response",
+            side_effect=requests.exceptions.ConnectionError,
+        )
+        decos = DecosCircuit()
+        for _ in range(2):
+            with pytest.raises(HTTPExceptions.SERVICE_UNAVAILABLE):
+                decos._get(self.URL, {})
+        with pytest.raises(HTTPExceptions.SERVICE_UNAVAILABLE):
+            decos._get(self.URL, {})
+        assert mocked_response.call_count == 2
+
+    def test_client_errors_do_not_open_the_circuit(self, mocker):
+        mocked_response = mocker.patch.object(
+            DecosCircuit,
+            "_get_response",
+            return_value=MockResponse(404, json_content={}),
+        )
+        decos = DecosCircuit()
+        for _ in range(3):
+            with pytest.raises(HTTPExceptions.BAD_GATEWAY):
+                decos._get(self.URL, {})
+        assert mocked_response.call_count == 3
+
+    def test_server_errors_open_the_circuit(self, mocker):
+        mocker.patch.object(
+            DecosCircuit,
+            "_get_response",
+            return_value=MockResponse(503, json_content={}),
+        )
+        decos = DecosCircuit()
+        for _ in range(2):
+            with pytest.raises(HTTPExceptions.BAD_GATEWAY):
+                decos._get(self.URL, {})
+        with pytest.raises(HTTPExceptions.SERVICE_UNAVAILABLE):
+            decos._get(self.URL, {})
+
+    def test_timeouts_cut_short_by_the_deadline_are_not_failures(self, mocker):
+        def get_response(params, url):
+            time.sleep(0.15)
+            raise requests.exceptions.ReadTimeout
+
+        mocked_response = mocker.patch.object(
+            DecosCircuit, "_get_response", side_effect=get_response
+        )
+        for _ in range(3):
+            with pytest.raises(HTTPExceptions.GATEWAY_TIMEOUT):
+                DecosCircuit(deadline=time.monotonic() + 0.1)._get(self.URL, {})
+        assert mocked_response.call_count == 3
+
+    def test_probe_is_released_when_the_deadline_passes(self, mocker):
+        mocked_response = mocker.patch.object(
+            DecosCircuit,
+            "_get_response",
+            side_effect=requests.exceptions.ConnectionError,
+        )
+        with patch("main.circuit_breaker.time.time", return_value=1000):
+            for _ in range(2):
+                with pytest.raises(HTTPExceptions.SERVICE_UNAVAILABLE):
+                    DecosCircuit()._get(self.URL, {})
+
+        mocked_response.side_effect = HTTPExceptions.GATEWAY_TIMEOUT
+        with patch("main.circuit_breaker.time.time", return_value=1010):
+            with pytest.raises(HTTPExceptions.GATEWAY_TIMEOUT):
+                DecosCircuit()._get(self.URL, {})
+            # The probe was not made, so the next call probes Decos
+            mocked_response.side_effect = None
+            mocked_response.return_value = MockResponse(200, json_content={})
+            assert DecosCircuit()._get(self.URL, {}) == {}
+        assert mocked_response.call_count == 4
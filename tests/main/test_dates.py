@@ -0,0 +1,43 @@
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from dateutil import parser
+
+from main.dates import parse_decos_date, parse_decos_datetime, parse_local_datetime
+
+AMSTERDAM = ZoneInfo("Europe/Amsterdam")
+
+
+class TestParseDecosDatetime:
+    def test_iso_format(self):
+        assert parse_decos_datetime("2024-02-01T00:00:00.000") == datetime(2024, 2, 1)
+        assert parse_decos_datetime("2024-02-01T13:14:15") == datetime(
+            2024, 2, 1, 13, 14, 15
+        )
+
+    def test_other_formats_fall_back_to_dateutil(self):
+        value = "Feb 1 2024 13:14"
+        assert parse_decos_datetime(value) == parser.parse(value)
+
+    def test_parse_date(self):
+        assert parse_decos_date("2024-02-01T00:00:00") == date(2024, 2, 1)
+
+
+class TestParseLocalDatetime:
+    def test_naive_values_are_local(self):
+        winter = parse_local_datetime("2024-02-01T00:00:00.000")
+        summer = parse_local_datetime("2024-07-01T00:00:00.000")
+        assert winter.utcoffset() == timedelta(hours=1)
+        assert summer.utcoffset() == timedelta(hours=2)
+        assert winter == datetime(2024, 2, 1, tzinfo=AMSTERDAM)
+
+    def test_aware_values_are_converted(self):
+        dt = parse_local_datetime("2024-02-01T00:00:00+00:00", AMSTERDAM)
+        assert dt == datetime(2024, 2, 1, tzinfo=timezone.utc)
+        assert dt.hour == 1
+
+    def test_replacing_the_time_follows_dst(self):
+        # The clock moves forward on 2024-03-31, the offset depends on the time
+        dt = parse_local_datetime("2024-03-31T00:00:00", AMSTERDAM)
+        assert dt.utcoffset() == timedelta(hours=1)
+        assert dt.replace(hour=6).utcoffset() == timedelta(hours=2)
@@ -0,0 +1,412 @@
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+import requests
+from django.test import override_settings
+from django_http_exceptions import HTTPExceptions
+from rest_framework.response import Response
+
+from main import decos as main_decos
+from main.decos import STALE_HEADER, DecosBase, set_stale_header
+from taxi.decos import DecosTaxiDetail, DecosTaxiDriver
+from zwaarverkeer.decos import DecosZwaarverkeer
+
+from ..utils import MockResponse
+
+
+@pytest.fixture(autouse=True)
+def clean_sessions():
+    main_decos._sessions.clear()
+    yield
+    main_decos._sessions.clear()
+
+
+class TestDecosSessions:
+    def test_session_is_reused(self):
+        assert DecosTaxiDriver()._get_session() is DecosTaxiDriver()._get_session()
+
+    def test_session_is_shared_per_credential_set(self, monkeypatch):
+        monkeypatch.setattr(DecosZwaarverkeer, "auth_user", "zwaarverkeer_user")
+        monkeypatch.setattr(DecosTaxiDriver, "auth_user", "taxi_user")
+        monkeypatch.setattr(DecosTaxiDetail, "auth_user", "taxi_user")
+
+        taxi_session = DecosTaxiDriver()._get_session()
+        assert DecosTaxiDetail()._get_session() is taxi_session
+        assert DecosZwaarverkeer()._get_session() is not taxi_session
+
+    def test_circuit_breaker_is_shared_by_threads(self):
+        start = threading.Barrier(8)
+        breakers = []
+
+        def get_circuit_breaker():
+            start.wait()
+            breakers.append(DecosTaxiDriver()._get_circuit_breaker())
+
+        threads = [threading.Thread(target=get_circuit_breaker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len({id(breaker) for breaker in breakers}) == 1
+
+    def test_session_configuration(self, monkeypatch):
+        monkeypatch.setattr(DecosZwaarverkeer, "auth_user", "user")
+        monkeypatch.setattr(DecosZwaarverkeer, "auth_pass", "pass")
+
+        session = DecosZwaarverkeer()._get_session()
+        assert session.auth == ("user", "pass")
+        assert session.headers["accept"] == "application/itemdata"
+        assert session.headers["Accept-Encoding"] == "gzip, deflate"
+        assert session.headers["Connection"] == "keep-alive"
+        adapter = session.get_adapter(DecosZwaarverkeer.base_url)
+        assert adapter._pool_maxsize == 10
+
+    @override_settings(
+        DECOS_HTTP_KEEP_ALIVE=False,
+        DECOS_HTTP_ACCEPT_GZIP=False,
+        DECOS_HTTP_POOL_MAXSIZE=3,
+    )
+    def test_session_configuration_from_settings(self):
+        session = DecosZwaarverkeer()._get_session()
+        assert session.headers["Accept-Encoding"] == "identity"
+        assert session.headers["Connection"] == "close"
+        adapter = session.get_adapter(DecosZwaarverkeer.base_url)
+        assert adapter._pool_maxsize == 3
+
+
+class DecosCached(DecosBase):
+    auth_user = "user"
+    auth_pass = "pass"
+    cache_timeout = 60
+    cache_maxsize = 10
+
+
+class TestDecosResponseCache:
+    URL = DecosBase.base_url + "KEY/FOLDERS"
+
+    def test_response_is_cached(self, mocker):
+        mocked_response = mocker.patch.object(
+            DecosCached,
+            "_get_response",
+            return_value=MockResponse(200, json_content={"content": [1]}),
+        )
+        decos = DecosCached()
+        assert decos._get(self.URL, {"filter": "a eq 'b'"}) == {"content": [1]}
+        assert decos._get(self.URL, {"filter": "a eq 'b'"}) == {"content": [1]}
+        assert mocked_response.call_count == 1
+
+        decos._get(self.URL, {"filter": "a eq 'c'"})
+        assert mocked_response.call_count == 2
+
+    def test_shared_cache_is_used_by_other_workers(self, mocker):
+        mocked_response = mocker.patch.object(
+            DecosCached,
+            "_get_response",
+            return_value=MockResponse(200, json_content={"content": [1]}),
+        )
+        DecosCached()._get(self.URL, {"filter": "a eq 'b'"})
+        DecosCached()._get_response_cache().local.clear()
+
+        assert DecosCached()._get(self.URL, {"filter": "a eq 'b'"}) == {"content": [1]}
+        assert mocked_response.call_count == 1
+
+    def test_cache_key_is_hashed(self):
+        cache_key = DecosCached()._get_cache_key(
+            self.URL, "filter=num1%20eq%20%27123%27"
+        )
+        assert "123" not in cache_key
+        assert cache_key.startswith("decos:")
+
+    def test_cache_key_is_keyed(self, settings):
+        cache_key = DecosCached()._get_cache_key(self.URL, "filter=num1 eq '123'")
+        settings.SECRET_KEY = "another secret"
+        assert DecosCached()._get_cache_key(self.URL, "filter=num1 eq '123'") != (
+            cache_key
+        )
+
+    def test_errors_are_not_cached(self, mocker):
+        mocked_response = mocker.patch.object(
+            DecosCached,
+            "_get_response",
+            return_value=MockResponse(500, json_content={}),
+        )
+        decos = DecosCached()
+        for _ in range(2):
+            with pytest.raises(HTTPExceptions.BAD_GATEWAY):
+                decos._get(self.URL, {"filter": "a eq 'b'"})
+        assert mocked_response.call_count == 2
+
+    def test_cache_disabled_by_default(self, mocker):
+        mocked_response = mocker.patch.object(
+            DecosZwaarverkeer,
+            "_get_response",
+            return_value=MockResponse(200, json_content={"content": [1]}),
+        )
+        decos = DecosZwaarverkeer()
+        decos._get(self.URL, {"filter": "a eq 'b'"})
+        decos._get(self.URL, {"filter": "a eq 'b'"})
+        assert mocked_response.call_count == 2
+
+
+class DecosUncached(DecosBase):
+    auth_user = "user"
+    auth_pass = "pass"
+
+
+class TestDecosNegativeCache:
+    URL = DecosBase.base_url + "KEY/FOLDERS"
+
+    @pytest.mark.parametrize("decos_class", [DecosUncached, DecosCached])
+    def test_empty_response_is_cached(self, mocker, decos_class):
+        mocked_response = mocker.patch.object(
+            decos_class,
+            "_get_response",
+            return_value=MockResponse(200, json_content={"count": 0, "content": []}),
+        )
+        for _ in range(2):
+            data = decos_class()._get(self.URL, {"filter": "a eq 'b'"}, use_cache=False)
+            assert data == {"count": 0, "content": []}
+        assert mocked_response.call_count == 1
+
+    def test_response_with_content_is_not_cached(self, mocker):
+        mocked_response = mocker.patch.object(
+            DecosUncached,
+            "_get_response",
+            return_value=MockResponse(200, json_content={"content": [1]}),
+        )
+        DecosUncached()._get(self.URL, {"filter": "a eq 'b'"})
+        DecosUncached()._get(self.URL, {"filter": "a eq 'b'"})
+        assert mocked_response.call_count == 2
+
+    def test_negative_cache_can_be_disabled(self, mocker, monkeypatch):
+        monkeypatch.setattr(DecosUncached, "negative_cache_timeout", 0)
+        mocked_response = mocker.patch.object(
+            DecosUncached,
+            "_get_response",
+            return_value=MockResponse(200, json_content={"content": []}),
+        )
+        DecosUncached()._get(self.URL, {"filter": "a eq 'b'"})
+        DecosUncached()._get(self.URL, {"filter": "a eq 'b'"})
+        assert mocked_response.call_count == 2
+
+
+class DecosStale(DecosCached):
+    stale_timeout = 60
+
+
+def wait_for_refresh():
+    for _ in range(100):
+        if not main_decos._refreshing:
+            return
+        time.sleep(0.01)
+
+
+class TestDecosStaleWhileRevalidate:
+    URL = DecosBase.base_url + "KEY/FOLDERS"
+
+    def test_stale_response_is_served_and_refreshed(self, mocker):
+        mocked_response = mocker.patch.object(
+            DecosStale,
+            "_get_response",
+            return_value=MockResponse(200, json_content={"content": [1]}),
+        )
+        with patch("main.decos.time.time", return_value=1000):
+            DecosStale()._get(self.URL, {})
+
+        mocked_response.return_value = MockResponse(200, json_content={"content": [2]})
+        with patch("main.decos.time.time", return_value=1070):
+            decos = DecosStale()
+            assert decos._get(self.URL, {}) == {"content": [1]}
+            assert decos.served_stale
+            wait_for_refresh()
+            assert mocked_response.call_count == 2
+
+            decos = DecosStale()
+            assert decos._get(self.URL, {}) == {"content": [2]}
+            assert not decos.served_stale
+
+    def test_stale_response_is_served_when_refresh_fails(self, mocker):
+        mocked_response = mocker.patch.object(
+            DecosStale,
+            "_get_response",
+            return_value=MockResponse(200, json_content={"content": [1]}),
+        )
+        with patch("main.decos.time.time", return_value=1000):
+            DecosStale()._get(self.URL, {})
+
+        mocked_response.side_effect = requests.exceptions.ConnectionError
+        with patch("main.decos.time.time", return_value=1070):
+            for _ in range(2):
+                decos = DecosStale()
+                assert decos._get(self.URL, {}) == {"content": [1]}
+                assert decos.served_stale
+                wait_for_refresh()
+        assert mocked_response.call_count == 3
+
+    def test_fresh_response_is_not_refreshed(self, mocker):
+        mocked_response = mocker.patch.object(
+            DecosStale,
+            "_get_response",
+            return_value=MockResponse(200, json_content={"content": [1]}),
+        )
+        with patch("main.decos.time.time", return_value=1000):
+            DecosStale()._get(self.URL, {})
+        with patch("main.decos.time.time", return_value=1059):
+            decos = DecosStale()
+            decos._get(self.URL, {})
+            assert not decos.served_stale
+        assert mocked_response.call_count == 1
+
+    def test_stale_header(self):
+        decos = DecosStale()
+        assert STALE_HEADER not in set_stale_header(Response(), decos)
+        decos.served_stale = True
+        assert set_stale_header(Response(), decos)[STALE_HEADER] == "true"
+
+
+class TestDecosDeadline:
+    URL = DecosBase.base_url + "KEY/FOLDERS"
+
+    @pytest.fixture
+    def session(self, mocker):
+        session = mocker.Mock()
+        session.get.return_value = MockResponse(200, json_content={"content": [1]})
+        mocker.patch.object(DecosUncached, "_get_session", return_value=session)
+        return session
+
+    def test_default_timeout_without_deadline(self, session):
+        DecosUncached()._get(self.URL, {})
+        assert session.get.call_args.kwargs["timeout"] == 5
+
+    def test_timeout_is_shortened_to_the_deadline(self, session):
+        DecosUncached(deadline=time.monotonic() + 2)._get(self.URL, {})
+        assert 1.5 < session.get.call_args.kwargs["timeout"] <= 2
+
+    def test_timeout_is_not_extended_by_the_deadline(self, session):
+        DecosUncached(deadline=time.monotonic() + 60)._get(self.URL, {})
+        assert session.get.call_args.kwargs["timeout"] == 5
+
+    def test_decos_is_not_called_after_the_deadline(self, session):
+        with pytest.raises(HTTPExceptions.GATEWAY_TIMEOUT):
+            DecosUncached(deadline=time.monotonic() - 1)._get(self.URL, {})
+        assert not session.get.called
+
+    def test_stale_response_is_refreshed_after_the_deadline(self, mocker):
+        mocked_response = mocker.patch.object(
+            DecosStale,
+            "_get_response",
+            return_value=MockResponse(200, json_content={"content": [1]}),
+        )
+        with patch("main.decos.time.time", return_value=1000):
+            DecosStale()._get(self.URL, {})
+        with patch("main.decos.time.time", return_value=1070):
+            DecosStale(deadline=time.monotonic() - 1)._get(self.URL, {})
+            wait_for_refresh()
+        assert mocked_response.call_count == 2
+
+    @override_settings(DECOS_REQUEST_TIMEOUT=0)
+    def test_deadline_can_be_disabled(self):
+        assert main_decos.get_deadline() is None
+
+
+class TestDecosConcurrency:
+    def test_map_concurrently_keeps_order(self):
+        def slow_double(item):
+            time.sleep(0.05 * (3 - item))
+            return item * 2
+
+        assert DecosCached()._map_concurrently(slow_double, [0, 1, 2]) == [0, 2, 4]
+
+    def test_map_concurrently_runs_in_parallel(self):
+        barrier = threading.Barrier(3, timeout=1)
+
+        def wait_for_all(item):
+            barrier.wait()
+            return item
+
+        assert DecosCached()._map_concurrently(wait_for_all, [1, 2, 3]) == [1, 2, 3]
+
+    def test_map_concurrently_raises_first_error(self):
+        def fail(item):
+            if item == 1:
+                raise HTTPExceptions.GATEWAY_TIMEOUT
+            if item == 2:
+                raise HTTPExceptions.BAD_GATEWAY
+            return item
+
+        with pytest.raises(HTTPExceptions.GATEWAY_TIMEOUT):
+            DecosCached()._map_concurrently(fail, [0, 1, 2])
+
+
+class TestDecosPagination:
+    URL = DecosBase.base_url + "KEY/FOLDERS"
+
+    def test_iter_items_follows_pages(self, mocker):
+        mocked_response = mocker.patch.object(
+            DecosCached,
+            "_get_response",
+            side_effect=[
+                MockResponse(200, json_content={"count": 3, "content": [1, 2]}),
+                MockResponse(200, json_content={"count": 3, "content": [3]}),
+            ],
+        )
+        items = list(DecosCached()._iter_items(self.URL, {"filter": "a eq 'b'"}))
+        assert items == [1, 2, 3]
+        assert mocked_response.call_count == 2
+        assert (
+            mocked_response.call_args_list[0].kwargs["params"]
+            == "filter=a%20eq%20%27b%27"
+        )
+        assert (
+            mocked_response.call_args_list[1].kwargs["params"]
+            == "filter=a%20eq%20%27b%27&skip=2"
+        )
+
+    def test_iter_items_is_lazy(self, mocker):
+        mocked_response = mocker.patch.object(
+            DecosCached,
+            "_get_response",
+            return_value=MockResponse(200, json_content={"count": 4, "content": [1]}),
+        )
+        items = DecosCached()._iter_items(self.URL, {})
+        assert next(items) == 1
+        assert mocked_response.call_count == 1
+
+    def test_iter_items_with_page_size(self, mocker, monkeypatch):
+        monkeypatch.setattr(DecosCached, "page_size", 2)
+        mocked_response = mocker.patch.object(
+            DecosCached,
+            "_get_response",
+            return_value=MockResponse(
+                200, json_content={"count": 2, "content": [1, 2]}
+            ),
+        )
+        assert list(DecosCached()._iter_items(self.URL, {})) == [1, 2]
+        assert mocked_response.call_args.kwargs["params"] == "top=2"
+
+    @pytest.mark.parametrize(
+        "decos_response", [{}, {"count": 0, "content": []}, {"content": "error"}]
+    )
+    def test_iter_items_without_content(self, mocker, decos_response):
+        mocker.patch.object(
+            DecosCached,
+            "_get_response",
+            return_value=MockResponse(200, json_content=decos_response or {"x": 1}),
+        )
+        assert list(DecosCached()._iter_items(self.URL, {})) == []
+
+    def test_get_paginated(self, mocker):
+        mocker.patch.object(
+            DecosCached,
+            "_get_response",
+            side_effect=[
+                MockResponse(200, json_content={"count": 2, "content": [1]}),
+                MockResponse(200, json_content={"count": 2, "content": [2]}),
+            ],
+        )
+        assert DecosCached()._get_paginated(self.URL, {}) == {
+            "count": 2,
+            "content": [1, 2],
+        }
@@ -0,0 +1,185 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+from asgiref.sync import async_to_sync
+from django.test import override_settings
+from django_http_exceptions import HTTPExceptions
+
+from main.decos import DecosBase
+from main.decos_async import AsyncDecosMixin
+
+
+class AsyncDecos(AsyncDecosMixin, DecosBase):
+    auth_user = "user"
+    auth_pass = "pass"
+
+
+class AsyncDecosCached(AsyncDecos):
+    cache_timeout = 60
+    cache_maxsize = 10
+
+
+URL = DecosBase.base_url + "KEY/FOLDERS"
+
+
+def mock_transport(mocker, handler):
+    mocker.patch.object(
+        AsyncDecos,
+        "_create_async_client",
+        lambda self: httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+    )
+
+
+class TestAsyncDecos:
+    def test_get(self, mocker):
+        requests = []
+
+        def handler(request):
+            requests.append(request)
+            return httpx.Response(200, json={"content": [1]})
+
+        mock_transport(mocker, handler)
+        data = async_to_sync(AsyncDecos()._aget)(URL, {"filter": "a eq 'b'"})
+        assert data == {"content": [1]}
+        assert str(requests[0].url) == URL + "?filter=a%20eq%20%27b%27"
+
+    @pytest.mark.parametrize(
+        "error, expected_exception",
+        [
+            (httpx.ConnectError("refused"), HTTPExceptions.SERVICE_UNAVAILABLE),
+            (httpx.ConnectTimeout("timeout"), HTTPExceptions.SERVICE_UNAVAILABLE),
+            (httpx.ReadTimeout("timeout"), HTTPExceptions.GATEWAY_TIMEOUT),
+            (httpx.RemoteProtocolError("error"), HTTPExceptions.BAD_GATEWAY),
+        ],
+    )
+    def test_get_connection_errors(self, mocker, error, expected_exception):
+        def handler(request):
+            raise error
+
+        mock_transport(mocker, handler)
+        with pytest.raises(expected_exception):
+            async_to_sync(AsyncDecos()._aget)(URL, {})
+
+    @pytest.mark.parametrize(
+        "response, expected_exception",
+        [
+            (httpx.Response(401, json={}), HTTPExceptions.BAD_GATEWAY),
+            (httpx.Response(500, text="error"), HTTPExceptions.BAD_GATEWAY),
+            (httpx.Response(200, text="Some string"), HTTPExceptions.NOT_FOUND),
+        ],
+    )
+    def test_get_error_responses(self, mocker, response, expected_exception):
+        mock_transport(mocker, lambda request: response)
+        with pytest.raises(expected_exception):
+            async_to_sync(AsyncDecos()._aget)(URL, {})
+
+    def test_get_is_cached(self, mocker):
+        requests = []
+
+        def handler(request):
+            requests.append(request)
+            return httpx.Response(200, json={"content": [1]})
+
+        mock_transport(mocker, handler)
+
+        async def get_twice():
+            decos = AsyncDecosCached()
+            await decos._aget(URL, {"filter": "a eq 'b'"})
+            return await decos._aget(URL, {"filter": "a eq 'b'"})
+
+        assert async_to_sync(get_twice)() == {"content": [1]}
+        assert len(requests) == 1
+
+    def test_circuit_breaker_rejects_calls_when_open(self, mocker):
+        requests = []
+
+        def handler(request):
+            requests.append(request)
+            raise httpx.ConnectError("refused")
+
+        mock_transport(mocker, handler)
+        circuit_breaker = AsyncDecos()._get_circuit_breaker()
+        for _ in range(circuit_breaker.failure_threshold):
+            with pytest.raises(HTTPExceptions.SERVICE_UNAVAILABLE):
+                async_to_sync(AsyncDecos()._aget)(URL, {})
+        with pytest.raises(HTTPExceptions.SERVICE_UNAVAILABLE):
+            async_to_sync(AsyncDecos()._aget)(URL, {})
+        assert len(requests) == circuit_breaker.failure_threshold
+
+    @override_settings(DECOS_CIRCUIT_FAILURE_THRESHOLD=2)
+    def test_timeouts_cut_short_by_the_deadline_are_not_failures(self, mocker):
+        requests = []
+
+        def handler(request):
+            requests.append(request)
+            time.sleep(0.15)
+            raise httpx.ReadTimeout("timeout")
+
+        mock_transport(mocker, handler)
+        for _ in range(3):
+            decos = AsyncDecos(deadline=time.monotonic() + 0.1)
+            with pytest.raises(HTTPExceptions.GATEWAY_TIMEOUT):
+                async_to_sync(decos._aget)(URL, {})
+        assert len(requests) == 3
+
+    def test_map_concurrently_raises_first_error_in_order(self):
+        async def fail(item):
+            if item == 1:
+                await asyncio.sleep(0.05)
+                raise HTTPExceptions.GATEWAY_TIMEOUT
+            if item == 2:
+                raise HTTPExceptions.BAD_GATEWAY
+            return item
+
+        with pytest.raises(HTTPExceptions.GATEWAY_TIMEOUT):
+            async_to_sync(AsyncDecos()._amap_concurrently)(fail, [0, 1, 2])
+
+    @override_settings(DECOS_MAX_CONCURRENT_REQUESTS=2)
+    def test_map_concurrently_is_bounded(self):
+        running = []
+        most_running = 0
+
+        async def call(item):
+            nonlocal most_running
+            running.append(item)
+            most_running = max(most_running, len(running))
+            await asyncio.sleep(0.01)
+            running.remove(item)
+            return item
+
+        results = async_to_sync(AsyncDecos()._amap_concurrently)(call, range(5))
+        assert results == [0, 1, 2, 3, 4]
+        assert most_running == 2
+
+    @override_settings(DECOS_MAX_CONCURRENT_REQUESTS=2)
+    def test_map_concurrently_is_bounded_across_calls(self):
+        running = []
+        most_running = 0
+
+        async def call(item):
+            nonlocal most_running
+            running.append(item)
+            most_running = max(most_running, len(running))
+            await asyncio.sleep(0.01)
+            running.remove(item)
+            return item
+
+        async def map_twice():
+            return await asyncio.gather(
+                AsyncDecos()._amap_concurrently(call, range(3)),
+                AsyncDecos()._amap_concurrently(call, range(3, 6)),
+            )
+
+        assert async_to_sync(map_twice)() == [[0, 1, 2], [3, 4, 5]]
+        assert most_running == 2
+
+    def test_client_is_reused_within_event_loop(self):
+        async def get_clients():
+            return AsyncDecos()._get_async_client(), AsyncDecos()._get_async_client()
+
+        first, second = async_to_sync(get_clients)()
+        assert first is second
+        assert first.auth is not None
+        assert first.follow_redirects
@@ -0,0 +1,90 @@
+import io
+import uuid
+from datetime import date, datetime, time, timedelta
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+
+import pytest
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework import renderers
+from rest_framework.exceptions import ParseError
+from rest_framework.utils.serializer_helpers import ReturnDict
+
+from main import json_codec
+from main.json_codec import JSONParser, JSONRenderer
+
+DATA = {
+    "utc": datetime(2022, 10, 10, 6, 30, 0, 123456, tzinfo=dt_timezone.utc),
+    "local": timezone.make_aware(datetime(2022, 10, 10, 6, 30)),
+    "naive": datetime(2022, 10, 10, 6, 30),
+    "date": date(2024, 2, 1),
+    "time": time(6, 30),
+    "timedelta": timedelta(hours=1),
+    "decimal": Decimal("7.50"),
+    "uuid": uuid.UUID("12345678-1234-5678-1234-567812345678"),
+    "text": "Ontheffing 7,5 ton \u2013 Binnenstad \u00e9\u2028\u2029",
+    "nested": ReturnDict({"permits": [{"valid": True, "count": 1}]}, serializer=None),
+    "tuple": (1, 2),
+    1: None,
+}
+
+
+@pytest.fixture(params=["json", "orjson"])
+def codec(request):
+    with override_settings(JSON_CODEC=request.param):
+        yield request.param
+
+
+def test_codec_is_used(codec):
+    assert json_codec.get_codec().name == codec
+
+
+def test_rendered_as_drf_does(codec):
+    assert JSONRenderer().render(DATA) == renderers.JSONRenderer().render(DATA)
+
+
+def test_pretty_printed_as_drf_does(codec):
+    media_type = "application/json; indent=4"
+    assert JSONRenderer().render(DATA, media_type) == renderers.JSONRenderer().render(
+        DATA, media_type
+    )
+
+
+@pytest.mark.parametrize("value", [float("nan"), float("inf")])
+def test_non_finite_floats(value):
+    with override_settings(JSON_CODEC="json"), pytest.raises(ValueError):
+        JSONRenderer().render({"value": value})
+    # orjson has no strict mode, see OrjsonCodec
+    with override_settings(JSON_CODEC="orjson"):
+        assert JSONRenderer().render({"value": value}) == b'{"value":null}'
+
+
+def test_nothing_to_render(codec):
+    assert JSONRenderer().render(None) == b""
+
+
+def test_parse(codec):
+    stream = io.BytesIO('{"number_plate": "AB12CD", "text": "é"}'.encode())
+    assert JSONParser().parse(stream) == {"number_plate": "AB12CD", "text": "é"}
+
+
+def test_parse_other_encoding(codec):
+    stream = io.BytesIO('{"text": "é"}'.encode("latin-1"))
+    parser_context = {"encoding": "latin-1"}
+    assert JSONParser().parse(stream, parser_context=parser_context) == {"text": "é"}
+
+
+@pytest.mark.parametrize("content", [b"{", b'{"count": NaN}', b"Some string"])
+def test_parse_error(codec, content):
+    with pytest.raises(ParseError):
+        JSONParser().parse(io.BytesIO(content))
+
+
+def test_loads(codec):
+    assert json_codec.loads(b'{"count": 1, "content": []}') == {
+        "count": 1,
+        "content": [],
+    }
+    with pytest.raises(ValueError):
+        json_codec.loads("Some string response")
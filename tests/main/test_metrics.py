@@ -0,0 +1,148 @@
+import json
+
+import pytest
+import requests
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django_http_exceptions import HTTPExceptions
+from prometheus_client import REGISTRY
+
+from main import decos
+from main.decos import DecosBase
+from main.middleware import MetricsMiddleware
+from main.queries import QueryTemplate
+
+from ..utils import MockResponse
+from ..zwaarverkeer.test_zwaarverkeer import create_basic_auth_headers
+
+METRICS_QUERY = QueryTemplate("test.metrics", {"filter": "num1 eq '{bsn}'"})
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class DecosMetrics(DecosBase):
+    auth_user = "metrics_user"
+    auth_pass = "pass"
+    cache_timeout = 60
+
+
+class TestDecosMetrics:
+    URL = DecosBase.base_url + "KEY/FOLDERS"
+
+    def test_calls_are_timed_per_query(self, mocker):
+        mocker.patch.object(
+            DecosMetrics,
+            "_get_response",
+            return_value=MockResponse(200, json_content={"content": [1]}),
+        )
+        before = sample(
+            "verkeersvergunningen_decos_call_duration_seconds_count",
+            call="test.metrics",
+        )
+        DecosMetrics()._get(self.URL, METRICS_QUERY.render(bsn="1"))
+        after = sample(
+            "verkeersvergunningen_decos_call_duration_seconds_count",
+            call="test.metrics",
+        )
+        assert after - before == 1
+
+    def test_connection_pool_size_of_the_worker(self):
+        DecosMetrics()._get_session()
+        expected = len(decos._sessions) * settings.DECOS_HTTP_POOL_MAXSIZE
+        assert sample("verkeersvergunningen_decos_connection_pool_size") == expected
+
+    def test_pages_keep_the_query_name(self):
+        params = DecosMetrics()._page_parameters(METRICS_QUERY.render(bsn="1"), 10)
+        assert params.name == "test.metrics"
+        assert params.endswith("skip=10")
+
+    @pytest.mark.parametrize(
+        "side_effect, status",
+        [
+            (requests.exceptions.ConnectionError, 503),
+            (requests.exceptions.ReadTimeout, 504),
+            (requests.exceptions.HTTPError, 502),
+        ],
+    )
+    def test_errors_are_counted_by_status(self, mocker, side_effect, status):
+        mocker.patch.object(DecosMetrics, "_get_response", side_effect=side_effect)
+        labels = {"call": "test.metrics", "status": str(status)}
+        before = sample("verkeersvergunningen_decos_call_errors_total", **labels)
+        with pytest.raises(HTTPExceptions.BASE_EXCEPTION):
+            DecosMetrics()._get(self.URL, METRICS_QUERY.render(bsn="2"))
+        after = sample("verkeersvergunningen_decos_call_errors_total", **labels)
+        assert after - before == 1
+
+    def test_cache_lookups_are_counted(self, mocker):
+        mocker.patch.object(
+            DecosMetrics,
+            "_get_response",
+            return_value=MockResponse(200, json_content={"content": [1]}),
+        )
+
+        def lookups(result):
+            return sample(
+                "verkeersvergunningen_decos_cache_lookups_total",
+                cache="response",
+                result=result,
+            )
+
+        hits, misses = lookups("hit"), lookups("miss")
+        decos = DecosMetrics()
+        decos._get(self.URL, METRICS_QUERY.render(bsn="3"))
+        decos._get(self.URL, METRICS_QUERY.render(bsn="3"))
+        assert lookups("miss") - misses == 1
+        assert lookups("hit") - hits == 1
+
+
+class TestMetricsView:
+    def test_requests_are_timed_per_view(self, client, mocker):
+        mocker.patch(
+            "zwaarverkeer.views.DecosZwaarverkeer._get_response",
+            return_value=MockResponse(200, json_content={"count": 0, "content": []}),
+        )
+        labels = {"view": "PermitView", "method": "POST", "status": "200"}
+        before = sample("verkeersvergunningen_request_duration_seconds_count", **labels)
+        response = client.post(
+            "/zwaarverkeer/get_permits/",
+            json.dumps({"number_plate": "AB12CD", "passage_at": "2022-10-10T06:30:00"}),
+            content_type="application/json",
+            **create_basic_auth_headers(
+                settings.CLEOPATRA_BASIC_AUTH_USER, settings.CLEOPATRA_BASIC_AUTH_PASS
+            ),
+        )
+        assert response.status_code == 200
+        after = sample("verkeersvergunningen_request_duration_seconds_count", **labels)
+        assert after - before == 1
+
+    def test_async_requests_are_timed(self):
+        async def get_response(request):
+            return HttpResponse()
+
+        middleware = MetricsMiddleware(get_response)
+        assert iscoroutinefunction(middleware)
+        labels = {"view": "unknown", "method": "GET", "status": "200"}
+        before = sample("verkeersvergunningen_request_duration_seconds_count", **labels)
+        response = async_to_sync(middleware)(RequestFactory().get("/"))
+        assert response.status_code == 200
+        after = sample("verkeersvergunningen_request_duration_seconds_count", **labels)
+        assert after - before == 1
+
+    def test_metrics_view(self, client):
+        response = client.get(
+            "/status/metrics",
+            **create_basic_auth_headers(
+                settings.CLEOPATRA_BASIC_AUTH_USER, settings.CLEOPATRA_BASIC_AUTH_PASS
+            ),
+        )
+        assert response.status_code == 200
+        assert response["Content-Type"].startswith("text/plain")
+        assert b"verkeersvergunningen_decos_call_duration_seconds" in response.content
+
+    def test_metrics_view_requires_credentials(self, client):
+        response = client.get("/status/metrics")
+        assert response.status_code == 403
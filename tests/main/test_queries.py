@@ -0,0 +1,48 @@
+import urllib.parse
+
+import pytest
+
+import taxi.decos  # noqa: F401
+import zwaarverkeer.snapshot  # noqa: F401
+from main.queries import QUERIES, QueryTemplate, encode_parameters
+
+
+class TestQueryTemplate:
+    def test_render_matches_urlencode(self):
+        template = QueryTemplate(
+            "test.render",
+            {"properties": "false", "filter": "num1 eq '{bsn}' and key eq '{key}'"},
+        )
+        rendered = template.render(bsn="12345/6789", key="a&b{c}")
+        assert rendered == urllib.parse.urlencode(
+            {
+                "properties": "false",
+                "filter": "num1 eq '12345/6789' and key eq 'a&b{c}'",
+            },
+            quote_via=urllib.parse.quote,
+        )
+
+    def test_templates_are_registered(self):
+        template = QueryTemplate("test.registered", {"properties": "false"})
+        assert QUERIES["test.registered"] is template
+        with pytest.raises(ValueError):
+            QueryTemplate("test.registered", {"properties": "false"})
+
+    def test_all_decos_queries_are_registered(self):
+        assert {
+            "taxi.driver_key",
+            "taxi.driver_permit",
+            "taxi.permit_detail",
+            "taxi.handhavingzaken",
+            "zwaarverkeer.permits",
+            "zwaarverkeer.snapshot",
+        } <= set(QUERIES)
+
+
+class TestEncodeParameters:
+    def test_rendered_query_is_not_encoded_again(self):
+        assert encode_parameters("filter=a%20eq%20%27b%27") == "filter=a%20eq%20%27b%27"
+
+    def test_dict_is_encoded(self):
+        assert encode_parameters({"filter": "a eq 'b'"}) == "filter=a%20eq%20%27b%27"
+        assert encode_parameters(None) == ""
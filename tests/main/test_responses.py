@@ -0,0 +1,231 @@
+import dataclasses
+import types
+from datetime import date, datetime, timedelta
+from datetime import timezone as dt_timezone
+from typing import Union, get_args, get_origin, get_type_hints
+
+import pytest
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+from main.responses import encode_date, encode_datetime
+from taxi.responses import Handhaving, Ontheffing, OntheffingenResponse
+from taxi.serializers import (
+    OntheffingenResponseSerializer,
+    OntheffingResponseSerializer,
+)
+from zwaarverkeer.responses import PermitsBatchResponse, PermitsResponse
+from zwaarverkeer.serializers import (
+    PermitsBatchResponseSerializer,
+    PermitsResponseSerializer,
+)
+
+FIELD_TYPES = {
+    serializers.CharField: str,
+    serializers.BooleanField: bool,
+    serializers.DateTimeField: datetime,
+    serializers.DateField: date,
+}
+
+RESPONSE_TYPES = [
+    (PermitsResponse, PermitsResponseSerializer),
+    (PermitsBatchResponse, PermitsBatchResponseSerializer),
+    (Ontheffing, OntheffingResponseSerializer),
+    (OntheffingenResponse, OntheffingenResponseSerializer),
+]
+
+
+def assert_same_fields(response_type, serializer):
+    hints = get_type_hints(response_type)
+    fields = serializer.fields
+    response_fields = {field.name: field for field in dataclasses.fields(response_type)}
+    assert list(response_fields) == list(fields)
+    for name, field in fields.items():
+        hint = hints[name]
+        if get_origin(hint) in (Union, types.UnionType):
+            assert field.allow_null, f"{name} is optional but not in the serializer"
+            (hint,) = (arg for arg in get_args(hint) if arg is not types.NoneType)
+        else:
+            assert not field.allow_null, f"{name} is nullable in the serializer"
+
+        if isinstance(field, serializers.ListSerializer):
+            assert get_origin(hint) is list
+            assert_same_fields(get_args(hint)[0], field.child)
+        else:
+            assert hint is FIELD_TYPES[type(field)], name
+
+
+@pytest.mark.parametrize("response_type, serializer_class", RESPONSE_TYPES)
+def test_fields_match_the_serializers(response_type, serializer_class):
+    """
+    The serializers document the responses in swagger, so they should have
+    the same fields as the data the views actually return
+    """
+    assert_same_fields(response_type, serializer_class())
+
+
+def serialize(serializer_class, data):
+    """
+    How the views used to build their responses
+    """
+    serializer = serializer_class(data=data)
+    serializer.is_valid(raise_exception=True)
+    return serializer.data
+
+
+class TestEncoding:
+    def permits_response(self, passage_at, valid_from):
+        return {
+            "number_plate": "AB12CD",
+            "passage_at": passage_at,
+            "has_permit": True,
+            "permits": [
+                {
+                    "permit_type": "Dagontheffing",
+                    "permit_description": "Ontheffing 7,5 ton",
+                    "valid_from": valid_from,
+                    "valid_until": valid_from + timedelta(days=1, hours=6),
+                },
+                {
+                    "permit_type": None,
+                    "permit_description": None,
+                    "valid_from": valid_from,
+                    "valid_until": valid_from + timedelta(days=365),
+                },
+            ],
+        }
+
+    @pytest.mark.parametrize(
+        "passage_at, valid_from",
+        [
+            (
+                "2022-10-10T06:30:00",
+                timezone.make_aware(datetime(2022, 10, 10)),
+            ),
+            (
+                "2022-10-10T06:30:00.123456Z",
+                datetime(2022, 3, 27, 1, 30, tzinfo=dt_timezone.utc),
+            ),
+            (
+                "2022-10-10T06:30:00+05:00",
+                datetime(2022, 10, 10),
+            ),
+        ],
+    )
+    def test_permits_as_serialized(self, passage_at, valid_from):
+        data = self.permits_response(passage_at, valid_from)
+        expected = serialize(PermitsResponseSerializer, data)
+        assert PermitsResponse.from_dict(data).encode() == expected
+
+        batch = {"passages": [data, data]}
+        expected = serialize(PermitsBatchResponseSerializer, batch)
+        assert PermitsBatchResponse.from_dict(batch).encode() == expected
+
+    def test_padded_strings_as_serialized(self):
+        data = self.permits_response("2022-10-10T06:30:00", datetime(2022, 10, 10))
+        data["number_plate"] = " AB12CD\t"
+        data["permits"][0]["permit_description"] = " Ontheffing 7,5 ton "
+        expected = serialize(PermitsResponseSerializer, data)
+        assert expected["number_plate"] == "AB12CD"
+        assert PermitsResponse.from_dict(data).encode() == expected
+
+    @pytest.mark.parametrize("value", ["", "   "])
+    def test_blank_strings_as_serialized(self, value):
+        data = self.permits_response("2022-10-10T06:30:00", datetime(2022, 10, 10))
+        data["permits"][0]["permit_description"] = value
+        with pytest.raises(ValidationError) as serializer_exc_info:
+            serialize(PermitsResponseSerializer, data)
+        with pytest.raises(ValidationError) as exc_info:
+            PermitsResponse.from_dict(data).encode()
+        assert serializer_exc_info.value.detail["permits"][0]["permit_description"] == (
+            exc_info.value.detail["permit_description"]
+        )
+
+    def test_ontheffingen_as_serialized(self):
+        data = {
+            "ontheffing": [
+                {
+                    "ontheffingsnummer": "1234567",
+                    "geldigVanaf": "2024-02-01",
+                    "geldigTot": date(2025, 2, 1),
+                    "schorsingen": [
+                        {
+                            "zaakidentificatie": "Z/24/123",
+                            "geldigVanaf": "2024-03-01",
+                            "geldigTot": "2024-03-08",
+                        }
+                    ],
+                },
+                {
+                    "ontheffingsnummer": "1234568",
+                    "geldigVanaf": "2024-02-01",
+                    "geldigTot": "2025-02-01",
+                    "schorsingen": [],
+                },
+            ]
+        }
+        expected = serialize(OntheffingenResponseSerializer, data)
+        assert OntheffingenResponse.from_dict(data).encode() == expected
+
+    def test_extra_keys_are_left_out(self):
+        data = {
+            "ontheffingsnummer": "1234567",
+            "zaakidentificatie": "Z/24/123",
+            "geldigVanaf": "2024-02-01",
+            "geldigTot": "2025-02-01",
+            "schorsingen": [],
+        }
+        assert "zaakidentificatie" not in Ontheffing.from_dict(data).encode()
+
+    def test_utc(self):
+        with timezone.override("UTC"):
+            value = datetime(2022, 10, 10, 6, 30, tzinfo=dt_timezone.utc)
+            assert encode_datetime(value) == "2022-10-10T06:30:00Z"
+
+    @pytest.mark.parametrize("value", ["2024-02-31", "2024-02-01T00:00:00"])
+    def test_invalid_date(self, value):
+        with pytest.raises(ValueError):
+            encode_date(value)
+
+
+class TestValidation:
+    def handhaving(self, zaakidentificatie):
+        return Handhaving(
+            zaakidentificatie=zaakidentificatie,
+            geldigVanaf="2024-03-01",
+            geldigTot="2024-03-08",
+        )
+
+    def test_too_long(self):
+        with pytest.raises(ValidationError) as exc_info:
+            self.handhaving("Z" * 41).encode()
+        assert "zaakidentificatie" in exc_info.value.detail
+
+    def test_too_short(self):
+        response = PermitsResponse(
+            number_plate="AB12",
+            passage_at=datetime(2022, 10, 10),
+            has_permit=False,
+            permits=[],
+        )
+        with pytest.raises(ValidationError):
+            response.encode()
+
+    @pytest.mark.parametrize("value", [None, True, ["Z/24/123"]])
+    def test_not_a_string(self, value):
+        with pytest.raises(ValidationError):
+            self.handhaving(value).encode()
+
+    def test_too_short_after_trimming(self):
+        response = PermitsResponse(
+            number_plate=" AB12C ",
+            passage_at=datetime(2022, 10, 10),
+            has_permit=False,
+            permits=[],
+        )
+        with pytest.raises(ValidationError):
+            response.encode()
+
+    def test_numbers_are_strings(self):
+        assert self.handhaving(123).encode()["zaakidentificatie"] == "123"
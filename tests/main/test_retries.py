@@ -0,0 +1,269 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+import requests
+from asgiref.sync import async_to_sync
+from django.test import override_settings
+from django_http_exceptions import HTTPExceptions
+
+from main import retries
+from main.decos import DecosBase
+from main.decos_async import AsyncDecosMixin
+from main.retries import LatencyTracker, RetryBudget, backoff_delay
+
+from ..utils import MockResponse
+
+RETRY_SETTINGS = {
+    "DECOS_MAX_RETRIES": 2,
+    "DECOS_RETRY_BACKOFF": 0,
+    "DECOS_RETRY_BUDGET_RATIO": 0.5,
+    "DECOS_RETRY_BUDGET_CAPACITY": 2,
+}
+
+OK = MockResponse(200, json_content={"content": [1]})
+
+
+@pytest.fixture(autouse=True)
+def retry_settings(monkeypatch):
+    monkeypatch.setattr(retries, "retry_budget", RetryBudget())
+    monkeypatch.setattr(retries, "latencies", LatencyTracker())
+    with override_settings(**RETRY_SETTINGS):
+        yield
+
+
+class TestRetryBudget:
+    def test_budget_starts_full(self):
+        budget = RetryBudget()
+        assert budget.withdraw()
+        assert budget.withdraw()
+        assert not budget.withdraw()
+
+    def test_calls_refill_the_budget(self):
+        budget = RetryBudget()
+        budget.withdraw()
+        budget.withdraw()
+        budget.deposit()
+        assert not budget.withdraw()
+        budget.deposit()
+        assert budget.withdraw()
+
+    def test_budget_is_capped(self):
+        budget = RetryBudget()
+        for _ in range(10):
+            budget.deposit()
+        assert budget.withdraw()
+        assert budget.withdraw()
+        assert not budget.withdraw()
+
+
+class TestLatencyTracker:
+    def test_percentile(self):
+        tracker = LatencyTracker()
+        for duration in range(1, 101):
+            tracker.add(duration / 100)
+        assert tracker.percentile(95) == 0.96
+
+    def test_not_enough_samples(self):
+        tracker = LatencyTracker()
+        tracker.add(1)
+        assert tracker.percentile(95) is None
+
+
+@override_settings(DECOS_RETRY_BACKOFF=0.1, DECOS_RETRY_BACKOFF_MAX=0.3)
+def test_backoff_delay():
+    assert all(0 <= backoff_delay(0) <= 0.1 for _ in range(100))
+    assert all(0 <= backoff_delay(1) <= 0.2 for _ in range(100))
+    assert all(0 <= backoff_delay(5) <= 0.3 for _ in range(100))
+
+
+class DecosRetried(DecosBase):
+    auth_user = "retry_user"
+    auth_pass = "pass"
+    negative_cache_timeout = 0
+
+
+URL = DecosBase.base_url + "KEY/FOLDERS"
+
+
+class TestDecosRetries:
+    @pytest.mark.parametrize(
+        "failure",
+        [
+            requests.exceptions.ConnectionError("reset"),
+            MockResponse(503, json_content={}),
+        ],
+    )
+    def test_failures_are_retried(self, mocker, failure):
+        mocked_response = mocker.patch.object(
+            DecosRetried, "_get_response", side_effect=[failure, failure, OK]
+        )
+        assert DecosRetried()._get(URL) == {"content": [1]}
+        assert mocked_response.call_count == 3
+
+    def test_retries_are_limited(self, mocker):
+        mocked_response = mocker.patch.object(
+            DecosRetried,
+            "_get_response",
+            side_effect=requests.exceptions.ConnectionError("reset"),
+        )
+        with pytest.raises(HTTPExceptions.SERVICE_UNAVAILABLE):
+            DecosRetried()._get(URL)
+        assert mocked_response.call_count == 3
+
+    @pytest.mark.parametrize(
+        "timeout",
+        [requests.exceptions.ReadTimeout, requests.exceptions.ConnectTimeout],
+    )
+    def test_timeouts_are_not_retried(self, mocker, timeout):
+        mocked_response = mocker.patch.object(
+            DecosRetried, "_get_response", side_effect=timeout
+        )
+        with pytest.raises(HTTPExceptions.BASE_EXCEPTION):
+            DecosRetried()._get(URL)
+        assert mocked_response.call_count == 1
+
+    def test_client_errors_are_not_retried(self, mocker):
+        mocked_response = mocker.patch.object(
+            DecosRetried,
+            "_get_response",
+            return_value=MockResponse(404, json_content={}),
+        )
+        with pytest.raises(HTTPExceptions.BAD_GATEWAY):
+            DecosRetried()._get(URL)
+        assert mocked_response.call_count == 1
+
+    def test_retries_stop_when_budget_is_spent(self, mocker):
+        mocked_response = mocker.patch.object(
+            DecosRetried,
+            "_get_response",
+            return_value=MockResponse(503, json_content={}),
+        )
+        for _ in range(2):
+            with pytest.raises(HTTPExceptions.BAD_GATEWAY):
+                DecosRetried()._get(URL)
+        # The first call spends the 2 tokens on its retries, the second call
+        # only adds half a token, so it is not retried
+        assert mocked_response.call_count == 4
+
+    @override_settings(DECOS_RETRY_BACKOFF=10)
+    def test_retries_stop_at_the_deadline(self, mocker):
+        mocked_response = mocker.patch.object(
+            DecosRetried,
+            "_get_response",
+            return_value=MockResponse(503, json_content={}),
+        )
+        mocker.patch("main.retries.random.uniform", return_value=5)
+        with pytest.raises(HTTPExceptions.BAD_GATEWAY):
+            DecosRetried(deadline=time.monotonic() + 2)._get(URL)
+        assert mocked_response.call_count == 1
+
+
+class TestDecosHedging:
+    @pytest.fixture(autouse=True)
+    def fast_decos(self):
+        for _ in range(LatencyTracker.min_samples):
+            retries.latencies.add(0.01)
+        with override_settings(DECOS_HEDGE_REQUESTS=True):
+            yield
+
+    def test_slow_call_is_hedged(self, mocker):
+        release = threading.Event()
+        slow_response = MockResponse(200, json_content={"content": ["slow"]})
+        responses = iter([slow_response, OK])
+
+        def get_response(params, url):
+            response = next(responses)
+            if response is slow_response:
+                release.wait(1)
+            return response
+
+        mocked_response = mocker.patch.object(
+            DecosRetried, "_get_response", side_effect=get_response
+        )
+        assert DecosRetried()._get(URL) == {"content": [1]}
+        release.set()
+        assert mocked_response.call_count == 2
+
+    def test_fast_call_is_not_hedged(self, mocker):
+        mocked_response = mocker.patch.object(
+            DecosRetried, "_get_response", return_value=OK
+        )
+        assert DecosRetried()._get(URL) == {"content": [1]}
+        assert mocked_response.call_count == 1
+
+    def test_no_hedging_without_budget(self, mocker):
+        retries.retry_budget.withdraw()
+        retries.retry_budget.withdraw()
+
+        def get_response(params, url):
+            time.sleep(0.05)
+            return OK
+
+        mocked_response = mocker.patch.object(
+            DecosRetried, "_get_response", side_effect=get_response
+        )
+        assert DecosRetried()._get(URL) == {"content": [1]}
+        assert mocked_response.call_count == 1
+
+
+class AsyncDecosRetried(AsyncDecosMixin, DecosRetried):
+    pass
+
+
+class TestAsyncDecosRetries:
+    def mock_transport(self, mocker, handler):
+        mocker.patch.object(
+            AsyncDecosRetried,
+            "_create_async_client",
+            lambda self: httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+        )
+
+    def test_failures_are_retried(self, mocker):
+        failures = [httpx.RemoteProtocolError("reset"), httpx.Response(503)]
+
+        def handler(request):
+            if failures:
+                failure = failures.pop(0)
+                if isinstance(failure, Exception):
+                    raise failure
+                return failure
+            return httpx.Response(200, json={"content": [1]})
+
+        self.mock_transport(mocker, handler)
+        data = async_to_sync(AsyncDecosRetried()._aget)(URL)
+        assert data == {"content": [1]}
+        assert not failures
+
+    def test_timeouts_are_not_retried(self, mocker):
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            raise httpx.ReadTimeout("timeout")
+
+        self.mock_transport(mocker, handler)
+        with pytest.raises(HTTPExceptions.GATEWAY_TIMEOUT):
+            async_to_sync(AsyncDecosRetried()._aget)(URL)
+        assert len(calls) == 1
+
+    @override_settings(DECOS_HEDGE_REQUESTS=True)
+    def test_slow_call_is_hedged(self, mocker):
+        for _ in range(LatencyTracker.min_samples):
+            retries.latencies.add(0.01)
+        calls = []
+
+        async def get_response(decos, params, url):
+            calls.append(url)
+            if len(calls) == 1:
+                await asyncio.sleep(1)
+                return MockResponse(200, json_content={"content": ["slow"]})
+            return OK
+
+        mocker.patch.object(AsyncDecosRetried, "_aget_response", get_response)
+        started_at = time.monotonic()
+        data = async_to_sync(AsyncDecosRetried()._aget)(URL)
+        assert data == {"content": [1]}
+        assert time.monotonic() - started_at < 0.5
@@ -0,0 +1,188 @@
+import json
+
+import httpx
+import pytest
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.test import override_settings
+from django.urls import path
+
+from main import server_timing
+from main.decos import DecosBase
+from main.middleware import MetricsMiddleware
+from main.queries import QueryTemplate
+from zwaarverkeer.views import AsyncPermitView
+
+from ..utils import MockResponse
+from ..zwaarverkeer.test_zwaarverkeer import create_basic_auth_headers
+
+TIMING_QUERY = QueryTemplate("test.server_timing", {"filter": "key eq '{key}'"})
+
+urlpatterns = [path("zwaarverkeer/get_permits/", AsyncPermitView.as_view())]
+
+
+def phase_names(header):
+    return [entry.split(";")[0] for entry in header.split(", ")]
+
+
+class TestServerTimings:
+    def test_header_value(self):
+        timings = server_timing.ServerTimings()
+        timings.add("validate", 0.001)
+        timings.add("validate", 0.002)
+        timings.add("decos", 0.1, "taxi.driver_key")
+        timings.add("decos", 0.2, "taxi.driver_key")
+        assert timings.header_value() == (
+            "validate;dur=3.0, "
+            'decos;desc="taxi.driver_key";dur=100.0, '
+            'decos;desc="taxi.driver_key";dur=200.0'
+        )
+
+    def test_nothing_is_timed_outside_of_a_request(self):
+        with server_timing.timed("validate"):
+            pass
+        assert server_timing._timings.get() is None
+
+    def test_timed_as_decorator(self):
+        @server_timing.timed("interpret")
+        def interpret():
+            return 1
+
+        token = server_timing.start()
+        assert interpret() == 1
+        assert interpret() == 1
+        timings = server_timing.stop(token)
+        assert phase_names(timings.header_value()) == ["interpret"]
+
+
+class DecosTiming(DecosBase):
+    auth_user = "timing_user"
+    auth_pass = "pass"
+
+
+class TestDecosTiming:
+    URL = DecosBase.base_url + "KEY/FOLDERS"
+
+    def test_concurrent_calls_are_timed(self, mocker):
+        mocker.patch.object(
+            DecosTiming,
+            "_get_response",
+            return_value=MockResponse(200, json_content={"content": [1]}),
+        )
+        decos = DecosTiming()
+
+        token = server_timing.start()
+        decos._map_concurrently(
+            lambda key: decos._get(self.URL, TIMING_QUERY.render(key=key)),
+            ["a", "b", "c"],
+        )
+        header = server_timing.stop(token).header_value()
+        assert header.count('decos;desc="test.server_timing"') == 3
+
+
+class TestServerTimingMiddleware:
+    URL = "/zwaarverkeer/get_permits/"
+    payload = {"number_plate": "AB12CD", "passage_at": "2022-10-10T06:30:00"}
+    auth_headers = create_basic_auth_headers(
+        settings.CLEOPATRA_BASIC_AUTH_USER, settings.CLEOPATRA_BASIC_AUTH_PASS
+    )
+
+    @pytest.fixture(autouse=True)
+    def decos_response(self, mocker):
+        mocker.patch(
+            "zwaarverkeer.views.DecosZwaarverkeer._get_response",
+            return_value=MockResponse(
+                200,
+                json_content={
+                    "count": 1,
+                    "content": [
+                        {
+                            "fields": {
+                                "text17": "Dagontheffing",
+                                "subject1": "Ontheffing",
+                                "date6": "2022-10-10T00:00:00.000",
+                                "date7": "2022-10-10T00:00:00.000",
+                            }
+                        }
+                    ],
+                },
+            ),
+        )
+
+    def _post(self, client, **headers):
+        return client.post(
+            self.URL,
+            json.dumps(self.payload),
+            content_type="application/json",
+            **self.auth_headers,
+            **headers,
+        )
+
+    @override_settings(SERVER_TIMING_ENABLED=True)
+    def test_phases_are_timed(self, client):
+        response = self._post(client)
+        assert response.status_code == 200
+        header = response["Server-Timing"]
+        assert set(phase_names(header)) == {
+            "auth",
+            "validate",
+            "decos",
+            "interpret",
+            "serialize",
+            "total",
+        }
+        assert 'decos;desc="zwaarverkeer.permits";dur=' in header
+
+    def test_disabled_by_default(self, client):
+        response = self._post(client)
+        assert response.status_code == 200
+        assert "Server-Timing" not in response
+
+    @override_settings(SERVER_TIMING_TOKEN="secret")
+    @pytest.mark.parametrize("token, enabled", [("secret", True), ("other", False)])
+    def test_enabled_by_trusted_caller(self, client, token, enabled):
+        response = self._post(client, HTTP_X_SERVER_TIMING=token)
+        assert ("Server-Timing" in response) is enabled
+
+
+class TestAsgi:
+    """
+    Under ASGI the middleware should run as coroutines, so the async views are
+    not moved to a thread by a sync middleware in the chain
+    """
+
+    def test_middleware_chain_is_async(self):
+        # Every middleware is wrapped by Django to convert exceptions, the
+        # wrapper is async when the middleware is
+        wrapper = ASGIHandler()._middleware_chain
+        assert isinstance(wrapper.__wrapped__, MetricsMiddleware)
+        while wrapper is not None:
+            middleware = wrapper.__wrapped__
+            assert iscoroutinefunction(wrapper), middleware
+            assert iscoroutinefunction(middleware), middleware
+            wrapper = getattr(middleware, "get_response", None)
+
+    @override_settings(ROOT_URLCONF=__name__, SERVER_TIMING_ENABLED=True)
+    def test_async_view_is_timed(self, async_client, mocker):
+        mocker.patch(
+            "zwaarverkeer.views.AsyncDecosZwaarverkeer._aget_response",
+            return_value=httpx.Response(
+                200,
+                json={"count": 0, "content": []},
+                request=httpx.Request("GET", "/"),
+            ),
+        )
+        response = async_to_sync(async_client.post)(
+            "/zwaarverkeer/get_permits/",
+            {"number_plate": "AB12CD", "passage_at": "2022-10-10T06:30:00"},
+            content_type="application/json",
+            headers={
+                "Authorization": create_basic_auth_headers(
+                    settings.CLEOPATRA_BASIC_AUTH_USER,
+                    settings.CLEOPATRA_BASIC_AUTH_PASS,
+                )["HTTP_AUTHORIZATION"]
+            },
+        )
+        assert response.status_code == 200
+        assert 'decos;desc="zwaarverkeer.permits";dur=' in response["Server-Timing"]
@@ -0,0 +1,83 @@
+import json
+
+import pytest
+from django.conf import settings
+from django.test import override_settings
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
+
+from main import settings_api
+
+from ..utils import MockResponse
+from ..zwaarverkeer.test_zwaarverkeer import create_basic_auth_headers
+
+URL = "/zwaarverkeer/get_permits/"
+PAYLOAD = {"number_plate": "AB12CD", "passage_at": "2022-10-10T06:30:00"}
+AUTH_HEADERS = create_basic_auth_headers(
+    settings.CLEOPATRA_BASIC_AUTH_USER, settings.CLEOPATRA_BASIC_AUTH_PASS
+)
+
+
+@pytest.fixture(autouse=True)
+def api_profile(mocker):
+    mocker.patch(
+        "zwaarverkeer.views.DecosZwaarverkeer._get_response",
+        return_value=MockResponse(200, json_content={"count": 0, "content": []}),
+    )
+    with override_settings(
+        MIDDLEWARE=settings_api.MIDDLEWARE,
+        TEMPLATES=settings_api.TEMPLATES,
+        ROOT_URLCONF=settings_api.ROOT_URLCONF,
+        REST_FRAMEWORK=settings_api.REST_FRAMEWORK,
+    ):
+        # The views read the defaults of DRF when they are imported, which is
+        # after the settings are loaded when the profile is actually used
+        mocker.patch.multiple(
+            APIView,
+            renderer_classes=api_settings.DEFAULT_RENDERER_CLASSES,
+            parser_classes=api_settings.DEFAULT_PARSER_CLASSES,
+            content_negotiation_class=api_settings.DEFAULT_CONTENT_NEGOTIATION_CLASS,
+        )
+        yield
+
+
+def test_permits(client):
+    response = client.post(
+        URL, json.dumps(PAYLOAD), content_type="application/json", **AUTH_HEADERS
+    )
+    assert response.status_code == 200
+    assert response["Content-Type"] == "application/json"
+    assert response.json()["has_permit"] is False
+    assert "Set-Cookie" not in response
+    assert "Cookie" not in response.get("Vary", "")
+
+
+def test_json_is_rendered_whatever_is_accepted(client):
+    response = client.post(
+        URL,
+        json.dumps(PAYLOAD),
+        content_type="application/json",
+        HTTP_ACCEPT="text/html",
+        **AUTH_HEADERS,
+    )
+    assert response.status_code == 200
+    assert response["Content-Type"] == "application/json"
+
+
+def test_only_json_is_parsed(client):
+    response = client.post(URL, PAYLOAD, **AUTH_HEADERS)
+    assert response.status_code == 415
+
+
+def test_authentication_is_required(client):
+    response = client.post(URL, json.dumps(PAYLOAD), content_type="application/json")
+    assert response.status_code == 403
+
+
+def test_swagger_is_not_served(client):
+    assert client.get("/swagger/").status_code == 404
+
+
+def test_health(client):
+    response = client.get("/status/health")
+    assert response.status_code == 200
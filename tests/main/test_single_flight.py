@@ -0,0 +1,169 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from django.core.cache import cache
+from django.test import override_settings
+from django_http_exceptions import HTTPExceptions
+
+from main.decos import DecosBase
+from main.single_flight import SharedSingleFlight, SingleFlight
+
+from ..utils import MockResponse
+
+
+def call_concurrently(func, times=5):
+    executor = ThreadPoolExecutor(max_workers=times)
+    futures = [executor.submit(func) for _ in range(times)]
+    executor.shutdown(wait=False)
+    # Give every thread the time to join the flight
+    time.sleep(0.1)
+    return futures
+
+
+class TestSingleFlight:
+    def test_concurrent_calls_are_coalesced(self):
+        single_flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def func():
+            calls.append(1)
+            release.wait(1)
+            return {"content": [1]}
+
+        futures = call_concurrently(lambda: single_flight.do("key", func))
+        release.set()
+        results = [future.result() for future in futures]
+        assert len(calls) == 1
+        assert all(result is results[0] for result in results)
+
+    def test_exception_is_shared(self):
+        single_flight = SingleFlight()
+        release = threading.Event()
+
+        def func():
+            release.wait(1)
+            raise ValueError("error")
+
+        futures = call_concurrently(lambda: single_flight.do("key", func))
+        release.set()
+        for future in futures:
+            with pytest.raises(ValueError):
+                future.result()
+
+    def test_callers_wait_at_most_their_timeout(self):
+        single_flight = SingleFlight()
+        release = threading.Event()
+
+        def func():
+            release.wait(1)
+            return 1
+
+        leader = call_concurrently(lambda: single_flight.do("key", func), 1)[0]
+        with pytest.raises(TimeoutError):
+            single_flight.do("key", func, timeout=0.05)
+        release.set()
+        assert leader.result() == 1
+
+    def test_finished_calls_are_not_reused(self):
+        single_flight = SingleFlight()
+        assert single_flight.do("key", lambda: 1) == 1
+        assert single_flight.do("key", lambda: 2) == 2
+
+
+class TestSharedSingleFlight:
+    def test_result_of_other_worker_is_used(self):
+        single_flight = SharedSingleFlight(timeout=1)
+        cache.set("singleflight:key", "other-flight")
+
+        def finish_other_flight():
+            time.sleep(0.1)
+            cache.set("singleflight:key:other-flight", "result of other worker")
+            cache.delete("singleflight:key")
+
+        threading.Thread(target=finish_other_flight).start()
+        assert single_flight.do("key", lambda: "own result") == "result of other worker"
+
+    def test_runs_itself_when_other_worker_failed(self):
+        single_flight = SharedSingleFlight(timeout=1)
+        cache.set("singleflight:key", "other-flight")
+
+        def fail_other_flight():
+            time.sleep(0.1)
+            cache.delete("singleflight:key")
+
+        threading.Thread(target=fail_other_flight).start()
+        assert single_flight.do("key", lambda: "own result") == "own result"
+
+    def test_lock_is_released(self):
+        single_flight = SharedSingleFlight(timeout=1)
+        assert single_flight.do("key", lambda: 1) == 1
+        assert cache.get("singleflight:key") is None
+        assert single_flight.do("key", lambda: 2) == 2
+
+
+class DecosCoalesced(DecosBase):
+    auth_user = "user"
+    auth_pass = "pass"
+
+
+class TestDecosCoalescing:
+    URL = DecosBase.base_url + "KEY/FOLDERS"
+
+    @pytest.fixture
+    def slow_response(self, mocker):
+        release = threading.Event()
+
+        def get_response(params, url):
+            release.wait(1)
+            return MockResponse(200, json_content={"content": [params]})
+
+        mocked_response = mocker.patch.object(
+            DecosCoalesced, "_get_response", side_effect=get_response
+        )
+        return mocked_response, release
+
+    @pytest.mark.parametrize("across_workers", [False, True])
+    def test_identical_requests_are_coalesced(self, slow_response, across_workers):
+        mocked_response, release = slow_response
+        with override_settings(DECOS_COALESCE_ACROSS_WORKERS=across_workers):
+            futures = call_concurrently(
+                lambda: DecosCoalesced()._get(self.URL, {"filter": "a eq 'b'"})
+            )
+            other_future = call_concurrently(
+                lambda: DecosCoalesced()._get(self.URL, {"filter": "a eq 'c'"}), 1
+            )[0]
+            release.set()
+            results = [future.result() for future in futures]
+
+        assert results[0] == {"content": ["filter=a%20eq%20%27b%27"]}
+        assert all(result == results[0] for result in results)
+        assert other_future.result() == {"content": ["filter=a%20eq%20%27c%27"]}
+        assert mocked_response.call_count == 2
+
+    def test_errors_are_shared(self, mocker):
+        release = threading.Event()
+
+        def get_response(params, url):
+            release.wait(1)
+            return MockResponse(500, json_content={})
+
+        mocked_response = mocker.patch.object(
+            DecosCoalesced, "_get_response", side_effect=get_response
+        )
+        futures = call_concurrently(lambda: DecosCoalesced()._get(self.URL, {}))
+        release.set()
+        for future in futures:
+            with pytest.raises(HTTPExceptions.BAD_GATEWAY):
+                future.result()
+        assert mocked_response.call_count == 1
+
+    @override_settings(DECOS_COALESCE_REQUESTS=False)
+    def test_coalescing_can_be_disabled(self, slow_response):
+        mocked_response, release = slow_response
+        futures = call_concurrently(lambda: DecosCoalesced()._get(self.URL, {}), 3)
+        release.set()
+        [future.result() for future in futures]
+        assert mocked_response.call_count == 3
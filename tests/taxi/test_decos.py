@@ -1,12 +1,13 @@
 from unittest.mock import patch
 
 import pytest
+from django.core.cache import cache
 from django_http_exceptions import HTTPExceptions
 from requests import Request
 
 import taxi
 from taxi.decos import DecosTaxi, DecosTaxiDetail, DecosTaxiDriver
-from taxi.enums import DecosZaaknummers
+from taxi.enums import DecosZaaknummers, PermitParams
 from taxi.serializers import HandhavingSerializer, OntheffingResponseSerializer
 
 from ..utils import MockResponse
@@ -173,6 +174,47 @@ class TestDecosTaxiResponse:
         assert len(driver_permits) == 1
         assert len(driver_permits[0]["schorsingen"]) == 1
 
+    def test_get_ontheffing_driver_multiple_permits(self, decos, mocker):
+        permits = mock_ontheffing_driver()
+        permits["content"] = [
+            {**permits["content"][0], "key": f"PERMIT{i}"} for i in range(3)
+        ]
+        mocker.patch.object(decos, "_get_driver_decos_key", return_value=mock_driver())
+        mocker.patch.object(decos, "_get_ontheffing", return_value=permits)
+
+        def get_handhavingzaken(permit_decos_key):
+            handhavingen = mock_handhavingen()
+            handhavingen["content"][0]["key"] = f"HANDHAVING-{permit_decos_key}"
+            return handhavingen
+
+        mocker.patch.object(
+            decos, "_get_handhavingzaken", side_effect=get_handhavingzaken
+        )
+        driver_permits = decos.get_ontheffingen(
+            driver_bsn="123", ontheffingsnummer="123"
+        )
+        assert [
+            permit["schorsingen"][0]["zaakidentificatie"] for permit in driver_permits
+        ] == ["HANDHAVING-PERMIT0", "HANDHAVING-PERMIT1", "HANDHAVING-PERMIT2"]
+
+    def test_get_handhavingzaken_once_per_permit(self, decos, mocker):
+        mocked_handhavingzaken = mocker.patch.object(
+            decos, "_get_handhavingzaken", return_value=mock_handhavingen()
+        )
+        permits = [
+            {PermitParams.zaakidentificatie.name: key} for key in ["A", "B", "A"]
+        ]
+        decos._add_enforcement_cases_to_permits(permits)
+
+        assert mocked_handhavingzaken.call_count == 2
+        assert {
+            call.kwargs["permit_decos_key"]
+            for call in mocked_handhavingzaken.call_args_list
+        } == {"A", "B"}
+        for permit in permits:
+            assert PermitParams.zaakidentificatie.name not in permit
+            assert len(permit["schorsingen"]) == 1
+
     @patch("taxi.decos.DecosTaxiDriver._get_response")
     def test_get_ontheffing_driver_empty(self, mocked_response, decos):
         mocked_response.side_effect = [
@@ -209,3 +251,80 @@ class TestDecosTaxiResponse:
     def test_string_response(self, decos_detail):
         with pytest.raises(HTTPExceptions.NOT_FOUND):
             decos_detail.get_ontheffingen(ontheffingsnummer="123")
+
+
+class TestDriverKeyCache:
+    DRIVER_KEY = mock_driver()["content"][0]["key"]
+
+    def get_ontheffingen(self, decos):
+        return decos.get_ontheffingen(driver_bsn="233090125", ontheffingsnummer="123")
+
+    def test_driver_key_is_cached(self, decos, mocker):
+        mocked_driver_key = mocker.patch.object(
+            decos, "_get_driver_decos_key", return_value=mock_driver()
+        )
+        mocked_ontheffing = mocker.patch.object(
+            decos, "_get_ontheffing", return_value=mock_ontheffing_driver()
+        )
+        mocker.patch.object(
+            decos, "_get_handhavingzaken", return_value=mock_handhavingen()
+        )
+
+        assert len(self.get_ontheffingen(decos)) == 1
+        assert len(self.get_ontheffingen(decos)) == 1
+        assert mocked_driver_key.call_count == 1
+        assert mocked_ontheffing.call_count == 2
+
+    def test_bsn_is_hashed(self, decos):
+        cache_key = decos._get_driver_key_cache_key("233090125")
+        assert "233090125" not in cache_key
+        assert cache_key == DecosTaxiDriver()._get_driver_key_cache_key("233090125")
+        assert cache_key != decos._get_driver_key_cache_key("233090126")
+
+    @pytest.mark.parametrize(
+        "not_found",
+        [
+            mock_ontheffing_driver_empty(),
+            HTTPExceptions.NOT_FOUND.with_content("Decos responded with error"),
+        ],
+    )
+    def test_changed_driver_key_is_looked_up_again(self, decos, mocker, not_found):
+        cache.set(decos._get_driver_key_cache_key("233090125"), "OLD-KEY")
+        new_driver = mock_driver()
+        new_driver["content"][0]["key"] = "NEW-KEY"
+        mocker.patch.object(decos, "_get_driver_decos_key", return_value=new_driver)
+
+        def get_ontheffing(driver_key, ontheffingsnummer):
+            if driver_key == "OLD-KEY":
+                if isinstance(not_found, Exception):
+                    raise not_found
+                return not_found
+            return mock_ontheffing_driver()
+
+        mocker.patch.object(decos, "_get_ontheffing", side_effect=get_ontheffing)
+        mocker.patch.object(
+            decos, "_get_handhavingzaken", return_value=mock_handhavingen()
+        )
+
+        assert len(self.get_ontheffingen(decos)) == 1
+        assert cache.get(decos._get_driver_key_cache_key("233090125")) == "NEW-KEY"
+
+    def test_unchanged_driver_key_without_permits(self, decos, mocker):
+        cache.set(decos._get_driver_key_cache_key("233090125"), self.DRIVER_KEY)
+        mocked_driver_key = mocker.patch.object(
+            decos, "_get_driver_decos_key", return_value=mock_driver()
+        )
+        mocked_ontheffing = mocker.patch.object(
+            decos, "_get_ontheffing", return_value=mock_ontheffing_driver_empty()
+        )
+
+        assert self.get_ontheffingen(decos) == []
+        assert mocked_driver_key.call_count == 1
+        assert mocked_ontheffing.call_count == 1
+
+    @patch("taxi.decos.DecosTaxiDriver._get_response")
+    def test_driver_key_lookup_bypasses_response_cache(self, mocked_response, decos):
+        mocked_response.return_value = MockResponse(200, mock_driver())
+        decos._get_driver_decos_key("233090125")
+        decos._get_driver_decos_key("233090125")
+        assert mocked_response.call_count == 2
@@ -1,11 +1,14 @@
 from unittest.mock import patch
 
 import pytest
+from asgiref.sync import async_to_sync
 from django.urls import reverse
+from django_http_exceptions import HTTPExceptions
 from rest_framework import status
-from rest_framework.test import APIClient
+from rest_framework.test import APIClient, APIRequestFactory
 
 from taxi.enums import PermitParams
+from taxi.views import AsyncOntheffingDetailView, AsyncOntheffingenBSNView
 
 from ..utils import MockResponse
 from .mock_data import *
@@ -146,3 +149,81 @@ class TestViews:
         url = reverse("taxi_ontheffing_details", kwargs=kwargs)
         response = client.get(url)
         assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def mock_aget(*responses):
+    """
+    Returns the given Decos responses, one for every async Decos request
+    """
+    responses = iter(responses)
+
+    async def _aget(*args, **kwargs):
+        return next(responses)
+
+    return _aget
+
+
+@patch("main.authentication.BasicAuthWithKeys.authenticate", force_auth)
+class TestAsyncViews:
+    @patch(
+        "taxi.decos.AsyncDecosTaxiDriver._aget",
+        mock_aget(mock_driver(), mock_ontheffing_driver(), mock_handhavingen()),
+    )
+    def test_ontheffingen_bsn(self):
+        data = {"bsn": "123456789", "ontheffingsnummer": "1234567"}
+        request = APIRequestFactory().post("/taxi/ontheffingen/", data, format="json")
+        response = async_to_sync(AsyncOntheffingenBSNView.as_view())(request)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["ontheffing"][0][
+            PermitParams.ontheffingsnummer.name
+        ] == str(data["ontheffingsnummer"])
+        assert (
+            response.data["ontheffing"][0]["schorsingen"][0][
+                PermitParams.zaakidentificatie.name
+            ]
+            == "7CAAF40DB75A46BDB5CD5B2A948221B3"
+        )
+
+    @patch(
+        "taxi.decos.AsyncDecosTaxiDriver._aget",
+        mock_aget({"count": 0, "content": []}),
+    )
+    def test_ontheffingen_bsn_unknown_driver(self):
+        data = {"bsn": "123456789", "ontheffingsnummer": "1234567"}
+        request = APIRequestFactory().post("/taxi/ontheffingen/", data, format="json")
+        response = async_to_sync(AsyncOntheffingenBSNView.as_view())(request)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["ontheffing"] == []
+
+    def test_ontheffingen_bsn_too_few_digits(self):
+        data = {"bsn": "123", "ontheffingsnummer": "1234567"}
+        request = APIRequestFactory().post("/taxi/ontheffingen/", data, format="json")
+        response = async_to_sync(AsyncOntheffingenBSNView.as_view())(request)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    @patch(
+        "taxi.decos.AsyncDecosTaxiDetail._aget",
+        mock_aget(mock_ontheffing_detail(), mock_handhavingen()),
+    )
+    def test_ontheffingen_detail(self):
+        request = APIRequestFactory().get("/taxi/ontheffingen/1978110/")
+        response = async_to_sync(AsyncOntheffingDetailView.as_view())(
+            request, ontheffingsnummer="1978110"
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data[PermitParams.ontheffingsnummer.name] == "1978110"
+        assert len(response.data["schorsingen"]) == 1
+
+    @patch(
+        "taxi.decos.AsyncDecosTaxiDetail._aget",
+        mock_aget(mock_ontheffing_detail_empty()),
+    )
+    def test_ontheffingen_detail_not_found(self):
+        request = APIRequestFactory().get("/taxi/ontheffingen/1978110/")
+        with pytest.raises(HTTPExceptions.NOT_FOUND):
+            async_to_sync(AsyncOntheffingDetailView.as_view())(
+                request, ontheffingsnummer="1978110"
+            )
@@ -9,6 +9,8 @@ class MockResponse:
     def __init__(self, status_code, json_content=None, content=None, headers=None):
         self.status_code = status_code
         self.json_content = json_content
+        if content is None and json_content is not None:
+            content = json.dumps(json_content).encode()
         self.content = content
         self.headers = headers
 
@@ -0,0 +1,230 @@
+import json
+from datetime import datetime, time, timedelta
+from urllib.parse import unquote
+
+import pytest
+from django.conf import settings
+from django.test import override_settings
+from django.utils import timezone
+
+from tests.utils import MockResponse
+from zwaarverkeer.decos import DecosZwaarverkeer
+from zwaarverkeer.snapshot import PermitSnapshot, permit_snapshot, split_number_plates
+
+from .test_zwaarverkeer import create_basic_auth_headers
+
+TODAY = timezone.localdate()
+
+
+def decos_date(days):
+    return f"{(TODAY + timedelta(days=days)).isoformat()}T00:00:00.000"
+
+
+def local_datetime(days, hour=0):
+    return timezone.make_aware(
+        datetime.combine(TODAY + timedelta(days=days), time(hour=hour))
+    )
+
+
+def permit(number_plates, permit_type, valid_from, valid_until):
+    return {
+        "fields": {
+            "text49": number_plates,
+            "text17": permit_type,
+            "subject1": f"{permit_type} {number_plates}",
+            "date6": decos_date(valid_from),
+            "date7": decos_date(valid_until),
+        }
+    }
+
+
+DECOS_PERMITS = [
+    permit("AB12CD", "Jaarontheffing", -100, 100),
+    permit("AB12CD", "Dagontheffing", -1, -1),
+    permit("EF34GH, IJ56KL", "Routeontheffing", 1, 2),
+    permit("MN78OP", None, -1, 1),
+]
+
+
+@pytest.fixture
+def snapshot(mocker):
+    mocked_response = mocker.patch(
+        "zwaarverkeer.snapshot.SnapshotDecosZwaarverkeer._get_response",
+        side_effect=[
+            MockResponse(200, json_content={"count": 4, "content": DECOS_PERMITS[:2]}),
+            MockResponse(200, json_content={"count": 4, "content": DECOS_PERMITS[2:]}),
+        ],
+    )
+    snapshot = PermitSnapshot()
+    mocker.patch.object(snapshot, "start")
+    with override_settings(ZWAARVERKEER_SNAPSHOT_ENABLED=True):
+        snapshot.sync()
+        yield snapshot
+    assert mocked_response.call_count == 2
+
+
+class TestPermitSnapshot:
+    def test_sync_requests_all_permits_valid_since_yesterday(self, mocker):
+        mocked_response = mocker.patch(
+            "zwaarverkeer.snapshot.SnapshotDecosZwaarverkeer._get_response",
+            return_value=MockResponse(200, json_content={"count": 0, "content": []}),
+        )
+        PermitSnapshot().sync()
+
+        request_params = unquote(mocked_response.call_args.kwargs["params"])
+        assert f"date7 ge '{(TODAY - timedelta(days=1)).isoformat()}'" in request_params
+        assert "text49" not in request_params.split("filter=")[1]
+
+    @pytest.mark.parametrize(
+        "number_plate, passage_at, expected_permit_types",
+        [
+            ("AB12CD", local_datetime(0, hour=5), ["Jaarontheffing", "Dagontheffing"]),
+            ("AB12CD", local_datetime(0, hour=7), ["Jaarontheffing"]),
+            ("AB12CD", local_datetime(101), []),
+            ("EF34GH", local_datetime(0), []),
+            ("EF34GH", local_datetime(1), ["Routeontheffing"]),
+            ("IJ56KL", local_datetime(2, hour=23), ["Routeontheffing"]),
+            ("IJ56KL", local_datetime(3), []),
+            # Permits without a type are disregarded
+            ("MN78OP", local_datetime(0), []),
+        ],
+    )
+    def test_get_permits(
+        self, snapshot, number_plate, passage_at, expected_permit_types
+    ):
+        permits = snapshot.get_permits(number_plate=number_plate, passage_at=passage_at)
+        assert [p["permit_type"] for p in permits] == expected_permit_types
+
+    def test_permits_match_decos(self, snapshot, mocker):
+        mocker.patch(
+            "zwaarverkeer.decos.DecosZwaarverkeer._get_response",
+            return_value=MockResponse(
+                200, json_content={"count": 2, "content": DECOS_PERMITS[:2]}
+            ),
+        )
+        passage_at = local_datetime(0, hour=5)
+        assert snapshot.get_permits(
+            number_plate="AB12CD", passage_at=passage_at
+        ) == DecosZwaarverkeer().get_permits(
+            number_plate="AB12CD", passage_at=passage_at
+        )
+
+    def test_naive_passage_is_local(self, snapshot):
+        permits = snapshot.get_permits(
+            number_plate="AB12CD",
+            passage_at=datetime.combine(TODAY, time(hour=5)),
+        )
+        assert len(permits) == 2
+
+    def test_passages_before_snapshot_are_not_answered(self, snapshot):
+        passage_at = local_datetime(-1)
+        assert (
+            snapshot.get_permits(number_plate="AB12CD", passage_at=passage_at) is None
+        )
+
+    def test_unknown_number_plates_are_not_answered(self, snapshot):
+        # A permit may have been granted since the snapshot was synced
+        passage_at = local_datetime(0)
+        assert (
+            snapshot.get_permits(number_plate="QR90ST", passage_at=passage_at) is None
+        )
+
+    def test_outdated_snapshot_is_not_used(self, snapshot):
+        snapshot.synced_at -= settings.ZWAARVERKEER_SNAPSHOT_MAX_AGE + 1
+        passage_at = local_datetime(0)
+        assert (
+            snapshot.get_permits(number_plate="AB12CD", passage_at=passage_at) is None
+        )
+
+    def test_disabled(self, snapshot):
+        with override_settings(ZWAARVERKEER_SNAPSHOT_ENABLED=False):
+            passage_at = local_datetime(0)
+            assert (
+                snapshot.get_permits(number_plate="AB12CD", passage_at=passage_at)
+                is None
+            )
+
+    def test_split_number_plates(self):
+        assert split_number_plates("ab12cd, EF34GH;IJ56KL  MN78OP") == [
+            "AB12CD",
+            "EF34GH",
+            "IJ56KL",
+            "MN78OP",
+        ]
+        assert split_number_plates("") == []
+
+
+class TestPermitViewWithSnapshot:
+    URL = "/zwaarverkeer/get_permits/"
+    auth_headers = create_basic_auth_headers(
+        settings.CLEOPATRA_BASIC_AUTH_USER, settings.CLEOPATRA_BASIC_AUTH_PASS
+    )
+
+    def _post(self, client, passage_at):
+        payload = {"number_plate": "ab12cd", "passage_at": passage_at.isoformat()}
+        response = client.post(
+            self.URL,
+            json.dumps(payload),
+            content_type="application/json",
+            **self.auth_headers,
+        )
+        assert response.status_code == 200
+        return json.loads(response.content)
+
+    def test_passage_is_answered_from_snapshot(self, client, snapshot, mocker):
+        mocker.patch("zwaarverkeer.views.permit_snapshot", snapshot)
+        mocked_response = mocker.patch(
+            "zwaarverkeer.views.DecosZwaarverkeer._get_response"
+        )
+
+        response_dict = self._post(client, local_datetime(0, hour=5))
+        assert response_dict["has_permit"] is True
+        assert len(response_dict["permits"]) == 2
+        assert not mocked_response.called
+
+    def test_decos_is_asked_when_snapshot_cannot_answer(self, client, mocker):
+        mocker.patch.object(permit_snapshot, "start")
+        mocked_response = mocker.patch(
+            "zwaarverkeer.views.DecosZwaarverkeer._get_response",
+            return_value=MockResponse(
+                200, json_content={"count": 1, "content": DECOS_PERMITS[:1]}
+            ),
+        )
+        with override_settings(ZWAARVERKEER_SNAPSHOT_ENABLED=True):
+            response_dict = self._post(client, local_datetime(0, hour=5))
+        assert response_dict["has_permit"] is True
+        assert mocked_response.call_count == 1
+
+    def test_batch_asks_decos_only_for_unanswered_passages(
+        self, client, snapshot, mocker
+    ):
+        mocker.patch("zwaarverkeer.views.permit_snapshot", snapshot)
+        mocked_response = mocker.patch(
+            "zwaarverkeer.views.DecosZwaarverkeer._get_response",
+            return_value=MockResponse(200, json_content={"count": 0, "content": []}),
+        )
+        passages = [
+            {"number_plate": number_plate, "passage_at": passage_at.isoformat()}
+            for number_plate, passage_at in [
+                ("AB12CD", local_datetime(0, hour=5)),
+                ("QR90ST", local_datetime(0, hour=5)),
+                ("AB12CD", local_datetime(-1, hour=5)),
+            ]
+        ]
+        response = client.post(
+            self.URL + "batch/",
+            json.dumps({"passages": passages}),
+            content_type="application/json",
+            **self.auth_headers,
+        )
+        assert response.status_code == 200
+        response_passages = json.loads(response.content)["passages"]
+        assert [len(passage["permits"]) for passage in response_passages] == [2, 0, 0]
+
+        requested_plates = [
+            number_plate
+            for call in mocked_response.call_args_list
+            for number_plate in ["AB12CD", "QR90ST"]
+            if number_plate in unquote(call.kwargs["params"])
+        ]
+        assert sorted(requested_plates) == ["AB12CD", "QR90ST"]
@@ -1,13 +1,20 @@
 import base64
 import json
+from urllib.parse import unquote
 
+import httpx
 import pytest
 import requests
+from asgiref.sync import async_to_sync
 from dateutil.parser import parse
 from django.conf import settings
+from django.test import override_settings
+from django_http_exceptions import HTTPExceptions
+from rest_framework.test import APIRequestFactory
 
 from tests.utils import MockResponse
 from zwaarverkeer.decos import DecosZwaarverkeer
+from zwaarverkeer.views import AsyncPermitView
 
 
 def create_basic_auth_headers(username, password):
@@ -286,6 +293,73 @@ class TestDecosZwaarverkeer:
 
         assert result == expected
 
+    def test_get_permits_is_cached_per_plate_and_day(self, mocker):
+        decos_response = {
+            "count": 1,
+            "content": [
+                {
+                    "fields": {
+                        "text17": "Dagontheffing",
+                        "subject1": "Ontheffing 7,5 ton Binnenstad ABC123",
+                        "date6": "2021-10-10T00:00:00.000",
+                        "date7": "2021-10-10T00:00:00.000",
+                    }
+                }
+            ],
+        }
+        mocked_response = mocker.patch(
+            "zwaarverkeer.views.DecosZwaarverkeer._get_response",
+            return_value=MockResponse(200, json_content=decos_response),
+        )
+
+        decos = DecosZwaarverkeer()
+        first = decos.get_permits(
+            number_plate="ABC123", passage_at=parse("2021-10-10T10:00:00")
+        )
+        second = decos.get_permits(
+            number_plate="ABC123", passage_at=parse("2021-10-10T10:05:00")
+        )
+        assert first == second
+        assert len(first) == 1
+        assert mocked_response.call_count == 1
+
+        decos.get_permits(
+            number_plate="DEF456", passage_at=parse("2021-10-10T10:05:00")
+        )
+        decos.get_permits(
+            number_plate="ABC123", passage_at=parse("2021-10-11T10:05:00")
+        )
+        assert mocked_response.call_count == 3
+
+    def test_get_permits_caches_empty_results(self, mocker):
+        mocked_response = mocker.patch(
+            "zwaarverkeer.views.DecosZwaarverkeer._get_response",
+            return_value=MockResponse(200, json_content={"count": 0, "content": []}),
+        )
+
+        decos = DecosZwaarverkeer()
+        passage_at = parse("2021-10-10T10:00:00")
+        assert decos.get_permits(number_plate="ABC123", passage_at=passage_at) == []
+        assert decos.get_permits(number_plate="ABC123", passage_at=passage_at) == []
+        assert mocked_response.call_count == 1
+
+    @pytest.mark.parametrize(
+        "now, permit_type, expected_timeout",
+        [
+            # Year permits change validity at midnight
+            ("2021-10-10T23:57:00+02:00", "Jaarontheffing", 180),
+            # Day permits change validity at 06:00
+            ("2021-10-10T05:57:00+02:00", "Dagontheffing", 180),
+            ("2021-10-10T23:57:00+02:00", "Dagontheffing", 180),
+            # Never cache longer than the configured timeout
+            ("2021-10-10T12:00:00+02:00", "Dagontheffing", 300),
+        ],
+    )
+    def test_get_cache_timeout(self, mocker, now, permit_type, expected_timeout):
+        mocker.patch("zwaarverkeer.decos.timezone.localtime", return_value=parse(now))
+        content = [{"fields": {"text17": permit_type}}]
+        assert DecosZwaarverkeer()._get_cache_timeout(content) == expected_timeout
+
 
 class TestVerkeersvergunningen:
     URL = "/zwaarverkeer/get_permits/"
@@ -359,6 +433,23 @@ class TestVerkeersvergunningen:
         expected_permit = expected["permits"][0]
         assert response_permit == expected_permit
 
+    def test_padded_number_plate(self, client, mocker):
+        get_permits = mocker.patch(
+            "zwaarverkeer.views.DecosZwaarverkeer.get_permits", return_value=[]
+        )
+        payload = {"number_plate": " 1234ab ", "passage_at": "2022-10-10T06:30:00"}
+
+        response = client.post(
+            self.URL,
+            json.dumps(payload),
+            content_type="application/json",
+            **self.auth_headers,
+        )
+
+        assert response.status_code == 200
+        assert json.loads(response.content)["number_plate"] == "1234AB"
+        assert get_permits.call_args.kwargs["number_plate"] == "1234AB"
+
     def test_other_requests_than_post(self, client):
         response = client.get(self.URL, **self.auth_headers)
         assert response.status_code == 405
@@ -421,3 +512,219 @@ class TestVerkeersvergunningen:
             **self.auth_headers,
         )
         assert response.status_code == 400
+
+
+class TestPermitBatch:
+    URL = "/zwaarverkeer/get_permits/batch/"
+    auth_headers = create_basic_auth_headers(
+        settings.CLEOPATRA_BASIC_AUTH_USER, settings.CLEOPATRA_BASIC_AUTH_PASS
+    )
+    decos_response = {
+        "count": 1,
+        "content": [
+            {
+                "fields": {
+                    "text17": "Dagontheffing",
+                    "subject1": "Ontheffing 7,5 ton Binnenstad ABC123",
+                    "date6": "2022-10-10T00:00:00.000",
+                    "date7": "2022-10-10T00:00:00.000",
+                }
+            }
+        ],
+    }
+
+    passages = [
+        {"number_plate": "ABC123", "passage_at": parse("2022-10-10T10:00:00")},
+        {"number_plate": "DEF456", "passage_at": parse("2022-10-10T10:00:00")},
+        {"number_plate": "ABC123", "passage_at": parse("2022-10-11T05:00:00")},
+        {"number_plate": "ABC123", "passage_at": parse("2022-10-11T07:00:00")},
+    ]
+
+    def test_get_permits_batch(self, mocker):
+        mocked_response = mocker.patch(
+            "zwaarverkeer.views.DecosZwaarverkeer._get_response",
+            return_value=MockResponse(200, json_content=self.decos_response),
+        )
+        result = DecosZwaarverkeer().get_permits_batch(passages=self.passages)
+        assert [len(permits) for permits in result] == [1, 1, 1, 0]
+        # One request per number plate and day
+        assert mocked_response.call_count == 3
+
+        # The permits of a day are cached for the single passage checks
+        permits = DecosZwaarverkeer().get_permits(
+            number_plate="ABC123", passage_at=parse("2022-10-11T05:00:00")
+        )
+        assert len(permits) == 1
+        assert mocked_response.call_count == 3
+
+    @override_settings(ZWAARVERKEER_BATCH_DAILY_LOOKUPS=1)
+    def test_get_permits_batch_for_period(self, mocker):
+        mocked_response = mocker.patch(
+            "zwaarverkeer.views.DecosZwaarverkeer._get_response",
+            return_value=MockResponse(200, json_content=self.decos_response),
+        )
+        result = DecosZwaarverkeer().get_permits_batch(passages=self.passages)
+        assert [len(permits) for permits in result] == [1, 1, 1, 0]
+        # One request per number plate
+        assert mocked_response.call_count == 2
+
+        (request_params,) = [
+            unquote(call.kwargs["params"])
+            for call in mocked_response.call_args_list
+            if "ABC123" in unquote(call.kwargs["params"])
+        ]
+        assert "date6 le '2022-10-11'" in request_params
+        assert "date7 ge '2022-10-09'" in request_params
+
+    def test_batch_view(self, client, mocker):
+        mocker.patch(
+            "zwaarverkeer.views.DecosZwaarverkeer._get_response",
+            return_value=MockResponse(200, json_content=self.decos_response),
+        )
+        payload = {
+            "passages": [
+                {"number_plate": "abc123", "passage_at": "2022-10-10T06:30:00.000"},
+                {"number_plate": "ABC123", "passage_at": "2022-10-11T06:30:00+02:00"},
+            ]
+        }
+        response = client.post(
+            self.URL,
+            json.dumps(payload),
+            content_type="application/json",
+            **self.auth_headers,
+        )
+        assert response.status_code == 200
+        response_dict = json.loads(response.content)
+        assert response_dict == {
+            "passages": [
+                {
+                    "number_plate": "ABC123",
+                    "passage_at": "2022-10-10T06:30:00+02:00",
+                    "has_permit": True,
+                    "permits": [
+                        {
+                            "permit_type": "Dagontheffing",
+                            "permit_description": "Ontheffing 7,5 ton Binnenstad ABC123",
+                            "valid_from": "2022-10-10T00:00:00+02:00",
+                            "valid_until": "2022-10-11T06:00:00+02:00",
+                        }
+                    ],
+                },
+                {
+                    "number_plate": "ABC123",
+                    "passage_at": "2022-10-11T06:30:00+02:00",
+                    "has_permit": False,
+                    "permits": [],
+                },
+            ]
+        }
+
+    @pytest.mark.parametrize(
+        "payload",
+        [
+            {"passages": []},
+            {"passages": [{"number_plate": "ABC123"}]},
+            {"number_plate": "ABC123", "passage_at": "2022-10-10T06:30:00.000"},
+        ],
+    )
+    def test_batch_view_invalid_payload(self, client, payload):
+        response = client.post(
+            self.URL,
+            json.dumps(payload),
+            content_type="application/json",
+            **self.auth_headers,
+        )
+        assert response.status_code == 400
+
+    @override_settings(ZWAARVERKEER_BATCH_MAX_NUMBER_PLATES=1)
+    def test_batch_view_too_many_number_plates(self, client):
+        payload = {
+            "passages": [
+                {"number_plate": "abc123", "passage_at": "2022-10-10T06:30:00.000"},
+                {"number_plate": "ABC123", "passage_at": "2022-10-11T06:30:00.000"},
+                {"number_plate": "DEF456", "passage_at": "2022-10-11T06:30:00.000"},
+            ]
+        }
+        response = client.post(
+            self.URL,
+            json.dumps(payload),
+            content_type="application/json",
+            **self.auth_headers,
+        )
+        assert response.status_code == 400
+        assert "number plates" in json.loads(response.content)["passages"][0]
+
+    def test_batch_view_no_basic_auth_credentials(self, client):
+        response = client.post(
+            self.URL, json.dumps({"passages": []}), content_type="application/json"
+        )
+        assert response.status_code == 403
+
+
+class TestAsyncPermitView:
+    auth_headers = create_basic_auth_headers(
+        settings.CLEOPATRA_BASIC_AUTH_USER, settings.CLEOPATRA_BASIC_AUTH_PASS
+    )
+
+    def _post(self, payload, **headers):
+        request = APIRequestFactory().post(
+            "/zwaarverkeer/get_permits/",
+            json.dumps(payload),
+            content_type="application/json",
+            **headers,
+        )
+        response = async_to_sync(AsyncPermitView.as_view())(request)
+        response.render()
+        return response
+
+    def test_post(self, mocker):
+        decos_response = {
+            "count": 1,
+            "content": [
+                {
+                    "fields": {
+                        "text17": "Dagontheffing",
+                        "subject1": "Ontheffing 7,5 ton Binnenstad ABC123",
+                        "date6": "2022-10-10T00:00:00.000",
+                        "date7": "2022-10-10T00:00:00.000",
+                    }
+                }
+            ],
+        }
+        mocker.patch(
+            "zwaarverkeer.views.AsyncDecosZwaarverkeer._aget_response",
+            return_value=httpx.Response(
+                200, json=decos_response, request=httpx.Request("GET", "/")
+            ),
+        )
+        payload = {"number_plate": "abc123", "passage_at": "2022-10-10T06:30:00"}
+        response = self._post(payload, **self.auth_headers)
+
+        assert response.status_code == 200
+        assert json.loads(response.content) == {
+            "number_plate": "ABC123",
+            "passage_at": "2022-10-10T06:30:00+02:00",
+            "has_permit": True,
+            "permits": [
+                {
+                    "permit_type": "Dagontheffing",
+                    "permit_description": "Ontheffing 7,5 ton Binnenstad ABC123",
+                    "valid_from": "2022-10-10T00:00:00+02:00",
+                    "valid_until": "2022-10-11T06:00:00+02:00",
+                }
+            ],
+        }
+
+    def test_no_basic_auth_credentials_supplied_by_client(self):
+        payload = {"number_plate": "ABC123", "passage_at": "2022-10-10T06:30:00"}
+        response = self._post(payload)
+        assert response.status_code == 403
+
+    def test_decos_timeout(self, mocker):
+        mocker.patch(
+            "zwaarverkeer.views.AsyncDecosZwaarverkeer._aget_response",
+            side_effect=httpx.ReadTimeout("timeout"),
+        )
+        payload = {"number_plate": "ABC123", "passage_at": "2022-10-10T06:30:00"}
+        with pytest.raises(HTTPExceptions.GATEWAY_TIMEOUT):
+            self._post(payload, **self.auth_headers)